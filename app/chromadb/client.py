@@ -1,3 +1,6 @@
+import hashlib
+from functools import lru_cache
+
 import chromadb
 from chromadb.utils.embedding_functions import SentenceTransformerEmbeddingFunction
 
@@ -11,20 +14,31 @@ def get_chroma_client(
     return chromadb.PersistentClient(path=path)
 
 
+EMBEDDING_MODEL_NAME = "all-MiniLM-L6-v2"
+
+
+@lru_cache(maxsize=1)
+def get_embedding_function() -> SentenceTransformerEmbeddingFunction:
+    """Return the shared embedding function used to index and query headers."""
+    return SentenceTransformerEmbeddingFunction(model_name=EMBEDDING_MODEL_NAME)
+
+
 def get_header_collection(name: str = "headers"):
     client = get_chroma_client()
-    embedding_function = SentenceTransformerEmbeddingFunction(
-        model_name="all-MiniLM-L6-v2"
-    )
     return client.get_or_create_collection(
-        name=name, embedding_function=embedding_function
+        name=name, embedding_function=get_embedding_function()
     )
 
 
+def header_id(header: str) -> str:
+    """Return the content-addressed ID of a header, stable across datasets and runs."""
+    return "h_" + hashlib.sha1(header.encode("utf-8")).hexdigest()
+
+
 def upsert_headers(collection, headers: list[str], batch_size: int = 5000):
     for i in range(0, len(headers), batch_size):
         chunk = headers[i : i + batch_size]
-        ids = [f"header_{i + j}" for j in range(len(chunk))]
+        ids = [header_id(header) for header in chunk]
         collection.upsert(documents=chunk, ids=ids)
         print(f"Inserted batch {(i // batch_size) + 1} with {len(chunk)} headers.")
 
@@ -0,0 +1,172 @@
+import json
+import logging
+import os
+import re
+from typing import Callable, Iterable, Set
+
+from app.chromadb.client import get_header_collection, header_id
+
+logger = logging.getLogger(__name__)
+
+# IDs written by the positional scheme used before content-addressed IDs
+_POSITIONAL_ID = re.compile(r"header_\d+")
+
+
+class HeaderManifest:
+    """
+    Append-only record of the headers that are stored in the header collection.
+
+    The manifest is a JSON lines file. Its first line records the embedding model, and
+    every following line holds the ID of one ingested header. Lines are appended and
+    synced to disk after each batch is stored, so a crashed ingestion resumes after the
+    last stored batch. A partially written last line is cut off when the manifest is
+    loaded, so the next batch starts on a line of its own.
+
+    Args:
+        path (str): Location of the manifest file.
+        model_name (str): Name of the embedding model the headers are embedded with.
+    """
+
+    def __init__(self, path: str, model_name: str):
+        self.path = path
+        self.model_name = model_name
+        self._ids: Set[str] = set()
+        # Whether the manifest did not exist before
+        self.is_new = not os.path.exists(path)
+        self._load()
+
+    def __contains__(self, id_: str) -> bool:
+        return id_ in self._ids
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def add(self, ids: Iterable[str]) -> None:
+        """Record the IDs of a stored batch and sync them to disk."""
+        ids = [id_ for id_ in ids if id_ not in self._ids]
+        with open(self.path, "a", encoding="utf-8") as f:
+            if f.tell() == 0:
+                f.write(json.dumps({"embedding_model": self.model_name}) + "\n")
+            for id_ in ids:
+                f.write(json.dumps({"id": id_}) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        self._ids.update(ids)
+
+    def _load(self) -> None:
+        if self.is_new:
+            return
+        with open(self.path, "rb+") as f:
+            lines = f.read().split(b"\n")
+            # The text after the last newline is empty, unless a crash tore the last line
+            tail = lines.pop()
+            if tail:
+                try:
+                    json.loads(tail)
+                    f.write(b"\n")
+                    lines.append(tail)
+                except ValueError:
+                    logger.warning(f"Cutting off the torn last line of {self.path}")
+                    f.truncate(f.tell() - len(tail))
+        for i, line in enumerate(lines):
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                logger.warning(f"Ignoring unreadable line {i + 1} of {self.path}")
+                continue
+            if "embedding_model" in entry:
+                if entry["embedding_model"] != self.model_name:
+                    raise ValueError(
+                        f"{self.path} was built with {entry['embedding_model']!r}, "
+                        f"not {self.model_name!r}; delete it and the collection "
+                        f"to re-embed every header"
+                    )
+            else:
+                self._ids.add(entry["id"])
+
+
+def ingest_headers(
+    headers: Iterable[str],
+    manifest: HeaderManifest,
+    get_collection: Callable = get_header_collection,
+    batch_size: int = 512,
+) -> dict:
+    """
+    Stores the headers that are not in the manifest yet in the header collection.
+
+    Headers are consumed as a stream and deduplicated by their content-addressed ID, so
+    only headers that were never ingested are embedded, in batches of `batch_size`. The
+    collection, and with it the embedding model, is only loaded once there is something
+    to ingest, so re-ingesting an unchanged dataset only reads and hashes it.
+
+    With a new manifest, headers stored under the positional IDs of collections built
+    before content-addressed IDs are deleted first, so no header is stored twice.
+
+    Args:
+        headers (Iterable[str]): Headers to ingest; duplicates are allowed.
+        manifest (HeaderManifest): Record of the already ingested headers.
+        get_collection (Callable): Function returning the ChromaDB header collection.
+        batch_size (int): Number of headers embedded and stored at once.
+
+    Returns:
+        dict: Number of unique headers seen and of newly ingested headers.
+    """
+    seen: Set[str] = set()
+    ids, documents = [], []
+    ingested = 0
+    collection = None
+
+    def flush() -> None:
+        nonlocal ingested, collection
+        if collection is None:
+            collection = get_collection()
+            if manifest.is_new:
+                deleted = delete_positional_headers(collection)
+                if deleted:
+                    logger.info(
+                        f"Deleted {deleted} headers stored under positional IDs."
+                    )
+        collection.upsert(ids=ids, documents=documents)
+        manifest.add(ids)
+        ingested += len(ids)
+        logger.info(f"Ingested {ingested} new headers.")
+        ids.clear()
+        documents.clear()
+
+    for header in headers:
+        id_ = header_id(header)
+        if id_ in seen:
+            continue
+        seen.add(id_)
+        if id_ in manifest:
+            continue
+        ids.append(id_)
+        documents.append(header)
+        if len(ids) >= batch_size:
+            flush()
+    if ids:
+        flush()
+    return {"seen": len(seen), "ingested": ingested}
+
+
+def delete_positional_headers(collection, page_size: int = 5000) -> int:
+    """
+    Deletes headers stored under the old positional IDs (`header_<i>`).
+
+    The IDs are read in pages of `page_size`, and deleted once all pages are read, so
+    the deletions do not shift the pages.
+
+    Returns:
+        int: Number of deleted headers.
+    """
+    ids = []
+    offset = 0
+    while True:
+        page = collection.get(include=[], limit=page_size, offset=offset)["ids"]
+        ids += [id_ for id_ in page if _POSITIONAL_ID.fullmatch(id_)]
+        if len(page) < page_size:
+            break
+        offset += page_size
+    for i in range(0, len(ids), page_size):
+        collection.delete(ids=ids[i : i + page_size])
+    return len(ids)
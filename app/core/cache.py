@@ -0,0 +1,245 @@
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional
+
+from app.core.dependencies import get_redis_client
+
+logger = logging.getLogger(__name__)
+
+
+class LRUCache:
+    """
+    Thread-safe in-process LRU cache with an optional time-to-live per entry.
+
+    Args:
+        max_entries (int): Maximum number of entries kept; the least recently used
+            entry is evicted first.
+        ttl_seconds (Optional[float]): Time after which an entry expires. None disables expiry.
+    """
+
+    def __init__(self, max_entries: int = 1024, ttl_seconds: Optional[float] = None):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[str, tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Any]:
+        """Return the cached value for `key`, or None if it is missing or expired."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, value = entry
+                if expires_at >= time.monotonic():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def set(self, key: str, value: Any) -> None:
+        """Store `value` under `key`, evicting the least recently used entries if needed."""
+        expires_at = (
+            time.monotonic() + self.ttl_seconds if self.ttl_seconds else float("inf")
+        )
+        with self._lock:
+            self._entries[key] = (expires_at, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get_many(self, keys: List[str]) -> List[Optional[Any]]:
+        """Return the cached value, or None, for every key."""
+        return [self.get(key) for key in keys]
+
+    def set_many(self, items: Dict[str, Any]) -> None:
+        """Store several values."""
+        for key, value in items.items():
+            self.set(key, value)
+
+    def clear(self) -> None:
+        """Drop every entry."""
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> dict:
+        """Return hit/miss counters and the number of cached entries."""
+        return {"entries": len(self), "hits": self.hits, "misses": self.misses}
+
+
+class RedisCache:
+    """
+    JSON cache stored in Redis under a key prefix, with a time-to-live per entry.
+
+    Redis errors never propagate: they are logged, counted and treated as cache misses.
+    After an error the tier is skipped for `retry_after_seconds` so that an unavailable
+    Redis does not add a connection timeout to every request.
+
+    Args:
+        prefix (str): Prefix of every key written by this cache.
+        ttl_seconds (Optional[int]): Time-to-live of the entries. None keeps them forever.
+        client_factory (Callable): Function returning a Redis client.
+        retry_after_seconds (float): How long to skip Redis after an error.
+    """
+
+    def __init__(
+        self,
+        prefix: str,
+        ttl_seconds: Optional[int] = None,
+        client_factory: Callable = get_redis_client,
+        retry_after_seconds: float = 30.0,
+    ):
+        self.prefix = prefix
+        self.ttl_seconds = ttl_seconds
+        self.client_factory = client_factory
+        self.retry_after_seconds = retry_after_seconds
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+        self._client = None
+        self._disabled_until = 0.0
+
+    def get(self, key: str) -> Optional[Any]:
+        """Return the cached value for `key`, or None if it is missing or Redis failed."""
+        if not self._available():
+            return None
+        try:
+            raw = self._get_client().get(self.prefix + key)
+        except Exception as e:
+            self._on_error(e)
+            return None
+        if raw is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return json.loads(raw)
+
+    def set(self, key: str, value: Any) -> None:
+        """Store a JSON-serializable `value` under `key`."""
+        if not self._available():
+            return
+        try:
+            self._get_client().set(
+                self.prefix + key, json.dumps(value), ex=self.ttl_seconds
+            )
+        except Exception as e:
+            self._on_error(e)
+
+    def get_many(self, keys: List[str]) -> List[Optional[Any]]:
+        """Return the cached value, or None, for every key with a single round trip."""
+        if not keys or not self._available():
+            return [None] * len(keys)
+        try:
+            raws = self._get_client().mget([self.prefix + key for key in keys])
+        except Exception as e:
+            self._on_error(e)
+            return [None] * len(keys)
+        values = []
+        for raw in raws:
+            if raw is None:
+                self.misses += 1
+                values.append(None)
+            else:
+                self.hits += 1
+                values.append(json.loads(raw))
+        return values
+
+    def set_many(self, items: Dict[str, Any]) -> None:
+        """Store several JSON-serializable values with a single round trip."""
+        if not items or not self._available():
+            return
+        try:
+            pipe = self._get_client().pipeline(transaction=False)
+            for key, value in items.items():
+                pipe.set(self.prefix + key, json.dumps(value), ex=self.ttl_seconds)
+            pipe.execute()
+        except Exception as e:
+            self._on_error(e)
+
+    def stats(self) -> dict:
+        """Return hit/miss/error counters."""
+        return {"hits": self.hits, "misses": self.misses, "errors": self.errors}
+
+    def _available(self) -> bool:
+        return time.monotonic() >= self._disabled_until
+
+    def _get_client(self):
+        if self._client is None:
+            self._client = self.client_factory()
+        return self._client
+
+    def _on_error(self, error: Exception) -> None:
+        self.errors += 1
+        self._disabled_until = time.monotonic() + self.retry_after_seconds
+        logger.warning(
+            f"Redis cache {self.prefix!r} unavailable, skipping it for "
+            f"{self.retry_after_seconds}s: {error}"
+        )
+
+
+class TieredCache:
+    """
+    In-process LRU in front of an optional Redis tier.
+
+    Values found in Redis are copied into the LRU so that later lookups stay in-process.
+
+    Args:
+        memory (LRUCache): The in-process tier.
+        redis (Optional[RedisCache]): The shared tier, or None to use the LRU only.
+    """
+
+    def __init__(self, memory: LRUCache, redis: Optional[RedisCache] = None):
+        self.memory = memory
+        self.redis = redis
+
+    def get(self, key: str) -> Optional[Any]:
+        """Return the cached value for `key` from the first tier that has it."""
+        value = self.memory.get(key)
+        if value is None and self.redis is not None:
+            value = self.redis.get(key)
+            if value is not None:
+                self.memory.set(key, value)
+        return value
+
+    def set(self, key: str, value: Any) -> None:
+        """Store `value` in every tier."""
+        self.memory.set(key, value)
+        if self.redis is not None:
+            self.redis.set(key, value)
+
+    def get_many(self, keys: List[str]) -> List[Optional[Any]]:
+        """Return the cached value, or None, for every key; Redis is asked for misses only."""
+        values = self.memory.get_many(keys)
+        missing = [i for i, value in enumerate(values) if value is None]
+        if missing and self.redis is not None:
+            found = self.redis.get_many([keys[i] for i in missing])
+            for i, value in zip(missing, found):
+                if value is not None:
+                    values[i] = value
+                    self.memory.set(keys[i], value)
+        return values
+
+    def set_many(self, items: Dict[str, Any]) -> None:
+        """Store several values in every tier."""
+        self.memory.set_many(items)
+        if self.redis is not None:
+            self.redis.set_many(items)
+
+    def clear(self) -> None:
+        """Clear the in-process tier. Redis entries expire through their TTL."""
+        self.memory.clear()
+
+    def stats(self) -> dict:
+        """Return the metrics of every tier."""
+        stats = {"memory": self.memory.stats()}
+        if self.redis is not None:
+            stats["redis"] = self.redis.stats()
+        return stats
@@ -7,11 +7,215 @@ class Settings:
     REDIS_HOST: str = os.getenv("REDIS_HOST", "localhost")
     REDIS_PORT: int = int(os.getenv("REDIS_PORT", 6379))
     REDIS_DB: int = int(os.getenv("REDIS_DB", 0))
+    # Connections of the async client shared by the API's async endpoints
+    REDIS_MAX_CONNECTIONS: int = int(os.getenv("REDIS_MAX_CONNECTIONS", 64))
+    FEEDBACK_QUEUE: str = os.getenv("FEEDBACK_QUEUE", "feedback_queue")
+    # Group feedback events into pipelined RPUSH batches, flushed once they hold
+    # FEEDBACK_MAX_BATCH_SIZE events or FEEDBACK_FLUSH_INTERVAL_MS after the first one
+    FEEDBACK_BUFFERED: bool = os.getenv("FEEDBACK_BUFFERED", "false").lower() == "true"
+    FEEDBACK_MAX_BATCH_SIZE: int = int(os.getenv("FEEDBACK_MAX_BATCH_SIZE", 500))
+    FEEDBACK_FLUSH_INTERVAL_MS: float = float(
+        os.getenv("FEEDBACK_FLUSH_INTERVAL_MS", 20)
+    )
+    # Feedback drain worker (python -m app.services.feedback_drain): database of the
+    # feedback table, a PostgreSQL URL or sqlite:///<path>, and events per transaction
+    FEEDBACK_DB_URL: str = os.getenv("FEEDBACK_DB_URL", os.getenv("POSTGRES_URL", ""))
+    FEEDBACK_DRAIN_BATCH_SIZE: int = int(os.getenv("FEEDBACK_DRAIN_BATCH_SIZE", 1000))
+    FEEDBACK_DRAIN_POLL_INTERVAL_SECONDS: float = float(
+        os.getenv("FEEDBACK_DRAIN_POLL_INTERVAL_SECONDS", 1)
+    )
+    FEEDBACK_DRAIN_MAX_BACKOFF_SECONDS: float = float(
+        os.getenv("FEEDBACK_DRAIN_MAX_BACKOFF_SECONDS", 30)
+    )
+    FEEDBACK_DRAIN_REPORT_INTERVAL_SECONDS: float = float(
+        os.getenv("FEEDBACK_DRAIN_REPORT_INTERVAL_SECONDS", 60)
+    )
     LLM_PROVIDER = os.getenv("LLM_PROVIDER", "lm_studio")
     LLM_MODEL = os.getenv("LLM_MODEL", "qwen3-4b")
     LLM_API_URL = os.getenv("LLM_API_URL", "http://192.168.56.1:1234/v1")
+    # Async LLM client of /preprocess_text: requests in flight, pooled connections,
+    # time limit per call, and consecutive failures that open the circuit breaker
+    LLM_MAX_CONCURRENCY: int = int(os.getenv("LLM_MAX_CONCURRENCY", 32))
+    LLM_MAX_CONNECTIONS: int = int(os.getenv("LLM_MAX_CONNECTIONS", 32))
+    LLM_TIMEOUT_SECONDS: float = float(os.getenv("LLM_TIMEOUT_SECONDS", 30))
+    LLM_CIRCUIT_FAILURE_THRESHOLD: int = int(
+        os.getenv("LLM_CIRCUIT_FAILURE_THRESHOLD", 5)
+    )
+    LLM_CIRCUIT_RESET_SECONDS: float = float(os.getenv("LLM_CIRCUIT_RESET_SECONDS", 30))
+    # Cache of LLM completions: "local" (per process, DSPy's default) or "redis" (shared
+    # by every worker and kept across restarts)
+    LLM_CACHE_BACKEND: str = os.getenv("LLM_CACHE_BACKEND", "local")
+    LLM_CACHE_TTL_SECONDS: int = int(
+        os.getenv("LLM_CACHE_TTL_SECONDS", 7 * 24 * 60 * 60)
+    )
+    LLM_CACHE_MAX_ENTRIES: int = int(os.getenv("LLM_CACHE_MAX_ENTRIES", 100000))
+    LLM_CACHE_MAX_ENTRY_KB: int = int(os.getenv("LLM_CACHE_MAX_ENTRY_KB", 1024))
+    LLM_CACHE_MEMORY_MAX_ENTRIES: int = int(
+        os.getenv("LLM_CACHE_MEMORY_MAX_ENTRIES", 1024)
+    )
+    LLM_CACHE_COMPRESSION_LEVEL: int = int(os.getenv("LLM_CACHE_COMPRESSION_LEVEL", 6))
     DATA_PATH = os.getenv("DATA_PATH", "data")
     CHROMA_DB_DATA_PATH = os.getenv("CHROMA_DB_PATH", DATA_PATH + "/chroma_headers_db")
+    HEADER_MANIFEST_PATH: str = os.getenv(
+        "HEADER_MANIFEST_PATH", DATA_PATH + "/header_manifest.jsonl"
+    )
+    # "chroma", "numpy" for the memory-mapped index built by scripts/vectorize_headers.py,
+    # or "tables" for the table-aware index built by scripts/build_schema_index.py
+    HEADER_INDEX_BACKEND: str = os.getenv("HEADER_INDEX_BACKEND", "chroma")
+    HEADER_INDEX_PATH: str = os.getenv("HEADER_INDEX_PATH", DATA_PATH + "/header_index")
+    HEADERS_PATH: str = os.getenv("HEADERS_PATH", DATA_PATH + "/unique_headers.txt")
+    # "vector", "lexical" (BM25 over words and trigrams) or "hybrid" (fused, with a
+    # lexical fast path that skips the embedding for questions naming their columns)
+    HEADER_RETRIEVAL_MODE: str = os.getenv("HEADER_RETRIEVAL_MODE", "vector")
+    LEXICAL_CONFIDENT_MATCHES: int = int(os.getenv("LEXICAL_CONFIDENT_MATCHES", 2))
+    HYBRID_CANDIDATES: int = int(os.getenv("HYBRID_CANDIDATES", 50))
+    SCHEMA_INDEX_PATH: str = os.getenv("SCHEMA_INDEX_PATH", DATA_PATH + "/schema_index")
+    SCHEMA_CANDIDATE_TABLES: int = int(os.getenv("SCHEMA_CANDIDATE_TABLES", 5))
+    SCHEMA_TOKEN_BUDGET: int = int(os.getenv("SCHEMA_TOKEN_BUDGET", 256))
+    TEXT2SQL_MAX_BATCH_SIZE: int = int(os.getenv("TEXT2SQL_MAX_BATCH_SIZE", 8))
+    TEXT2SQL_MAX_WAIT_MS: float = float(os.getenv("TEXT2SQL_MAX_WAIT_MS", 10))
+    TEXT2SQL_PREFIX_CACHE: bool = (
+        os.getenv("TEXT2SQL_PREFIX_CACHE", "true").lower() == "true"
+    )
+    TEXT2SQL_PREFIX_CACHE_MAX_ENTRIES: int = int(
+        os.getenv("TEXT2SQL_PREFIX_CACHE_MAX_ENTRIES", 16)
+    )
+    # One of "off", "draft" (small draft model) or "prompt_lookup" (n-gram lookup)
+    TEXT2SQL_ASSISTED_DECODING: str = os.getenv("TEXT2SQL_ASSISTED_DECODING", "off")
+    TEXT2SQL_DRAFT_MODEL_PATH: str = os.getenv(
+        "TEXT2SQL_DRAFT_MODEL_PATH", "Qwen/Qwen2.5-0.5B-Instruct"
+    )
+    TEXT2SQL_PROMPT_LOOKUP_NUM_TOKENS: int = int(
+        os.getenv("TEXT2SQL_PROMPT_LOOKUP_NUM_TOKENS", 10)
+    )
+    TEXT2SQL_CACHE_ENABLED: bool = (
+        os.getenv("TEXT2SQL_CACHE_ENABLED", "true").lower() == "true"
+    )
+    TEXT2SQL_CACHE_MAX_ENTRIES: int = int(os.getenv("TEXT2SQL_CACHE_MAX_ENTRIES", 1024))
+    TEXT2SQL_CACHE_TTL_SECONDS: int = int(
+        os.getenv("TEXT2SQL_CACHE_TTL_SECONDS", 24 * 60 * 60)
+    )
+    TEXT2SQL_CACHE_USE_REDIS: bool = (
+        os.getenv("TEXT2SQL_CACHE_USE_REDIS", "false").lower() == "true"
+    )
+    TEXT2SQL_SEMANTIC_CACHE_ENABLED: bool = (
+        os.getenv("TEXT2SQL_SEMANTIC_CACHE_ENABLED", "true").lower() == "true"
+    )
+    TEXT2SQL_SEMANTIC_CACHE_THRESHOLD: float = float(
+        os.getenv("TEXT2SQL_SEMANTIC_CACHE_THRESHOLD", 0.95)
+    )
+    TEXT2SQL_MAX_WORKERS: int = int(os.getenv("TEXT2SQL_MAX_WORKERS", 16))
+    TEXT2SQL_MAX_QUEUE_DEPTH: int = int(os.getenv("TEXT2SQL_MAX_QUEUE_DEPTH", 64))
+    # Inference backends: auto (saved dtype), fp32, bf16, int8 (dynamic quantization on
+    # CPU) or onnx (ONNX Runtime, exported with scripts/export_models.py)
+    AI_DETECTOR_BACKEND: str = os.getenv("AI_DETECTOR_BACKEND", "auto")
+    AI_DETECTOR_ONNX_PATH: str = os.getenv(
+        "AI_DETECTOR_ONNX_PATH", "models/ai_detector_onnx"
+    )
+    TEXT2SQL_BACKEND: str = os.getenv("TEXT2SQL_BACKEND", "auto")
+    # Hugging Face model IDs or local paths of the served models
+    MODEL_TEXT2SQL_PATH: str = os.getenv(
+        "MODEL_TEXT2SQL_PATH", "nerzid/qwen2.5-3B-4bit-text2sql"
+    )
+    MODEL_SQL2TEXT_AI_DETECTOR_PATH: str = os.getenv(
+        "MODEL_SQL2TEXT_AI_DETECTOR_PATH",
+        "nerzid/roberta-base-openai-detector-text2sql-approach-2",
+    )
+    TEXT2SQL_ONNX_PATH: str = os.getenv("TEXT2SQL_ONNX_PATH", "models/text2sql_onnx")
+    # Padded tokens per forward pass of the AI detector, e.g. 16 chunks of 512 tokens
+    AI_DETECTOR_MAX_BATCH_TOKENS: int = int(
+        os.getenv("AI_DETECTOR_MAX_BATCH_TOKENS", 8192)
+    )
+    # Tokens shared by consecutive chunks of a long text
+    AI_DETECTOR_CHUNK_STRIDE: int = int(os.getenv("AI_DETECTOR_CHUNK_STRIDE", 0))
+    # Stop classifying the chunks of a long text once the remaining chunks can not flip
+    # its vote, or once the vote reaches the margin (0 disables the margin)
+    AI_DETECTOR_EARLY_EXIT: bool = (
+        os.getenv("AI_DETECTOR_EARLY_EXIT", "true").lower() == "true"
+    )
+    AI_DETECTOR_EARLY_EXIT_MIN_CHUNKS: int = int(
+        os.getenv("AI_DETECTOR_EARLY_EXIT_MIN_CHUNKS", 4)
+    )
+    AI_DETECTOR_EARLY_EXIT_MARGIN: float = float(
+        os.getenv("AI_DETECTOR_EARLY_EXIT_MARGIN", 0)
+    )
+    # Texts with more chunks are sampled across the whole text instead of front to back
+    AI_DETECTOR_EARLY_EXIT_SPREAD_ABOVE: int = int(
+        os.getenv("AI_DETECTOR_EARLY_EXIT_SPREAD_ABOVE", 16)
+    )
+    # Content-hash cache of detection results per document and per chunk
+    AI_DETECTOR_CACHE_ENABLED: bool = (
+        os.getenv("AI_DETECTOR_CACHE_ENABLED", "true").lower() == "true"
+    )
+    AI_DETECTOR_CACHE_MAX_ENTRIES: int = int(
+        os.getenv("AI_DETECTOR_CACHE_MAX_ENTRIES", 4096)
+    )
+    AI_DETECTOR_CHUNK_CACHE_MAX_ENTRIES: int = int(
+        os.getenv("AI_DETECTOR_CHUNK_CACHE_MAX_ENTRIES", 16384)
+    )
+    AI_DETECTOR_CACHE_TTL_SECONDS: int = int(
+        os.getenv("AI_DETECTOR_CACHE_TTL_SECONDS", 7 * 24 * 60 * 60)
+    )
+    AI_DETECTOR_CACHE_USE_REDIS: bool = (
+        os.getenv("AI_DETECTOR_CACHE_USE_REDIS", "false").lower() == "true"
+    )
+    # Texts of concurrent requests coalesced into one batch (1 disables batching)
+    AI_DETECTOR_MAX_BATCH_SIZE: int = int(os.getenv("AI_DETECTOR_MAX_BATCH_SIZE", 32))
+    AI_DETECTOR_MAX_WAIT_MS: float = float(os.getenv("AI_DETECTOR_MAX_WAIT_MS", 5))
+    AI_DETECTOR_MAX_BATCH_ITEMS: int = int(
+        os.getenv("AI_DETECTOR_MAX_BATCH_ITEMS", 1000)
+    )
+    # Workers only wait on the batcher, so there are enough of them to fill a batch
+    AI_DETECTOR_MAX_WORKERS: int = int(os.getenv("AI_DETECTOR_MAX_WORKERS", 16))
+    AI_DETECTOR_MAX_QUEUE_DEPTH: int = int(os.getenv("AI_DETECTOR_MAX_QUEUE_DEPTH", 32))
+    PREPROCESS_MAX_WORKERS: int = int(os.getenv("PREPROCESS_MAX_WORKERS", 16))
+    PREPROCESS_MAX_QUEUE_DEPTH: int = int(os.getenv("PREPROCESS_MAX_QUEUE_DEPTH", 64))
+    # Disambiguate questions with the LLM before text2sql: "off", "gated" (only questions
+    # the gate finds ambiguous) or "always". With "always" and a lexical index
+    # (HEADER_RETRIEVAL_MODE lexical or hybrid), the LLM call runs next to retrieval.
+    TEXT2SQL_PREPROCESS: str = os.getenv("TEXT2SQL_PREPROCESS", "off")
+    # Threads of the text2sql pipeline stages that overlap (model loading and
+    # re-retrieval), and the deadlines of the stages (0 waits indefinitely)
+    TEXT2SQL_PIPELINE_WORKERS: int = int(os.getenv("TEXT2SQL_PIPELINE_WORKERS", 16))
+    TEXT2SQL_LOAD_DEADLINE_SECONDS: float = float(
+        os.getenv("TEXT2SQL_LOAD_DEADLINE_SECONDS", 300)
+    )
+    TEXT2SQL_DISAMBIGUATE_DEADLINE_SECONDS: float = float(
+        os.getenv("TEXT2SQL_DISAMBIGUATE_DEADLINE_SECONDS", 10)
+    )
+    TEXT2SQL_RERETRIEVE_DEADLINE_SECONDS: float = float(
+        os.getenv("TEXT2SQL_RERETRIEVE_DEADLINE_SECONDS", 2)
+    )
+    # Rewritten questions sharing this much of their words (Jaccard) with the original
+    # keep its retrieved schema
+    TEXT2SQL_RETRIEVAL_REUSE_SIMILARITY: float = float(
+        os.getenv("TEXT2SQL_RETRIEVAL_REUSE_SIMILARITY", 0.8)
+    )
+    PREPROCESS_GATE_MIN_HEADER_MATCHES: int = int(
+        os.getenv("PREPROCESS_GATE_MIN_HEADER_MATCHES", 1)
+    )
+    PREPROCESS_GATE_MIN_COVERAGE: float = float(
+        os.getenv("PREPROCESS_GATE_MIN_COVERAGE", 0.25)
+    )
+    PREPROCESS_GATE_MAX_WORDS: int = int(os.getenv("PREPROCESS_GATE_MAX_WORDS", 40))
+    # Optional sequence classifier with an "ambiguous" label, consulted for questions
+    # the heuristics find clear
+    PREPROCESS_GATE_CLASSIFIER_PATH: str = os.getenv(
+        "PREPROCESS_GATE_CLASSIFIER_PATH", ""
+    )
+    PREPROCESS_GATE_CLASSIFIER_THRESHOLD: float = float(
+        os.getenv("PREPROCESS_GATE_CLASSIFIER_THRESHOLD", 0.5)
+    )
+    RETRY_AFTER_SECONDS: int = int(os.getenv("RETRY_AFTER_SECONDS", 1))
+    # Resident size of all loaded models; least recently used models are unloaded
+    # beyond it (0 disables the budget)
+    MODEL_REGISTRY_MAX_MEMORY_MB: int = int(
+        os.getenv("MODEL_REGISTRY_MAX_MEMORY_MB", 0)
+    )
+    # Models unused for this long are unloaded (0 keeps them loaded)
+    MODEL_REGISTRY_IDLE_TTL_SECONDS: float = float(
+        os.getenv("MODEL_REGISTRY_IDLE_TTL_SECONDS", 0)
+    )
 
 
 settings = Settings()
@@ -33,3 +33,6 @@ IS_TOO_VAGUE_MESSAGE = (
 
 # Maximum number of headers to consider when generating SQL query
 MAX_HEADERS = 10
+
+# Maximum number of tokens generated for a SQL query
+MAX_NEW_TOKENS = 100
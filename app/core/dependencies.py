@@ -1,8 +1,35 @@
+import threading
+
 import redis
+import redis.asyncio
 from app.core.config import settings
 
+_pool = None
+_pool_lock = threading.Lock()
+
 
 def get_redis_client():
-    return redis.Redis(
-        host=settings.REDIS_HOST, port=settings.REDIS_PORT, db=settings.REDIS_DB
+    """Return a Redis client on the connection pool shared by the whole process."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = redis.ConnectionPool(
+                host=settings.REDIS_HOST, port=settings.REDIS_PORT, db=settings.REDIS_DB
+            )
+    return redis.Redis(connection_pool=_pool)
+
+
+def create_async_redis_client() -> redis.asyncio.Redis:
+    """
+    Create an async Redis client with its own pool of `settings.REDIS_MAX_CONNECTIONS`.
+
+    The connections are bound to the event loop they are first used on. When all of them
+    are busy, commands wait for a free connection instead of failing.
+    """
+    pool = redis.asyncio.BlockingConnectionPool(
+        host=settings.REDIS_HOST,
+        port=settings.REDIS_PORT,
+        db=settings.REDIS_DB,
+        max_connections=settings.REDIS_MAX_CONNECTIONS,
     )
+    return redis.asyncio.Redis(connection_pool=pool)
@@ -0,0 +1,111 @@
+import asyncio
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable
+
+from app.core.config import settings
+
+
+class ExecutorSaturatedError(Exception):
+    """Raised when a bounded executor has no free worker or queue slot left."""
+
+    def __init__(self, name: str, retry_after: int):
+        super().__init__(f"{name} is saturated, retry after {retry_after}s")
+        self.name = name
+        self.retry_after = retry_after
+
+
+class BoundedExecutor:
+    """
+    Thread pool with a fixed number of workers and a bounded queue of pending jobs.
+
+    Submitting a job when all workers are busy and the queue is full fails immediately
+    with `ExecutorSaturatedError` instead of waiting, so callers can shed load.
+
+    Args:
+        name (str): Name of the executor, used for thread names and error messages.
+        max_workers (int): Number of jobs that run at the same time.
+        max_queue_depth (int): Number of jobs that may wait for a free worker.
+        retry_after (int): Seconds clients should wait before retrying when saturated.
+    """
+
+    def __init__(
+        self, name: str, max_workers: int, max_queue_depth: int, retry_after: int = 1
+    ):
+        self.name = name
+        self.max_workers = max_workers
+        self.max_queue_depth = max_queue_depth
+        self.retry_after = retry_after
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix=name
+        )
+        self._capacity = max_workers + max_queue_depth
+        self._slots = threading.BoundedSemaphore(self._capacity)
+        self._in_flight = 0
+        self._lock = threading.Lock()
+
+    @property
+    def in_flight(self) -> int:
+        """Number of jobs that are running or waiting for a worker."""
+        return self._in_flight
+
+    def submit(self, fn: Callable, *args, **kwargs) -> Future:
+        """
+        Submit a job if there is room for it.
+
+        Raises:
+            ExecutorSaturatedError: If all workers are busy and the queue is full.
+        """
+        if not self._slots.acquire(blocking=False):
+            raise ExecutorSaturatedError(self.name, self.retry_after)
+        with self._lock:
+            self._in_flight += 1
+        try:
+            future = self._executor.submit(fn, *args, **kwargs)
+        except Exception:
+            self._release()
+            raise
+        future.add_done_callback(lambda _: self._release())
+        return future
+
+    async def run(self, fn: Callable, *args, **kwargs) -> Any:
+        """Run a blocking job on the executor and await its result."""
+        return await asyncio.wrap_future(self.submit(fn, *args, **kwargs))
+
+    def stats(self) -> dict:
+        """Return the executor's limits and current load."""
+        return {
+            "max_workers": self.max_workers,
+            "max_queue_depth": self.max_queue_depth,
+            "in_flight": self._in_flight,
+        }
+
+    def shutdown(self, wait: bool = True) -> None:
+        """Stop accepting jobs and release the worker threads."""
+        self._executor.shutdown(wait=wait)
+
+    def _release(self) -> None:
+        with self._lock:
+            self._in_flight -= 1
+        self._slots.release()
+
+
+# One executor per model-backed service, so a saturated model cannot starve the others
+text2sql_executor = BoundedExecutor(
+    "text2sql",
+    max_workers=settings.TEXT2SQL_MAX_WORKERS,
+    max_queue_depth=settings.TEXT2SQL_MAX_QUEUE_DEPTH,
+    retry_after=settings.RETRY_AFTER_SECONDS,
+)
+ai_detector_executor = BoundedExecutor(
+    "ai-detector",
+    max_workers=settings.AI_DETECTOR_MAX_WORKERS,
+    max_queue_depth=settings.AI_DETECTOR_MAX_QUEUE_DEPTH,
+    retry_after=settings.RETRY_AFTER_SECONDS,
+)
+preprocess_executor = BoundedExecutor(
+    "preprocess",
+    max_workers=settings.PREPROCESS_MAX_WORKERS,
+    max_queue_depth=settings.PREPROCESS_MAX_QUEUE_DEPTH,
+    retry_after=settings.RETRY_AFTER_SECONDS,
+)
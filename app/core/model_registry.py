@@ -0,0 +1,334 @@
+import gc
+import logging
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, Optional
+
+import torch
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+def resident_bytes(obj: Any) -> int:
+    """
+    Estimate the memory held by the tensors of a loaded model.
+
+    Parameters and buffers of every `torch.nn.Module` reachable through dicts, lists,
+    tuples or a `model` attribute (as on pipelines) are counted once, even if several
+    objects share them. Objects that are not PyTorch modules, like ONNX Runtime models,
+    can report their size in a `model_bytes` attribute.
+
+    Args:
+        obj: A model, a pipeline, or a container of them.
+
+    Returns:
+        int: The size of the tensors in bytes.
+    """
+    seen = set()
+
+    def count(tensors) -> int:
+        total = 0
+        for tensor in tensors:
+            if isinstance(tensor, (list, tuple)):
+                total += count(tensor)
+            elif isinstance(tensor, torch.Tensor) and id(tensor) not in seen:
+                seen.add(id(tensor))
+                total += tensor.numel() * tensor.element_size()
+        return total
+
+    def visit(value: Any) -> int:
+        if id(value) in seen:
+            return 0
+        seen.add(id(value))
+        if isinstance(value, torch.nn.Module):
+            # Dynamically quantized layers keep their packed int8 weights in the state
+            # dict instead of parameters
+            return (
+                count(value.parameters())
+                + count(value.buffers())
+                + count(value.state_dict(keep_vars=True).values())
+            )
+        if isinstance(value, dict):
+            return sum(visit(v) for v in value.values())
+        if isinstance(value, (list, tuple)):
+            return sum(visit(v) for v in value)
+        if hasattr(value, "model_bytes"):
+            return value.model_bytes
+        model = getattr(value, "model", None)
+        return visit(model) if model is not None else 0
+
+    return visit(obj)
+
+
+class _Entry:
+    def __init__(self, loader: Callable[[], Any], on_unload: Optional[Callable]):
+        self.loader = loader
+        self.on_unload = on_unload
+        self.value = None
+        self.loaded = False
+        self.load_lock = threading.Lock()
+        self.pins = 0
+        self.loads = 0
+        self.evictions = 0
+        self.load_seconds: Optional[float] = None
+        self.size_bytes = 0
+        self.last_used = 0.0
+
+
+class ModelRegistry:
+    """
+    Loads every registered model once and keeps the loaded models within a memory budget.
+
+    Models are registered under a name with a loader. The first `get` of a name runs the
+    loader while holding a lock of that name, so concurrent first requests wait for a
+    single load instead of loading the model several times. Loaded models are kept in
+    least recently used order. When a load pushes the resident size over the budget,
+    the least recently used models are unloaded until it fits again, and a background
+    sweep unloads models that have not been used for longer than the idle TTL.
+
+    Models pinned with `use` are never unloaded, so a model is not dropped while a
+    request is running on it.
+
+    Args:
+        max_memory_bytes (Optional[int]): Budget for the resident size of all loaded
+            models. None disables the budget.
+        idle_ttl_seconds (Optional[float]): Time after which an unused model is unloaded.
+            None keeps models loaded until the budget requires otherwise.
+    """
+
+    def __init__(
+        self,
+        max_memory_bytes: Optional[int] = None,
+        idle_ttl_seconds: Optional[float] = None,
+    ):
+        self.max_memory_bytes = max_memory_bytes
+        self.idle_ttl_seconds = idle_ttl_seconds
+        self._entries: Dict[str, _Entry] = {}
+        # Loaded models, least recently used first
+        self._lru: "OrderedDict[str, None]" = OrderedDict()
+        self._lock = threading.RLock()
+        self._sweeper: Optional[threading.Thread] = None
+
+    def register(
+        self,
+        name: str,
+        loader: Callable[[], Any],
+        on_unload: Optional[Callable[[], None]] = None,
+    ) -> None:
+        """
+        Register a model under a name.
+
+        Args:
+            name (str): Name of the model.
+            loader (Callable[[], Any]): Function that loads and returns the model.
+            on_unload (Optional[Callable[[], None]]): Called when the model is unloaded,
+                to drop references the caller keeps to it. It runs under the registry
+                lock, so it must be quick and must not call the registry.
+        """
+        with self._lock:
+            if name in self._entries:
+                raise ValueError(f"Model {name!r} is already registered")
+            self._entries[name] = _Entry(loader, on_unload)
+
+    def get(self, name: str) -> Any:
+        """
+        Return the loaded model, loading it first if needed.
+
+        Raises:
+            KeyError: If no model is registered under `name`.
+        """
+        entry = self._entry(name)
+        with self._lock:
+            if entry.loaded:
+                self._touch(name, entry)
+                return entry.value
+
+        with entry.load_lock:
+            # Another thread may have finished loading while this one waited
+            with self._lock:
+                if entry.loaded:
+                    self._touch(name, entry)
+                    return entry.value
+
+            start = time.perf_counter()
+            value = entry.loader()
+            load_seconds = time.perf_counter() - start
+            size_bytes = resident_bytes(value)
+
+            with self._lock:
+                entry.value = value
+                entry.loaded = True
+                entry.loads += 1
+                entry.load_seconds = load_seconds
+                entry.size_bytes = size_bytes
+                self._touch(name, entry)
+                evicted = self._evict_over_budget(keep=name)
+        logger.info(
+            f"Loaded model {name!r} in {load_seconds:.2f}s "
+            f"({size_bytes / 2**20:.1f} MiB resident)"
+        )
+        self._finish_unload(evicted)
+        self._start_sweeper()
+        return value
+
+    @contextmanager
+    def use(self, name: str) -> Iterator[None]:
+        """
+        Pin a model so that it is not unloaded while the block runs.
+
+        Pinning does not load the model; it also protects a model loaded inside the block.
+        """
+        entry = self._entry(name)
+        with self._lock:
+            entry.pins += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                entry.pins -= 1
+                entry.last_used = time.monotonic()
+
+    def unload(self, name: str) -> bool:
+        """
+        Unload a model unless it is pinned.
+
+        Returns:
+            bool: True if the model was loaded and has been unloaded.
+        """
+        entry = self._entry(name)
+        with self._lock:
+            if not entry.loaded or entry.pins:
+                return False
+            self._drop(name, entry)
+        self._finish_unload([entry])
+        return True
+
+    def evict_idle(self) -> int:
+        """
+        Unload every unpinned model that was not used within the idle TTL.
+
+        Returns:
+            int: Number of unloaded models.
+        """
+        if not self.idle_ttl_seconds:
+            return 0
+        deadline = time.monotonic() - self.idle_ttl_seconds
+        evicted = []
+        with self._lock:
+            for name in list(self._lru):
+                entry = self._entries[name]
+                if not entry.pins and entry.last_used < deadline:
+                    self._drop(name, entry)
+                    evicted.append(entry)
+        self._finish_unload(evicted)
+        return len(evicted)
+
+    def stats(self) -> dict:
+        """Return the resident size, budget and per-model load statistics."""
+        now = time.monotonic()
+        with self._lock:
+            models = {
+                name: {
+                    "loaded": entry.loaded,
+                    "loads": entry.loads,
+                    "evictions": entry.evictions,
+                    "load_seconds": entry.load_seconds,
+                    "resident_mb": (entry.size_bytes / 2**20 if entry.loaded else 0.0),
+                    "idle_seconds": (now - entry.last_used if entry.loaded else None),
+                    "pins": entry.pins,
+                }
+                for name, entry in self._entries.items()
+            }
+            return {
+                "resident_mb": self.resident_bytes / 2**20,
+                "max_memory_mb": (
+                    self.max_memory_bytes / 2**20 if self.max_memory_bytes else None
+                ),
+                "idle_ttl_seconds": self.idle_ttl_seconds,
+                "models": models,
+            }
+
+    @property
+    def resident_bytes(self) -> int:
+        """Resident size of all loaded models in bytes."""
+        return sum(self._entries[name].size_bytes for name in self._lru)
+
+    def _entry(self, name: str) -> _Entry:
+        try:
+            return self._entries[name]
+        except KeyError:
+            raise KeyError(f"No model registered under {name!r}") from None
+
+    def _touch(self, name: str, entry: _Entry) -> None:
+        entry.last_used = time.monotonic()
+        self._lru[name] = None
+        self._lru.move_to_end(name)
+
+    def _evict_over_budget(self, keep: str) -> list:
+        evicted = []
+        if not self.max_memory_bytes:
+            return evicted
+        for name in list(self._lru):
+            if self.resident_bytes <= self.max_memory_bytes:
+                break
+            entry = self._entries[name]
+            if name != keep and not entry.pins:
+                self._drop(name, entry)
+                evicted.append(entry)
+        if self.resident_bytes > self.max_memory_bytes:
+            logger.warning(
+                f"Loaded models use {self.resident_bytes / 2**20:.1f} MiB, over the "
+                f"budget of {self.max_memory_bytes / 2**20:.1f} MiB, but the remaining "
+                "models are in use"
+            )
+        return evicted
+
+    def _drop(self, name: str, entry: _Entry) -> None:
+        logger.info(f"Unloading model {name!r}")
+        del self._lru[name]
+        entry.value = None
+        entry.loaded = False
+        entry.evictions += 1
+        # Under the lock, so a reload can not be undone by a late callback
+        if entry.on_unload is not None:
+            entry.on_unload()
+
+    def _finish_unload(self, entries: list) -> None:
+        if entries:
+            gc.collect()
+            if torch.cuda.is_available():
+                torch.cuda.empty_cache()
+
+    def _start_sweeper(self) -> None:
+        if not self.idle_ttl_seconds:
+            return
+        with self._lock:
+            if self._sweeper is not None:
+                return
+            self._sweeper = threading.Thread(
+                target=self._sweep, name="model-registry-sweeper", daemon=True
+            )
+            self._sweeper.start()
+
+    def _sweep(self) -> None:
+        interval = min(max(self.idle_ttl_seconds / 4, 1.0), 60.0)
+        while True:
+            time.sleep(interval)
+            try:
+                self.evict_idle()
+            except Exception as e:
+                logger.error(f"Idle model eviction failed: {e}")
+
+
+model_registry = ModelRegistry(
+    max_memory_bytes=(
+        settings.MODEL_REGISTRY_MAX_MEMORY_MB * 2**20
+        if settings.MODEL_REGISTRY_MAX_MEMORY_MB
+        else None
+    ),
+    idle_ttl_seconds=settings.MODEL_REGISTRY_IDLE_TTL_SECONDS or None,
+)
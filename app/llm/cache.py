@@ -0,0 +1,215 @@
+import logging
+import pickle
+import threading
+import time
+import zlib
+from typing import Any, Callable, Dict, List, Optional
+
+from dspy.clients.cache import Cache
+
+from app.core.dependencies import get_redis_client
+
+logger = logging.getLogger(__name__)
+
+
+class RedisLMCache(Cache):
+    """
+    DSPy LM cache shared by every worker and pod through Redis.
+
+    It replaces DSPy's per-process disk cache: completions are looked up in a small
+    in-process LRU first and then in Redis, so a prompt answered by one worker is served
+    to the others, and survives restarts, without calling the LLM again.
+
+    Keys hash the whole LM request, which holds the model, the prompt built from the
+    signature and its inputs, and the generation parameters; they are prefixed with the
+    model so the entries of a model can be found and dropped together. Values are
+    pickled and compressed with zlib. Entries expire after `ttl_seconds`, values larger
+    than `max_entry_bytes` are not shared, and beyond `max_entries` the least recently
+    used entries are deleted, tracked in a sorted set next to the entries.
+
+    Redis errors never propagate: they are logged, counted and treated as cache misses,
+    and Redis is skipped for `retry_after_seconds` afterwards. Entries are pickled, so
+    the Redis instance must only be writable by trusted clients.
+
+    Args:
+        prefix (str): Prefix of every key written by this cache.
+        ttl_seconds (Optional[int]): Time-to-live of the entries. None keeps them forever.
+        max_entries (Optional[int]): Entries kept in Redis. None disables the limit.
+        max_entry_bytes (int): Largest compressed value stored in Redis.
+        memory_max_entries (int): Size of the in-process tier.
+        compression_level (int): zlib compression level, from 0 (none) to 9.
+        client_factory (Callable): Function returning a Redis client.
+        retry_after_seconds (float): How long to skip Redis after an error.
+    """
+
+    def __init__(
+        self,
+        prefix: str = "dspy:lm:",
+        ttl_seconds: Optional[int] = None,
+        max_entries: Optional[int] = None,
+        max_entry_bytes: int = 1024 * 1024,
+        memory_max_entries: int = 1024,
+        compression_level: int = 6,
+        client_factory: Callable = get_redis_client,
+        retry_after_seconds: float = 30.0,
+    ):
+        super().__init__(
+            enable_disk_cache=False,
+            enable_memory_cache=True,
+            disk_cache_dir=None,
+            memory_max_entries=memory_max_entries,
+        )
+        self.prefix = prefix
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.max_entry_bytes = max_entry_bytes
+        self.compression_level = compression_level
+        self.client_factory = client_factory
+        self.retry_after_seconds = retry_after_seconds
+        self.index_key = prefix + "index"
+        self.hits = 0
+        self.misses = 0
+        self.memory_hits = 0
+        self.errors = 0
+        self.evictions = 0
+        self.oversized = 0
+        self._client = None
+        self._disabled_until = 0.0
+        self._counter_lock = threading.Lock()
+
+    def get(
+        self,
+        request: Dict[str, Any],
+        ignored_args_for_cache_key: Optional[List[str]] = None,
+    ) -> Any:
+        """Return the cached response of an LM request, or None."""
+        try:
+            key = self._redis_key(request, ignored_args_for_cache_key)
+        except Exception:
+            logger.debug("Failed to compute the LM cache key of a request")
+            return None
+
+        with self._lock:
+            response = self.memory_cache.get(key)
+        if response is not None:
+            self._count("memory_hits")
+            return self._prepare_cached_response(response)
+
+        response = self._redis_get(key)
+        if response is None:
+            self._count("misses")
+            return None
+        self._count("hits")
+        with self._lock:
+            self.memory_cache[key] = response
+        return self._prepare_cached_response(response)
+
+    def put(
+        self,
+        request: Dict[str, Any],
+        value: Any,
+        ignored_args_for_cache_key: Optional[List[str]] = None,
+        enable_memory_cache: bool = True,
+    ) -> None:
+        """Store the response of an LM request in memory and in Redis."""
+        try:
+            key = self._redis_key(request, ignored_args_for_cache_key)
+        except Exception:
+            logger.debug("Failed to compute the LM cache key of a request")
+            return
+        if enable_memory_cache:
+            with self._lock:
+                self.memory_cache[key] = value
+        self._redis_set(key, value)
+
+    def stats(self) -> dict:
+        """Return hit/miss and eviction counters of both tiers."""
+        return {
+            "memory_entries": len(self.memory_cache),
+            "memory_hits": self.memory_hits,
+            "redis_hits": self.hits,
+            "misses": self.misses,
+            "errors": self.errors,
+            "evictions": self.evictions,
+            "oversized": self.oversized,
+        }
+
+    def _redis_key(
+        self, request: Dict[str, Any], ignored_args_for_cache_key: Optional[List[str]]
+    ) -> str:
+        key = self.cache_key(request, ignored_args_for_cache_key)
+        return f"{self.prefix}{request.get('model', '')}:{key}"
+
+    def _redis_get(self, key: str) -> Any:
+        if not self._available():
+            return None
+        try:
+            pipe = self._get_client().pipeline(transaction=False)
+            pipe.get(key)
+            if self.max_entries:
+                # A hit makes the entry the most recently used one
+                pipe.zadd(self.index_key, {key: time.time()}, xx=True)
+            raw = pipe.execute()[0]
+        except Exception as e:
+            self._on_error(e)
+            return None
+        if raw is None:
+            return None
+        try:
+            return pickle.loads(zlib.decompress(raw))
+        except Exception as e:
+            logger.warning(f"Dropping unreadable LM cache entry {key}: {e!r}")
+            return None
+
+    def _redis_set(self, key: str, value: Any) -> None:
+        if not self._available():
+            return
+        try:
+            raw = zlib.compress(pickle.dumps(value), self.compression_level)
+        except Exception as e:
+            logger.debug(f"Failed to serialize an LM response: {e!r}")
+            return
+        if len(raw) > self.max_entry_bytes:
+            self._count("oversized")
+            return
+        try:
+            client = self._get_client()
+            pipe = client.pipeline(transaction=False)
+            pipe.set(key, raw, ex=self.ttl_seconds)
+            if self.max_entries:
+                pipe.zadd(self.index_key, {key: time.time()})
+                pipe.zcard(self.index_key)
+                size = pipe.execute()[-1]
+                if size > self.max_entries:
+                    self._evict(client, size - self.max_entries)
+            else:
+                pipe.execute()
+        except Exception as e:
+            self._on_error(e)
+
+    def _evict(self, client, count: int) -> None:
+        # Entries that already expired are dropped from the index the same way
+        oldest = [key for key, _ in client.zpopmin(self.index_key, count)]
+        if oldest:
+            client.delete(*oldest)
+            self._count("evictions", len(oldest))
+
+    def _count(self, name: str, n: int = 1) -> None:
+        with self._counter_lock:
+            setattr(self, name, getattr(self, name) + n)
+
+    def _get_client(self):
+        if self._client is None:
+            self._client = self.client_factory()
+        return self._client
+
+    def _available(self) -> bool:
+        return time.monotonic() >= self._disabled_until
+
+    def _on_error(self, error: Exception) -> None:
+        self._count("errors")
+        self._disabled_until = time.monotonic() + self.retry_after_seconds
+        logger.warning(
+            f"Redis LM cache {self.prefix!r} unavailable, skipping it for "
+            f"{self.retry_after_seconds}s: {error}"
+        )
@@ -0,0 +1,267 @@
+import asyncio
+import logging
+import threading
+import time
+from typing import List, Optional
+
+import httpx
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling the LLM server while the circuit breaker is open."""
+
+
+class CircuitBreaker:
+    """
+    Stops calling a failing dependency for a while.
+
+    After `failure_threshold` consecutive failures the circuit opens and every call is
+    rejected for `reset_seconds`. Then one trial call is let through: if it succeeds the
+    circuit closes again, otherwise it stays open for another `reset_seconds`.
+
+    Args:
+        failure_threshold (int): Consecutive failures that open the circuit.
+        reset_seconds (float): How long the circuit stays open before a trial call.
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_seconds: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.failures = 0
+        self.opened = 0
+        self._opened_at: Optional[float] = None
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        """One of "closed", "open" or "half_open"."""
+        if self._opened_at is None:
+            return "closed"
+        if time.monotonic() - self._opened_at < self.reset_seconds:
+            return "open"
+        return "half_open"
+
+    def allow(self) -> bool:
+        """Return True if a call may be made now."""
+        with self._lock:
+            state = self.state
+            if state == "closed":
+                return True
+            if state == "half_open" and not self._trial_running:
+                self._trial_running = True
+                return True
+            return False
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.failures = 0
+            self._opened_at = None
+            self._trial_running = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            closed = self._opened_at is None
+            if self._trial_running or (
+                closed and self.failures >= self.failure_threshold
+            ):
+                self.opened += closed
+                self._opened_at = time.monotonic()
+            self._trial_running = False
+
+    def record_cancelled(self) -> None:
+        """Release the trial of a call that was cancelled, which says nothing of the server."""
+        with self._lock:
+            self._trial_running = False
+
+
+class AsyncLLMClient:
+    """
+    Async client of an OpenAI-compatible chat completions server.
+
+    Requests share a pool of keep-alive connections and at most `max_concurrency` of
+    them are in flight at a time; further calls wait for a free slot. Every call,
+    including the wait for a slot, is bounded by `timeout_seconds`, and a circuit
+    breaker rejects calls right away while the server keeps failing.
+
+    The HTTP pool is bound to the event loop it was created on, so it is created on the
+    first call from a running loop and recreated if the loop changes. The counters are
+    guarded by a lock, since the module-level clients are called from several threads.
+
+    Args:
+        base_url (str): Base URL of the server, e.g. "http://localhost:1234/v1".
+        model (str): Model name sent with every request.
+        api_key (str): API key sent as a bearer token.
+        max_concurrency (int): Requests in flight at a time.
+        max_connections (int): Size of the connection pool.
+        timeout_seconds (float): Time limit of a call.
+        breaker (Optional[CircuitBreaker]): The circuit breaker of the server.
+        transport (Optional[httpx.AsyncBaseTransport]): Custom transport, for tests.
+    """
+
+    def __init__(
+        self,
+        base_url: str,
+        model: str,
+        api_key: str = "1",
+        max_concurrency: int = 32,
+        max_connections: int = 32,
+        timeout_seconds: float = 30.0,
+        breaker: Optional[CircuitBreaker] = None,
+        transport: Optional[httpx.AsyncBaseTransport] = None,
+    ):
+        self.base_url = base_url.rstrip("/")
+        self.model = model
+        self.api_key = api_key
+        self.max_concurrency = max_concurrency
+        self.max_connections = max_connections
+        self.timeout_seconds = timeout_seconds
+        self.breaker = breaker or CircuitBreaker()
+        self.transport = transport
+        self.requests = 0
+        self.failures = 0
+        self.timeouts = 0
+        self.rejected = 0
+        self.in_flight = 0
+        self._counter_lock = threading.Lock()
+        self._client: Optional[httpx.AsyncClient] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    async def complete(self, messages: List[dict], **params) -> str:
+        """
+        Request a chat completion.
+
+        Args:
+            messages (List[dict]): The chat messages.
+            **params: Further request fields, like `max_tokens` or `temperature`.
+
+        Returns:
+            str: The content of the first choice.
+
+        Raises:
+            CircuitOpenError: If the circuit breaker is open.
+            asyncio.TimeoutError: If the call took longer than `timeout_seconds`.
+            httpx.HTTPError: If the request failed.
+        """
+        if not self.breaker.allow():
+            with self._counter_lock:
+                self.rejected += 1
+            raise CircuitOpenError(f"LLM server {self.base_url} is unavailable")
+        with self._counter_lock:
+            self.requests += 1
+        try:
+            content = await asyncio.wait_for(
+                self._post(messages, params), timeout=self.timeout_seconds
+            )
+        except asyncio.TimeoutError:
+            with self._counter_lock:
+                self.timeouts += 1
+                self.failures += 1
+            self.breaker.record_failure()
+            raise
+        except Exception:
+            with self._counter_lock:
+                self.failures += 1
+            self.breaker.record_failure()
+            raise
+        except BaseException:
+            # Cancelled, e.g. when the client disconnected: a trial call must not keep
+            # the circuit half-open, with every later call rejected
+            self.breaker.record_cancelled()
+            raise
+        self.breaker.record_success()
+        return content
+
+    async def aclose(self) -> None:
+        """Close the connection pool, on the event loop it was created on."""
+        client, loop = self._client, self._loop
+        self._client = None
+        self._semaphore = None
+        self._loop = None
+        if client is None:
+            return
+        if loop is not asyncio.get_running_loop() and loop.is_running():
+            # The connections belong to a loop running in another thread
+            future = asyncio.run_coroutine_threadsafe(client.aclose(), loop)
+            await asyncio.wrap_future(future)
+        else:
+            await client.aclose()
+
+    def stats(self) -> dict:
+        """Return request counters, in-flight requests and the circuit breaker state."""
+        with self._counter_lock:
+            counters = {
+                "requests": self.requests,
+                "failures": self.failures,
+                "timeouts": self.timeouts,
+                "rejected": self.rejected,
+                "in_flight": self.in_flight,
+            }
+        return {
+            **counters,
+            "circuit": self.breaker.state,
+            "circuit_opened": self.breaker.opened,
+        }
+
+    async def _post(self, messages: List[dict], params: dict) -> str:
+        client, semaphore = self._pool()
+        async with semaphore:
+            with self._counter_lock:
+                self.in_flight += 1
+            try:
+                response = await client.post(
+                    "/chat/completions",
+                    json={"model": self.model, "messages": messages, **params},
+                )
+            finally:
+                with self._counter_lock:
+                    self.in_flight -= 1
+        response.raise_for_status()
+        return response.json()["choices"][0]["message"]["content"]
+
+    def _pool(self):
+        loop = asyncio.get_running_loop()
+        if self._client is None or self._loop is not loop:
+            # Connections of a previous loop can not be reused, they are dropped with it
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                headers={"Authorization": f"Bearer {self.api_key}"},
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_connections,
+                ),
+                timeout=self.timeout_seconds,
+                transport=self.transport,
+            )
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+            self._loop = loop
+        return self._client, self._semaphore
+
+
+llm_client = AsyncLLMClient(
+    settings.LLM_API_URL,
+    settings.LLM_MODEL,
+    max_concurrency=settings.LLM_MAX_CONCURRENCY,
+    max_connections=settings.LLM_MAX_CONNECTIONS,
+    timeout_seconds=settings.LLM_TIMEOUT_SECONDS,
+    breaker=CircuitBreaker(
+        failure_threshold=settings.LLM_CIRCUIT_FAILURE_THRESHOLD,
+        reset_seconds=settings.LLM_CIRCUIT_RESET_SECONDS,
+    ),
+)
+# The text2sql pipeline calls the LLM from its own event loop, so it gets its own pool;
+# both clients call the same server and share its circuit breaker
+pipeline_llm_client = AsyncLLMClient(
+    settings.LLM_API_URL,
+    settings.LLM_MODEL,
+    max_concurrency=settings.LLM_MAX_CONCURRENCY,
+    max_connections=settings.LLM_MAX_CONNECTIONS,
+    timeout_seconds=settings.LLM_TIMEOUT_SECONDS,
+    breaker=llm_client.breaker,
+)
@@ -1,14 +1,36 @@
 import dspy
 from app.core.config import settings
+from app.llm.cache import RedisLMCache
 
 provider = settings.LLM_PROVIDER
 model = settings.LLM_MODEL
 api_url = settings.LLM_API_URL
+MAX_COMPLETION_TOKENS = 20000
 lm = dspy.LM(
     provider + "/" + model,
     api_base=api_url,
     api_key="1",
-    max_completion_tokens=20000,
+    max_completion_tokens=MAX_COMPLETION_TOKENS,
     cache=True,
 )
 dspy.configure(lm=lm)
+
+if settings.LLM_CACHE_BACKEND == "redis":
+    # Completions are shared by every worker and pod instead of cached per process
+    dspy.cache = RedisLMCache(
+        ttl_seconds=settings.LLM_CACHE_TTL_SECONDS,
+        max_entries=settings.LLM_CACHE_MAX_ENTRIES,
+        max_entry_bytes=settings.LLM_CACHE_MAX_ENTRY_KB * 1024,
+        memory_max_entries=settings.LLM_CACHE_MEMORY_MAX_ENTRIES,
+        compression_level=settings.LLM_CACHE_COMPRESSION_LEVEL,
+    )
+
+
+def get_lm_cache_stats() -> dict:
+    """
+    Returns hit/miss metrics of the LLM completion cache.
+
+    Returns:
+        dict: Metrics of the Redis-backed cache, or an empty dict for the local cache.
+    """
+    return dspy.cache.stats() if isinstance(dspy.cache, RedisLMCache) else {}
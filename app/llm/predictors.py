@@ -1,10 +1,13 @@
+import asyncio
+
 import dspy
 from app.llm.signatures import (
     AITextFromText,
     AITextFromSQL,
     DisambiguateTextForSQL,
 )
-from app.llm.config import lm
+from app.llm.client import AsyncLLMClient, llm_client, pipeline_llm_client
+from app.llm.config import MAX_COMPLETION_TOKENS, lm
 
 # Load LM
 dspy.configure(lm=lm)
@@ -18,3 +21,47 @@ get_AI_text_from_sql = dspy.Predict(
 get_disambiguated_text = dspy.Predict(
     DisambiguateTextForSQL
 )  # disambiguates the text to make it easier to generate an SQL query from it
+
+
+class AsyncPredictor:
+    """
+    Async counterpart of `dspy.Predict` that calls the LLM through the pooled async client.
+
+    Prompts are formatted and completions parsed with DSPy's chat adapter, so the
+    predictions match those of `dspy.Predict` for the same signature. Completions are
+    stored in the DSPy cache, like those of `dspy.Predict`.
+
+    Args:
+        signature: The DSPy signature to predict.
+        client (AsyncLLMClient): The client of the LLM server.
+        **params: Further request fields, like `max_tokens`.
+    """
+
+    def __init__(self, signature, client: AsyncLLMClient = llm_client, **params):
+        self.signature = signature
+        self.client = client
+        self.params = params
+        self.adapter = dspy.ChatAdapter()
+
+    async def __call__(self, **inputs) -> dspy.Prediction:
+        messages = self.adapter.format(self.signature, demos=[], inputs=inputs)
+        request = {
+            "model": self.client.model,
+            "messages": messages,
+            **self.params,
+            "_fn_identifier": "AsyncPredictor",
+        }
+        # The cache may be backed by Redis, whose client blocks
+        completion = await asyncio.to_thread(dspy.cache.get, request)
+        if completion is None:
+            completion = await self.client.complete(messages, **self.params)
+            await asyncio.to_thread(dspy.cache.put, request, completion)
+        return dspy.Prediction(**self.adapter.parse(self.signature, completion))
+
+
+aget_disambiguated_text = AsyncPredictor(
+    DisambiguateTextForSQL, max_tokens=MAX_COMPLETION_TOKENS
+)  # async get_disambiguated_text for the event loop of the API
+pipeline_get_disambiguated_text = AsyncPredictor(
+    DisambiguateTextForSQL, client=pipeline_llm_client, max_tokens=MAX_COMPLETION_TOKENS
+)  # async get_disambiguated_text for the event loop of the text2sql pipeline
@@ -1,21 +1,70 @@
-from fastapi.responses import FileResponse, JSONResponse
+from fastapi.responses import FileResponse, JSONResponse, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi import FastAPI, HTTPException
 import logging
 import json
+from contextlib import asynccontextmanager
 from datetime import datetime
-from app.core.dependencies import get_redis_client
+from app.core.executors import (
+    ExecutorSaturatedError,
+    ai_detector_executor,
+    text2sql_executor,
+)
 from app.schemas.base_models import (
     FeedbackRequest,
     PreprocessTextRequest,
     QueryRequest,
+    TextBatchRequest,
     TextRequest,
 )
-from app.services.ai_detector import is_ai_generated
-from app.services.text_to_sql import preprocess_text, text2sql
+from app.core.config import settings
+from app.core.model_registry import model_registry
+from app.llm.client import llm_client, pipeline_llm_client
+from app.llm.config import get_lm_cache_stats
+from app.services.ai_detector import (
+    detect_ai_generated,
+    detect_ai_generated_many,
+    get_cache_stats as get_ai_detector_cache_stats,
+)
+from app.services.feedback import feedback_writer
+from app.services.pipeline import PipelineTrace
+from app.services.text_to_sql import (
+    get_assisted_decoding_stats,
+    get_cache_stats,
+    get_pipeline_stats,
+    get_preprocess_stats,
+    preprocess_text_async,
+    stream_text2sql,
+    text2sql,
+)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await feedback_writer.start()
+    yield
+    await feedback_writer.aclose()
+    await llm_client.aclose()
+    await pipeline_llm_client.aclose()
+
+
+app = FastAPI(lifespan=lifespan)
 
 
-app = FastAPI()
+@app.exception_handler(ExecutorSaturatedError)
+async def executor_saturated_handler(request, exc: ExecutorSaturatedError):
+    """
+    Reject requests fast when a model-backed service has no capacity left.
+
+    Returns:
+        JSONResponse: A 503 response with a Retry-After header.
+    """
+    logging.warning(f"Rejected request to {request.url.path}: {exc}")
+    return JSONResponse(
+        content={"detail": f"{exc.name} service is busy, please retry later"},
+        status_code=503,
+        headers={"Retry-After": str(exc.retry_after)},
+    )
 
 
 # Mount the /static directory to serve static files
@@ -37,7 +86,8 @@ async def create_ai_gen_detection_service(request: TextRequest):
         request (TextRequest): The request object containing the text to be analyzed.
 
     Returns:
-        dict: A dictionary containing the truncated input text and the AI detection result.
+        dict: A dictionary containing the truncated input text, the AI detection result,
+            the number of chunks of the text and how many of them were classified.
 
     Raises:
         HTTPException: If the input text is empty or if an error occurs during processing.
@@ -52,17 +102,77 @@ async def create_ai_gen_detection_service(request: TextRequest):
             logging.warning("Received empty text input for AI detection.")
             raise HTTPException(status_code=400, detail="Empty text input")
 
-        prediction = is_ai_generated(text)
+        prediction = await ai_detector_executor.run(detect_ai_generated, text)
         logging.info(
-            f"AI detection result: {prediction} for text snippet: '{text[:100]}{'...' if len(text) > 100 else ''}'"
+            f"AI detection result: {prediction['ai_generated']} for text snippet: '{text[:100]}{'...' if len(text) > 100 else ''}'"
         )
 
-        return {"text": text[:100] + "...", "ai_generated": prediction}
+        return {
+            "text": text[:100] + "...",
+            "ai_generated": prediction["ai_generated"],
+            "chunks": prediction["chunks"],
+            "chunks_evaluated": prediction["chunks_evaluated"],
+        }
+    except ExecutorSaturatedError:
+        raise
     except Exception as e:
         logging.error(f"Detection failed: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.post("/is_ai_generated/batch")
+async def create_ai_gen_batch_detection_service(request: TextBatchRequest):
+    """
+    Endpoint to detect which of the given texts are AI-generated.
+
+    The texts share padded batches with each other and with concurrent requests.
+
+    Args:
+        request (TextBatchRequest): The request object containing the texts to be analyzed.
+
+    Returns:
+        dict: Per text, in request order: the truncated text, the AI detection result,
+            the AI share of the chunk vote as `score` and the number of classified chunks.
+
+    Raises:
+        HTTPException: If the batch is empty or too large, a text is empty, or an error
+            occurs during processing.
+    """
+    texts = [text.strip() for text in request.texts]
+    if not texts:
+        raise HTTPException(status_code=400, detail="Empty batch")
+    if len(texts) > settings.AI_DETECTOR_MAX_BATCH_ITEMS:
+        raise HTTPException(
+            status_code=413,
+            detail=f"At most {settings.AI_DETECTOR_MAX_BATCH_ITEMS} texts per batch",
+        )
+    empty = [i for i, text in enumerate(texts) if not text]
+    if empty:
+        raise HTTPException(
+            status_code=400, detail=f"Empty text input at positions {empty}"
+        )
+    logging.info(f"Received {len(texts)} texts for AI detection.")
+
+    try:
+        predictions = await ai_detector_executor.run(detect_ai_generated_many, texts)
+        return {
+            "results": [
+                {
+                    "text": text[:100] + "...",
+                    "ai_generated": prediction["ai_generated"],
+                    "score": prediction["score"],
+                    "chunks_evaluated": prediction["chunks_evaluated"],
+                }
+                for text, prediction in zip(texts, predictions)
+            ]
+        }
+    except ExecutorSaturatedError:
+        raise
+    except Exception as e:
+        logging.error(f"Batch detection failed: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
 @app.post("/text2sql")
 async def text_to_sql(query: QueryRequest):
     """
@@ -72,21 +182,76 @@ async def text_to_sql(query: QueryRequest):
         query (QueryRequest): The request object containing the question to be converted to SQL.
 
     Returns:
-        JSONResponse: A JSON response containing the generated SQL query.
+        JSONResponse: A JSON response containing the generated SQL query, with the
+            timings of the pipeline stages in the `Server-Timing` header.
 
     Raises:
         HTTPException: If an error occurs during the text-to-SQL conversion.
     """
     logging.info(f"Received query for text2sql: {query.question}")
+    trace = PipelineTrace()
     try:
-        result = text2sql(query.question)
+        # Runs on the bounded text2sql executor, where concurrent requests share generation batches
+        result = await text2sql_executor.run(text2sql, query.question, trace=trace)
         logging.info(f"Text2SQL successful. Result: {result}")
-        return JSONResponse(content={"result": result}, status_code=200)
+        return JSONResponse(
+            content={"result": result},
+            status_code=200,
+            headers={"Server-Timing": trace.server_timing()},
+        )
+    except ExecutorSaturatedError:
+        raise
     except Exception as e:
         logging.error(f"Text2SQL failed: {e}")
         raise HTTPException(status_code=500, detail="Text2SQL failed.")
 
 
+@app.post("/text2sql/stream")
+async def text_to_sql_stream(query: QueryRequest):
+    """
+    Endpoint to convert natural language text to SQL query, streamed as Server-Sent Events.
+
+    Each generated chunk is sent as a `data: {"token": ...}` event, followed by a final
+    `done` event once the SQL statement is complete.
+
+    Args:
+        query (QueryRequest): The request object containing the question to be converted to SQL.
+
+    Returns:
+        StreamingResponse: A `text/event-stream` response with the generated SQL query,
+            with the timings of the stages before generation in the `Server-Timing`
+            header.
+
+    Raises:
+        HTTPException: If an error occurs before the generation starts.
+    """
+    logging.info(f"Received query for streaming text2sql: {query.question}")
+    trace = PipelineTrace()
+    try:
+        chunks = await text2sql_executor.run(
+            stream_text2sql,
+            query.question,
+            submit=text2sql_executor.submit,
+            trace=trace,
+        )
+    except ExecutorSaturatedError:
+        raise
+    except Exception as e:
+        logging.error(f"Streaming Text2SQL failed: {e}")
+        raise HTTPException(status_code=500, detail="Text2SQL failed.")
+
+    def events():
+        for chunk in chunks:
+            yield f"data: {json.dumps({'token': chunk})}\n\n"
+        yield "event: done\ndata: {}\n\n"
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Server-Timing": trace.server_timing()},
+    )
+
+
 @app.post("/feedback")
 async def feedback(data: FeedbackRequest):
     """
@@ -137,10 +302,11 @@ async def feedback(data: FeedbackRequest):
             "timestamp": datetime.utcnow().isoformat(),
         }
 
-        # Enqueue feedback to Redis
-        r = get_redis_client()
-        r.rpush("feedback_queue", json.dumps(feedback_dict))
+        # Enqueue feedback to Redis, on the shared async client
+        await feedback_writer.push(json.dumps(feedback_dict))
         return JSONResponse(content={"status": "Feedback enqueued"}, status_code=200)
+    except HTTPException:
+        raise
     except Exception as e:
         logging.error(f"Feedback failed: {e}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -162,7 +328,7 @@ async def preprocess(data: PreprocessTextRequest):
     """
     logging.info(f"Received request for preprocessing: {data.text}")
     try:
-        preprocessed_text = preprocess_text(data.text)
+        preprocessed_text = await preprocess_text_async(data.text)
         logging.info(f"Preprocessing successful. Result: {preprocessed_text}")
         result_dict = {
             "result": preprocessed_text["disambiguated_text"],
@@ -170,11 +336,37 @@ async def preprocess(data: PreprocessTextRequest):
         }
 
         return JSONResponse(content=result_dict, status_code=200)
+    except ExecutorSaturatedError:
+        raise
     except Exception as e:
         logging.error(f"Preprocess failed: {e}")
         raise HTTPException(status_code=500, detail="Preprocessing failed.")
 
 
+@app.get("/metrics")
+def metrics():
+    """
+    Endpoint exposing service metrics.
+
+    Returns:
+        dict: Hit/miss metrics of the result caches, assisted decoding statistics,
+            skipped and run disambiguation calls, latencies of the text2sql stages,
+            enqueued feedback, and load times and resident sizes of the models.
+    """
+    return {
+        "text2sql_cache": get_cache_stats(),
+        "ai_detector_cache": get_ai_detector_cache_stats(),
+        "text2sql_assisted_decoding": get_assisted_decoding_stats(),
+        "text2sql_preprocess": get_preprocess_stats(),
+        "text2sql_pipeline": get_pipeline_stats(),
+        "models": model_registry.stats(),
+        "llm": llm_client.stats(),
+        "llm_pipeline": pipeline_llm_client.stats(),
+        "llm_cache": get_lm_cache_stats(),
+        "feedback": feedback_writer.stats(),
+    }
+
+
 @app.get("/health")
 def health_check():
     """
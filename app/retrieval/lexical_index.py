@@ -0,0 +1,158 @@
+import math
+import re
+from collections import Counter, defaultdict
+from typing import Dict, List, Sequence, Tuple
+
+import numpy as np
+
+from app.retrieval.numpy_index import top_k_rows
+
+_WORD = re.compile(r"[a-z0-9]+")
+# Words that appear in many questions and headers without identifying a column
+STOPWORDS = frozenset(
+    "a an and are as at by for from how in is it of on or the to was what when where "
+    "which who with".split()
+)
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase word tokens of a text, without stopwords."""
+    return [word for word in _WORD.findall(text.lower()) if word not in STOPWORDS]
+
+
+def trigrams(word: str) -> List[str]:
+    """Character trigrams of a word padded with spaces, e.g. " no", "not", ..."""
+    padded = f" {word} "
+    return [padded[i : i + 3] for i in range(len(padded) - 2)]
+
+
+def reciprocal_rank_fusion(
+    rankings: Sequence[Sequence[str]], k: int = 60
+) -> List[Tuple[str, float]]:
+    """
+    Fuse several rankings by summing 1 / (k + rank) for every item.
+
+    Args:
+        rankings (Sequence[Sequence[str]]): Rankings of items, best first.
+        k (int): Damping constant; larger values flatten the contribution of top ranks.
+
+    Returns:
+        List[Tuple[str, float]]: Items and their fused scores, best first.
+    """
+    scores: Dict[str, float] = defaultdict(float)
+    for ranking in rankings:
+        for rank, item in enumerate(ranking):
+            scores[item] += 1.0 / (k + rank + 1)
+    return sorted(scores.items(), key=lambda item: -item[1])
+
+
+class LexicalHeaderIndex:
+    """
+    In-memory BM25 inverted index over the header vocabulary.
+
+    Every header is indexed by its words and by the character trigrams of its words, so
+    a question matches columns it names verbatim as well as inflected or slightly
+    misspelled ones ("goal" still matches "Goals"). Trigram terms are weighted down so
+    that whole-word matches rank first.
+
+    The BM25 weight of every posting is precomputed, so a search only concatenates the
+    postings of the question's terms and sums them per header with `np.bincount`.
+
+    A match is confident when every word of a header occurs in the question, which is
+    how most WikiSQL questions refer to the columns they need.
+
+    Args:
+        headers (Sequence[str]): The header vocabulary.
+        k1 (float): BM25 term frequency saturation.
+        b (float): BM25 length normalization.
+        trigram_weight (float): Weight of trigram terms relative to word terms.
+    """
+
+    def __init__(
+        self,
+        headers: Sequence[str],
+        k1: float = 1.2,
+        b: float = 0.75,
+        trigram_weight: float = 0.3,
+    ):
+        self.headers = list(headers)
+        self._words = [frozenset(tokenize(header)) for header in self.headers]
+
+        postings: Dict[str, List[Tuple[int, int]]] = defaultdict(list)
+        lengths = np.zeros(len(self.headers), dtype=np.float32)
+        for id_, header in enumerate(self.headers):
+            terms = self._terms(header)
+            lengths[id_] = len(terms)
+            for term, count in Counter(terms).items():
+                postings[term].append((id_, count))
+        norms = k1 * (1 - b + b * lengths / max(float(lengths.mean()), 1.0))
+
+        n = len(self.headers)
+        self._postings: Dict[str, Tuple[np.ndarray, np.ndarray]] = {}
+        for term, entries in postings.items():
+            ids = np.array([id_ for id_, _ in entries], dtype=np.int64)
+            counts = np.array([count for _, count in entries], dtype=np.float32)
+            idf = math.log(1 + (n - len(ids) + 0.5) / (len(ids) + 0.5))
+            if term.startswith("#"):
+                idf *= trigram_weight
+            weights = idf * counts * (k1 + 1) / (counts + norms[ids])
+            self._postings[term] = (ids, weights.astype(np.float32))
+
+    @classmethod
+    def from_file(cls, path: str, **kwargs) -> "LexicalHeaderIndex":
+        """Build the index from a file with one header per line."""
+        with open(path, "r", encoding="utf-8") as f:
+            return cls([line.strip() for line in f if line.strip()], **kwargs)
+
+    def __len__(self) -> int:
+        return len(self.headers)
+
+    def search(self, question: str, top_k: int = 20) -> List[Tuple[str, float]]:
+        """
+        Rank headers by their BM25 score against the question.
+
+        Args:
+            question (str): The user input or question.
+            top_k (int): Number of headers to return.
+
+        Returns:
+            List[Tuple[str, float]]: Matching headers and their scores, best first.
+        """
+        return [
+            (self.headers[id_], score) for id_, score in self._search(question, top_k)
+        ]
+
+    def confident_matches(self, question: str, top_k: int = 20) -> List[str]:
+        """Return the top headers whose words all occur in the question."""
+        words = set(tokenize(question))
+        return [
+            self.headers[id_]
+            for id_, _ in self._search(question, top_k)
+            if self._words[id_] and self._words[id_] <= words
+        ]
+
+    def _search(self, question: str, top_k: int) -> List[Tuple[int, float]]:
+        matched = [
+            self._postings[term]
+            for term in set(self._terms(question))
+            if term in self._postings
+        ]
+        if not matched:
+            return []
+        scores = np.bincount(
+            np.concatenate([ids for ids, _ in matched]),
+            weights=np.concatenate([weights for _, weights in matched]),
+            minlength=len(self.headers),
+        )
+        ids, top_scores = top_k_rows(scores[np.newaxis], top_k)
+        return [
+            (int(id_), float(score))
+            for id_, score in zip(ids[0], top_scores[0])
+            if score > 0
+        ]
+
+    @staticmethod
+    def _terms(text: str) -> List[str]:
+        words = tokenize(text)
+        # Trigram terms are prefixed so they never collide with words
+        return words + ["#" + gram for word in words for gram in trigrams(word)]
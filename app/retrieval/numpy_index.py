@@ -0,0 +1,170 @@
+import json
+import os
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+
+EMBEDDINGS_FILE = "embeddings.npy"
+HEADERS_FILE = "headers.json"
+META_FILE = "meta.json"
+
+# Normalized components lie in [-1, 1], so int8 stores them with one global scale
+_INT8_SCALE = 127.0
+# Rows dequantized at once when scoring an int8 index
+_INT8_BLOCK_ROWS = 4096
+
+
+def build_numpy_index(
+    path: str,
+    headers: Sequence[str],
+    embeddings: np.ndarray,
+    dtype: str = "float32",
+    model_name: Optional[str] = None,
+) -> None:
+    """
+    Writes a header index artifact that `NumpyHeaderIndex.load` can memory-map.
+
+    The artifact is a directory holding the L2-normalized embeddings as a `.npy` file,
+    the id→header table as JSON (the id of a header is its row in the embeddings) and
+    a small metadata file.
+
+    Args:
+        path (str): Directory to write the artifact to.
+        headers (Sequence[str]): The headers, in the order of `embeddings`.
+        embeddings (np.ndarray): Header embeddings of shape (n_headers, dim).
+        dtype (str): "float32", or "int8" for a 4x smaller artifact.
+        model_name (Optional[str]): Name of the embedding model, recorded in the metadata.
+    """
+    if dtype not in ("float32", "int8"):
+        raise ValueError(f"Unsupported index dtype {dtype!r}")
+    embeddings = normalize_rows(np.asarray(embeddings, dtype=np.float32))
+    if len(headers) != embeddings.shape[0]:
+        raise ValueError(
+            f"Got {len(headers)} headers but {embeddings.shape[0]} embeddings"
+        )
+    if dtype == "int8":
+        embeddings = np.round(embeddings * _INT8_SCALE).astype(np.int8)
+
+    os.makedirs(path, exist_ok=True)
+    np.save(os.path.join(path, EMBEDDINGS_FILE), embeddings)
+    with open(os.path.join(path, HEADERS_FILE), "w", encoding="utf-8") as f:
+        json.dump(list(headers), f, ensure_ascii=False)
+    with open(os.path.join(path, META_FILE), "w", encoding="utf-8") as f:
+        json.dump(
+            {
+                "count": embeddings.shape[0],
+                "dim": embeddings.shape[1],
+                "dtype": dtype,
+                "model_name": model_name,
+            },
+            f,
+        )
+
+
+class NumpyHeaderIndex:
+    """
+    Exact in-process nearest-neighbour index over normalized header embeddings.
+
+    The embeddings are memory-mapped read-only, so loading does not copy them and every
+    worker process on a host shares the same pages of the OS page cache. A search is one
+    matrix-vector product followed by `argpartition`, which is exact and faster than an
+    approximate index at the size of the WikiSQL header vocabulary.
+
+    The `query` method mirrors the result layout of a Chroma collection, so the index can
+    be used wherever the header collection is.
+
+    Args:
+        embeddings (np.ndarray): Normalized embeddings of shape (n_headers, dim), float32
+            or int8 scaled by 127.
+        headers (List[str]): The header of every row of `embeddings`.
+    """
+
+    def __init__(self, embeddings: np.ndarray, headers: List[str]):
+        self.embeddings = embeddings
+        self.headers = headers
+
+    @classmethod
+    def load(cls, path: str) -> "NumpyHeaderIndex":
+        """Memory-map an artifact written by `build_numpy_index`."""
+        embeddings = np.load(os.path.join(path, EMBEDDINGS_FILE), mmap_mode="r")
+        with open(os.path.join(path, HEADERS_FILE), "r", encoding="utf-8") as f:
+            headers = json.load(f)
+        return cls(embeddings, headers)
+
+    def __len__(self) -> int:
+        return len(self.headers)
+
+    def search(
+        self, query_embeddings: np.ndarray, top_k: int
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Find the most similar headers of each query.
+
+        Args:
+            query_embeddings (np.ndarray): Queries of shape (n_queries, dim) or (dim,).
+            top_k (int): Number of headers to return per query.
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: Header ids and cosine similarities, both of shape
+                (n_queries, top_k) and sorted by decreasing similarity.
+        """
+        queries = normalize_rows(
+            np.atleast_2d(np.asarray(query_embeddings, dtype=np.float32))
+        )
+        return top_k_rows(self.similarities(queries), top_k)
+
+    def query(self, query_embeddings, n_results: int = 10) -> dict:
+        """
+        Chroma-compatible query returning the documents and cosine distances per query.
+        """
+        ids, scores = self.search(np.asarray(query_embeddings), n_results)
+        return {
+            "ids": [[str(i) for i in row] for row in ids],
+            "documents": [[self.headers[i] for i in row] for row in ids],
+            "distances": (1.0 - scores).tolist(),
+        }
+
+    def similarities(self, queries: np.ndarray) -> np.ndarray:
+        """Return the cosine similarity of every normalized query to every header."""
+        if self.embeddings.dtype != np.int8:
+            return queries @ self.embeddings.T
+        # Dequantize block by block to bound the temporary memory of a search
+        scores = np.empty((len(queries), len(self.embeddings)), dtype=np.float32)
+        for start in range(0, len(self.embeddings), _INT8_BLOCK_ROWS):
+            block = self.embeddings[start : start + _INT8_BLOCK_ROWS]
+            scores[:, start : start + len(block)] = queries @ (
+                block.astype(np.float32).T / _INT8_SCALE
+            )
+        return scores
+
+
+def top_k_rows(scores: np.ndarray, top_k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Select the `top_k` highest scores of every row with `argpartition`.
+
+    Args:
+        scores (np.ndarray): Scores of shape (n_rows, n_items).
+        top_k (int): Number of items to select per row.
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: Item indices and their scores, both of shape
+            (n_rows, min(top_k, n_items)) and sorted by decreasing score.
+    """
+    top_k = min(top_k, scores.shape[1])
+    if top_k <= 0:
+        empty = np.empty((len(scores), 0))
+        return empty.astype(np.int64), empty.astype(np.float32)
+    if top_k < scores.shape[1]:
+        candidates = np.argpartition(-scores, top_k - 1, axis=1)[:, :top_k]
+    else:
+        candidates = np.broadcast_to(np.arange(scores.shape[1]), scores.shape)
+    candidate_scores = np.take_along_axis(scores, candidates, axis=1)
+    order = np.argsort(-candidate_scores, axis=1, kind="stable")
+    ids = np.take_along_axis(candidates, order, axis=1)
+    return ids, np.take_along_axis(candidate_scores, order, axis=1)
+
+
+def normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    """Scale every row of `matrix` to unit L2 norm, leaving zero rows unchanged."""
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    return matrix / np.where(norms > 0, norms, 1.0)
@@ -0,0 +1,198 @@
+import json
+import os
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from app.retrieval.numpy_index import (
+    NumpyHeaderIndex,
+    build_numpy_index,
+    normalize_rows,
+    top_k_rows,
+)
+
+TABLE_EMBEDDINGS_FILE = "table_embeddings.npy"
+TABLES_FILE = "tables.json"
+COLUMNS_DIR = "columns"
+
+
+def approximate_token_count(text: str) -> int:
+    """Rough token count of English text, about four characters per token."""
+    return len(text) // 4 + 1
+
+
+def format_column(header: str, type_: str) -> str:
+    """Format a column the way the text2sql prompt lists it."""
+    return f"{header} ({type_})"
+
+
+def build_table_index(
+    path: str,
+    tables: Iterable[dict],
+    embed: Callable[[List[str]], np.ndarray],
+    model_name: Optional[str] = None,
+) -> dict:
+    """
+    Writes a table-aware schema index artifact that `TableSchemaIndex.load` can memory-map.
+
+    Tables with the same columns and types are stored once. Every table is embedded
+    from its caption and column names, and every distinct column name is embedded once
+    into a `NumpyHeaderIndex` stored in the `columns` subdirectory.
+
+    Args:
+        path (str): Directory to write the artifact to.
+        tables (Iterable[dict]): Tables with "header", "types" and optional "caption"
+            keys, as yielded by `scripts.headers_utils.iter_tables_from_file`.
+        embed (Callable[[List[str]], np.ndarray]): Function embedding a list of texts.
+        model_name (Optional[str]): Name of the embedding model, recorded in the metadata.
+
+    Returns:
+        dict: Number of distinct tables and columns in the index.
+    """
+    schemas: Dict[Tuple[Tuple[str, ...], Tuple[str, ...]], str] = {}
+    for table in tables:
+        if table["header"]:
+            key = (tuple(table["header"]), tuple(table["types"]))
+            schemas.setdefault(key, table.get("caption") or "")
+
+    column_ids: Dict[str, int] = {}
+    entries, texts = [], []
+    for (headers, types), caption in schemas.items():
+        ids = [column_ids.setdefault(header, len(column_ids)) for header in headers]
+        entries.append({"columns": ids, "types": list(types)})
+        columns_text = " | ".join(headers)
+        texts.append(f"{caption}: {columns_text}" if caption else columns_text)
+
+    column_names = list(column_ids)
+    build_numpy_index(
+        os.path.join(path, COLUMNS_DIR),
+        column_names,
+        embed(column_names),
+        model_name=model_name,
+    )
+    np.save(
+        os.path.join(path, TABLE_EMBEDDINGS_FILE),
+        normalize_rows(np.asarray(embed(texts), dtype=np.float32)),
+    )
+    with open(os.path.join(path, TABLES_FILE), "w", encoding="utf-8") as f:
+        json.dump(entries, f)
+    return {"tables": len(entries), "columns": len(column_names)}
+
+
+class TableSchemaIndex:
+    """
+    Two-stage schema retriever that returns coherent sets of typed columns.
+
+    The first stage finds candidate tables by the similarity of the question to the
+    table embeddings. The second stage scores the columns of those tables against the
+    question and re-ranks the tables by their table score plus their best column score.
+    The schema is then filled table by table, so the prompt holds the columns of a few
+    whole tables instead of unrelated columns from many. Only the best table is trimmed,
+    to its most relevant columns, when it does not fit into the limits on its own.
+
+    The embeddings are memory-mapped read-only like those of `NumpyHeaderIndex`.
+
+    Args:
+        table_embeddings (np.ndarray): Normalized table embeddings of shape (n_tables, dim).
+        tables (List[dict]): The "columns" (column ids) and "types" of every table.
+        columns (NumpyHeaderIndex): Index of the distinct column names.
+    """
+
+    def __init__(
+        self,
+        table_embeddings: np.ndarray,
+        tables: List[dict],
+        columns: NumpyHeaderIndex,
+    ):
+        self.table_embeddings = table_embeddings
+        self.tables = tables
+        self.columns = columns
+
+    @classmethod
+    def load(cls, path: str) -> "TableSchemaIndex":
+        """Memory-map an artifact written by `build_table_index`."""
+        table_embeddings = np.load(
+            os.path.join(path, TABLE_EMBEDDINGS_FILE), mmap_mode="r"
+        )
+        with open(os.path.join(path, TABLES_FILE), "r", encoding="utf-8") as f:
+            tables = json.load(f)
+        columns = NumpyHeaderIndex.load(os.path.join(path, COLUMNS_DIR))
+        return cls(table_embeddings, tables, columns)
+
+    def search(
+        self,
+        query_embeddings: np.ndarray,
+        top_k: int = 20,
+        n_tables: int = 5,
+        token_budget: Optional[int] = None,
+        count_tokens: Callable[[str], int] = approximate_token_count,
+    ) -> List[List[Tuple[str, str]]]:
+        """
+        Retrieve a compact schema for each query.
+
+        Args:
+            query_embeddings (np.ndarray): Queries of shape (n_queries, dim) or (dim,).
+            top_k (int): Maximum number of columns per schema.
+            n_tables (int): Number of candidate tables found by the first stage.
+            token_budget (Optional[int]): Maximum number of prompt tokens of a schema.
+                None only limits the number of columns.
+            count_tokens (Callable[[str], int]): Token counter of one formatted column.
+
+        Returns:
+            List[List[Tuple[str, str]]]: The (header, type) pairs of every query's schema.
+        """
+        queries = normalize_rows(
+            np.atleast_2d(np.asarray(query_embeddings, dtype=np.float32))
+        )
+        table_ids, table_scores = top_k_rows(
+            queries @ self.table_embeddings.T, n_tables
+        )
+        column_scores = self.columns.similarities(queries)
+
+        schemas = []
+        for query, (ids, scores) in enumerate(zip(table_ids, table_scores)):
+            candidates = []
+            for table_id, table_score in zip(ids, scores):
+                table = self.tables[table_id]
+                scores_of_columns = column_scores[query, table["columns"]]
+                rank = table_score + float(np.max(scores_of_columns))
+                candidates.append((rank, table, scores_of_columns))
+            candidates.sort(key=lambda candidate: -candidate[0])
+            schemas.append(self._fill(candidates, top_k, token_budget, count_tokens))
+        return schemas
+
+    def _fill(
+        self,
+        candidates: Sequence[Tuple[float, dict, np.ndarray]],
+        top_k: int,
+        token_budget: Optional[int],
+        count_tokens: Callable[[str], int],
+    ) -> List[Tuple[str, str]]:
+        budget = token_budget if token_budget is not None else float("inf")
+        schema: List[Tuple[str, str]] = []
+        used = set()
+        for rank, (_, table, scores) in enumerate(candidates):
+            columns = [
+                (self.columns.headers[column_id], type_, score)
+                for column_id, type_, score in zip(
+                    table["columns"], table["types"], scores
+                )
+                if self.columns.headers[column_id] not in used
+            ]
+            # Every column also costs a " | " separator
+            costs = [count_tokens(format_column(h, t)) + 1 for h, t, _ in columns]
+            if rank == 0:
+                # Keep the most relevant columns of the best table, in table order
+                keep, total = set(), 0
+                for i in sorted(range(len(columns)), key=lambda i: -columns[i][2]):
+                    if len(keep) < top_k and total + costs[i] <= budget:
+                        keep.add(i)
+                        total += costs[i]
+                columns = [column for i, column in enumerate(columns) if i in keep]
+                costs = [costs[i] for i in sorted(keep)]
+            elif len(schema) + len(columns) > top_k or sum(costs) > budget:
+                continue
+            schema.extend((header, type_) for header, type_, _ in columns)
+            used.update(header for header, _, _ in columns)
+            budget -= sum(costs)
+        return schema
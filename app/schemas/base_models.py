@@ -1,4 +1,4 @@
-from typing import Optional
+from typing import List, Optional
 from pydantic import BaseModel
 
 
@@ -10,6 +10,10 @@ class TextRequest(BaseModel):
     text: str
 
 
+class TextBatchRequest(BaseModel):
+    texts: List[str]
+
+
 class FeedbackRequest(BaseModel):
     input: dict
     prediction: str
@@ -1,16 +1,72 @@
-import os
+from typing import Iterator, List, Optional, Tuple
 from transformers import AutoTokenizer, AutoModelForSequenceClassification, pipeline
 import torch
 import logging
 
+from app.core.config import settings
+from app.core.model_registry import model_registry
+from app.services.batching import MicroBatcher
+from app.services.detection_cache import AIDetectionCache, chunk_key
+from app.services.model_backends import load_sequence_classifier
+
 # Globals for lazy initialization
 _tokenizer = None
 _model = None
 _pipe = None
 
-MODEL_PATH = os.getenv(
-    "MODEL_SQL2TEXT_AI_DETECTOR_PATH",
-    "nerzid/roberta-base-openai-detector-text2sql-approach-2",
+MODEL_PATH = settings.MODEL_SQL2TEXT_AI_DETECTOR_PATH
+HUMAN_DETECTOR_MODEL_PATH = "roberta-base-openai-detector"
+
+
+def _load_detector() -> dict:
+    tokenizer = AutoTokenizer.from_pretrained(MODEL_PATH)
+    model = load_sequence_classifier(
+        MODEL_PATH, settings.AI_DETECTOR_BACKEND, settings.AI_DETECTOR_ONNX_PATH
+    )
+    # The ONNX Runtime model is called directly, without a pipeline
+    pipe = (
+        pipeline("text-classification", model=model, tokenizer=tokenizer)
+        if isinstance(model, torch.nn.Module)
+        else None
+    )
+    return {"tokenizer": tokenizer, "model": model, "pipe": pipe}
+
+
+def _unload_detector() -> None:
+    global _tokenizer, _model, _pipe
+    _tokenizer = _model = _pipe = None
+
+
+def _load_human_detector() -> dict:
+    tokenizer = AutoTokenizer.from_pretrained(HUMAN_DETECTOR_MODEL_PATH)
+    model = AutoModelForSequenceClassification.from_pretrained(
+        HUMAN_DETECTOR_MODEL_PATH
+    )
+    model.eval()
+    return {"tokenizer": tokenizer, "model": model}
+
+
+model_registry.register("ai_detector", _load_detector, on_unload=_unload_detector)
+model_registry.register("human_detector", _load_human_detector)
+
+_detection_cache = (
+    AIDetectionCache(
+        f"{MODEL_PATH}@{settings.AI_DETECTOR_BACKEND}",
+        # Document results depend on how texts are chunked and when voting stops
+        variant=(
+            f"stride={settings.AI_DETECTOR_CHUNK_STRIDE},"
+            f"early_exit={settings.AI_DETECTOR_EARLY_EXIT},"
+            f"min_chunks={settings.AI_DETECTOR_EARLY_EXIT_MIN_CHUNKS},"
+            f"margin={settings.AI_DETECTOR_EARLY_EXIT_MARGIN},"
+            f"spread_above={settings.AI_DETECTOR_EARLY_EXIT_SPREAD_ABOVE}"
+        ),
+        max_entries=settings.AI_DETECTOR_CACHE_MAX_ENTRIES,
+        chunk_max_entries=settings.AI_DETECTOR_CHUNK_CACHE_MAX_ENTRIES,
+        ttl_seconds=settings.AI_DETECTOR_CACHE_TTL_SECONDS,
+        use_redis=settings.AI_DETECTOR_CACHE_USE_REDIS,
+    )
+    if settings.AI_DETECTOR_CACHE_ENABLED
+    else None
 )
 
 
@@ -19,22 +75,22 @@ def load_model():
     Load the model and tokenizer for AI text detection.
 
     This function uses lazy initialization to load the model and tokenizer
-    only when they are first needed. This approach saves memory when the
-    model isn't in use.
+    only when they are first needed. The model is loaded through the shared
+    model registry, which may unload it again when it is idle or memory is
+    needed for another model; the globals are reset then.
 
     Global Variables:
         _tokenizer: The tokenizer for processing input text.
         _model: The pre-trained model for AI text detection.
-        _pipe: The pipeline for text classification.
+        _pipe: The pipeline for text classification, None with the ONNX backend.
 
     Returns:
         None
     """
     global _tokenizer, _model, _pipe
-    if _tokenizer is None or _model is None or _pipe is None:
-        _tokenizer = AutoTokenizer.from_pretrained(MODEL_PATH)
-        _model = AutoModelForSequenceClassification.from_pretrained(MODEL_PATH)
-        _pipe = pipeline("text-classification", model=_model, tokenizer=_tokenizer)
+    if _tokenizer is None or _model is None:
+        loaded = model_registry.get("ai_detector")
+        _tokenizer, _model, _pipe = loaded["tokenizer"], loaded["model"], loaded["pipe"]
 
 
 def is_test_human_generated(test_text: str) -> bool:
@@ -46,36 +102,400 @@ def is_test_human_generated(test_text: str) -> bool:
     Returns:
         bool: True if the text is human generated, False otherwise
     """
-    model_name = "roberta-base-openai-detector"
-    tokenizer = AutoTokenizer.from_pretrained(model_name)
-    model = AutoModelForSequenceClassification.from_pretrained(model_name)
+    with model_registry.use("human_detector"):
+        loaded = model_registry.get("human_detector")
+        tokenizer, model = loaded["tokenizer"], loaded["model"]
 
-    inputs = tokenizer(test_text, return_tensors="pt", truncation=True, max_length=512)
-    outputs = model(**inputs)
+        inputs = tokenizer(
+            test_text, return_tensors="pt", truncation=True, max_length=512
+        )
+        with torch.no_grad():
+            outputs = model(**inputs)
     logits = outputs.logits
     probs = torch.softmax(logits, dim=1)
 
     # 0 = human, 1 = AI
     ai_prob = probs[0][1].item()
-    print(ai_prob)
+    logging.debug(f"Human detector AI probability: {ai_prob:.3f}")
     return ai_prob < 0.5
 
 
-def chunk_text(text, max_tokens=512):
+def chunk_tokens(text: str, max_tokens: int = 512, stride: int = 0) -> List[List[int]]:
     """
-    Split the input text into chunks of specified maximum token length.
+    Tokenize the text once and split the token IDs into sliding windows.
+
+    Every window leaves room for the special tokens the model adds, so no chunk is ever
+    truncated.
 
     Args:
         text (str): The input text to be chunked.
-        max_tokens (int, optional): The maximum number of tokens per chunk. Defaults to 512.
+        max_tokens (int, optional): The maximum number of tokens per chunk, special tokens
+            included. Defaults to 512.
+        stride (int, optional): Number of tokens consecutive windows overlap by.
+            Defaults to 0.
+
+    Returns:
+        List[List[int]]: Token IDs of every chunk, without special tokens.
+    """
+    token_ids = _tokenizer.encode(text, add_special_tokens=False)
+    window = max_tokens - _tokenizer.num_special_tokens_to_add(pair=False)
+    return sliding_windows(token_ids, window, stride)
 
-    Yields:
-        str: Decoded text chunks.
+
+def sliding_windows(
+    token_ids: List[int], window: int, stride: int = 0
+) -> List[List[int]]:
+    """
+    Split token IDs into windows of `window` tokens that overlap by `stride` tokens.
+
+    Args:
+        token_ids (List[int]): The token IDs to split.
+        window (int): Number of tokens per window.
+        stride (int): Number of tokens consecutive windows share.
+
+    Returns:
+        List[List[int]]: The windows; the last one may be shorter.
+    """
+    if not 0 <= stride < window:
+        raise ValueError(f"stride must be in [0, {window}), got {stride}")
+    windows = []
+    start = 0
+    while start < len(token_ids):
+        windows.append(token_ids[start : start + window])
+        if start + window >= len(token_ids):
+            break
+        start += window - stride
+    return windows
+
+
+def classify_chunks(chunks: List[List[int]]) -> List[Tuple[str, float]]:
+    """
+    Classify token ID chunks, reusing cached predictions of identical chunks.
+
+    Chunks missing from the chunk cache are classified once each, even if they occur
+    several times, and their predictions are cached.
+
+    Args:
+        chunks (List[List[int]]): Token IDs of the chunks, without special tokens.
+
+    Returns:
+        List[Tuple[str, float]]: The lowercased label and its probability for every chunk,
+            in the order of `chunks`.
     """
-    tokens = _tokenizer.encode(text, add_special_tokens=False)
-    for i in range(0, len(tokens), max_tokens):
-        chunk = tokens[i : i + max_tokens]
-        yield _tokenizer.decode(chunk, skip_special_tokens=True)
+    if _detection_cache is None:
+        return _classify_chunks(chunks)
+
+    predictions = _detection_cache.get_chunks(chunks)
+    missing = {}
+    for i, prediction in enumerate(predictions):
+        if prediction is None:
+            missing.setdefault(chunk_key(chunks[i]), []).append(i)
+    if missing:
+        unique = [chunks[indices[0]] for indices in missing.values()]
+        classified = _classify_chunks(unique)
+        for indices, prediction in zip(missing.values(), classified):
+            for i in indices:
+                predictions[i] = prediction
+        _detection_cache.set_chunks(unique, classified)
+    return predictions
+
+
+def _classify_chunks(chunks: List[List[int]]) -> List[Tuple[str, float]]:
+    """
+    Classify token ID chunks with padded, batched forward passes.
+
+    Special tokens, padding and attention masks are added directly to the token IDs, so
+    no chunk is decoded or tokenized again. The chunks are sorted by length, so chunks
+    of similar length share a batch and little compute is spent on padding, and each
+    batch holds at most `settings.AI_DETECTOR_MAX_BATCH_TOKENS` padded tokens.
+
+    Args:
+        chunks (List[List[int]]): Token IDs of the chunks, without special tokens.
+
+    Returns:
+        List[Tuple[str, float]]: The lowercased label and its probability for every chunk,
+            in the order of `chunks`.
+    """
+    prefix, suffix = _special_tokens()
+    sequences = [prefix + chunk + suffix for chunk in chunks]
+    order = sorted(range(len(sequences)), key=lambda i: len(sequences[i]))
+
+    predictions: List[Optional[Tuple[str, float]]] = [None] * len(sequences)
+    for batch_indices in _token_budget_batches(order, sequences):
+        batch = _pad([sequences[i] for i in batch_indices])
+        with torch.no_grad():
+            outputs = _model(**batch)
+            probs = torch.nn.functional.softmax(outputs.logits, dim=-1)
+        for row, i in enumerate(batch_indices):
+            label_id = torch.argmax(probs[row]).item()
+            label = _model.config.id2label[label_id].lower()
+            predictions[i] = (label, probs[row][label_id].item())
+    return predictions
+
+
+def detect_ai_generated_batch(texts: List[str]) -> List[dict]:
+    """
+    Classify several texts with shared padded batches.
+
+    The chunks of all texts are classified together, and the predictions of each text's
+    chunks are combined with the confidence-weighted vote of `is_ai_generated`.
+
+    Args:
+        texts (List[str]): The texts to classify.
+
+    With `settings.AI_DETECTOR_EARLY_EXIT`, chunks are classified in rounds and a text
+    stops being classified once its vote is decided; `score` then covers the evaluated
+    chunks only.
+
+    Returns:
+        List[dict]: For every text, whether it is AI-generated, the AI share of the
+            weighted vote as `score`, the number of chunks, and the number of chunks
+            that were classified as `chunks_evaluated`.
+    """
+    with model_registry.use("ai_detector"):
+        load_model()  # load the model once if it hasn't loaded already
+        return _detect_ai_generated_batch(texts)
+
+
+def _detect_ai_generated_batch(texts: List[str]) -> List[dict]:
+    chunks_per_text = [
+        chunk_tokens(
+            text,
+            max_tokens=_tokenizer.model_max_length,
+            stride=settings.AI_DETECTOR_CHUNK_STRIDE,
+        )
+        for text in texts
+    ]
+    if settings.AI_DETECTOR_EARLY_EXIT:
+        predictions_per_text = _classify_with_early_exit(chunks_per_text)
+    else:
+        predictions = classify_chunks(
+            [chunk for chunks in chunks_per_text for chunk in chunks]
+        )
+        predictions_per_text = []
+        start = 0
+        for chunks in chunks_per_text:
+            predictions_per_text.append(predictions[start : start + len(chunks)])
+            start += len(chunks)
+
+    results = []
+    for chunks, text_predictions in zip(chunks_per_text, predictions_per_text):
+        for i, (label, score) in enumerate(text_predictions):
+            logging.info(f"Chunk {i + 1}/{len(chunks)} → {label} ({score:.2f})")
+
+        # Combine results: majority voting weighted by confidence
+        ai_score, human_score = _vote(text_predictions)
+        total = ai_score + human_score
+        results.append(
+            {
+                "ai_generated": ai_score >= human_score,
+                "score": ai_score / total if total else 0.0,
+                "chunks": len(chunks),
+                "chunks_evaluated": len(text_predictions),
+            }
+        )
+    return results
+
+
+def _classify_with_early_exit(
+    chunks_per_text: List[List[List[int]]],
+) -> List[List[Tuple[str, float]]]:
+    """
+    Classify the chunks of every text in rounds until the vote of each text is decided.
+
+    The first round classifies `settings.AI_DETECTOR_EARLY_EXIT_MIN_CHUNKS` chunks of
+    every text and each further round twice as many, with the chunks of all undecided
+    texts sharing batches. A text is decided once its remaining chunks can no longer
+    flip the weighted vote, since every chunk adds at most 1 to either side, or once the
+    vote reaches `settings.AI_DETECTOR_EARLY_EXIT_MARGIN`. Chunks of texts longer than
+    `settings.AI_DETECTOR_EARLY_EXIT_SPREAD_ABOVE` chunks are visited in an order spread
+    over the whole text, so early rounds are not biased towards its beginning.
+
+    Args:
+        chunks_per_text (List[List[List[int]]]): Token IDs of the chunks of every text.
+
+    Returns:
+        List[List[Tuple[str, float]]]: The predictions of the evaluated chunks of every
+            text, in evaluation order.
+    """
+    orders = [
+        (
+            spread_order(len(chunks))
+            if len(chunks) > settings.AI_DETECTOR_EARLY_EXIT_SPREAD_ABOVE
+            else list(range(len(chunks)))
+        )
+        for chunks in chunks_per_text
+    ]
+    predictions: List[List[Tuple[str, float]]] = [[] for _ in chunks_per_text]
+    pending = [i for i, chunks in enumerate(chunks_per_text) if chunks]
+    round_size = max(settings.AI_DETECTOR_EARLY_EXIT_MIN_CHUNKS, 1)
+    while pending:
+        requests = []
+        for i in pending:
+            evaluated = len(predictions[i])
+            requests.extend(
+                (i, j) for j in orders[i][evaluated : evaluated + round_size]
+            )
+        round_predictions = classify_chunks(
+            [chunks_per_text[i][j] for i, j in requests]
+        )
+        for (i, _), prediction in zip(requests, round_predictions):
+            predictions[i].append(prediction)
+        pending = [
+            i
+            for i in pending
+            if not _is_decided(
+                predictions[i], len(chunks_per_text[i]) - len(predictions[i])
+            )
+        ]
+        round_size *= 2
+    return predictions
+
+
+def spread_order(n: int) -> List[int]:
+    """
+    Order the indices 0..n-1 so that every prefix is spread evenly over the range.
+
+    The order follows the bit-reversed (van der Corput) sequence, e.g. 0, 4, 2, 6, 1, ...
+    for n=8.
+
+    Args:
+        n (int): Number of indices.
+
+    Returns:
+        List[int]: A permutation of range(n).
+    """
+    bits = max((n - 1).bit_length(), 1)
+    order, seen = [], set()
+    for k in range(1 << bits):
+        reversed_k = int(format(k, f"0{bits}b")[::-1], 2)
+        # Every index is hit at least once, since 2**bits >= n
+        index = n * reversed_k >> bits
+        if index not in seen:
+            seen.add(index)
+            order.append(index)
+    return order
+
+
+def _vote(predictions: List[Tuple[str, float]]) -> Tuple[float, float]:
+    ai_score = sum(score for label, score in predictions if "ai" in label)
+    human_score = sum(score for label, score in predictions if "human" in label)
+    return ai_score, human_score
+
+
+def _is_decided(predictions: List[Tuple[str, float]], remaining: int) -> bool:
+    ai_score, human_score = _vote(predictions)
+    # Ties go to AI, so AI keeps the vote if it leads by at least the remaining chunks
+    if ai_score - human_score >= remaining or human_score - ai_score > remaining:
+        return True
+    margin = settings.AI_DETECTOR_EARLY_EXIT_MARGIN
+    total = ai_score + human_score
+    return bool(
+        margin
+        and total
+        and len(predictions) >= settings.AI_DETECTOR_EARLY_EXIT_MIN_CHUNKS
+        and abs(ai_score - human_score) / total >= margin
+    )
+
+
+def detect_ai_generated(text: str) -> dict:
+    """
+    Classify one text, sharing padded batches with concurrent requests.
+
+    Args:
+        text (str): The text to classify.
+
+    Returns:
+        dict: The result of `detect_ai_generated_batch` for the text.
+    """
+    return detect_ai_generated_many([text])[0]
+
+
+def detect_ai_generated_many(texts: List[str]) -> List[dict]:
+    """
+    Classify texts through the cross-request batcher.
+
+    Every text is queued on the background batcher, which coalesces the texts of all
+    concurrent requests into shared batches.
+
+    Args:
+        texts (List[str]): The texts to classify.
+
+    Results of texts seen before are served from the result cache without queuing.
+
+    Returns:
+        List[dict]: The result of `detect_ai_generated_batch` for every text.
+    """
+    if _detection_cache is None:
+        return _detect_uncached(texts)
+
+    results = _detection_cache.get_results(texts)
+    missing = [i for i, result in enumerate(results) if result is None]
+    if missing:
+        detected = _detect_uncached([texts[i] for i in missing])
+        for i, result in zip(missing, detected):
+            results[i] = result
+        _detection_cache.set_results([texts[i] for i in missing], detected)
+    return results
+
+
+def get_cache_stats() -> dict:
+    """
+    Returns hit rates of the AI detection result cache.
+
+    Returns:
+        dict: Metrics of the document and chunk tiers, or an empty dict if the cache is
+            disabled.
+    """
+    return _detection_cache.stats() if _detection_cache is not None else {}
+
+
+def _detect_uncached(texts: List[str]) -> List[dict]:
+    if _batcher.max_batch_size <= 1:
+        return detect_ai_generated_batch(texts)
+    futures = [_batcher.submit(text) for text in texts]
+    return [future.result() for future in futures]
+
+
+def _token_budget_batches(
+    order: List[int], sequences: List[List[int]]
+) -> Iterator[List[int]]:
+    # Sequences come sorted by length, so the last one added is the longest of a batch
+    batch: List[int] = []
+    for i in order:
+        if (
+            batch
+            and (len(batch) + 1) * len(sequences[i])
+            > settings.AI_DETECTOR_MAX_BATCH_TOKENS
+        ):
+            yield batch
+            batch = []
+        batch.append(i)
+    if batch:
+        yield batch
+
+
+def _special_tokens() -> Tuple[List[int], List[int]]:
+    # The special tokens the tokenizer puts before and after a single sequence
+    ids = _tokenizer.encode("a", add_special_tokens=False)
+    with_special_tokens = _tokenizer.encode("a", add_special_tokens=True)
+    for i in range(len(with_special_tokens) - len(ids) + 1):
+        if with_special_tokens[i : i + len(ids)] == ids:
+            return with_special_tokens[:i], with_special_tokens[i + len(ids) :]
+    return [], []
+
+
+def _pad(sequences: List[List[int]]) -> dict:
+    length = max(len(sequence) for sequence in sequences)
+    input_ids = torch.full((len(sequences), length), _tokenizer.pad_token_id)
+    attention_mask = torch.zeros((len(sequences), length), dtype=torch.long)
+    for i, sequence in enumerate(sequences):
+        input_ids[i, : len(sequence)] = torch.tensor(sequence)
+        attention_mask[i, : len(sequence)] = 1
+    return {
+        "input_ids": input_ids.to(_model.device),
+        "attention_mask": attention_mask.to(_model.device),
+    }
 
 
 def is_ai_generated(text: str) -> bool:
@@ -92,29 +512,12 @@ def is_ai_generated(text: str) -> bool:
     Returns:
         bool: True if the text is likely AI-generated, False otherwise.
     """
-    load_model()  # load the model once if it hasn't loaded already
+    return detect_ai_generated(text)["ai_generated"]
 
-    predictions = []
-    for chunk in chunk_text(text, max_tokens=_tokenizer.model_max_length):
-        inputs = _tokenizer(
-            chunk,
-            return_tensors="pt",
-            truncation=True,
-            max_length=_tokenizer.model_max_length,
-        ).to(_pipe.device)
 
-        with torch.no_grad():
-            outputs = _pipe.model(**inputs)
-            probs = torch.nn.functional.softmax(outputs.logits, dim=-1)[0]
-            label_id = torch.argmax(probs).item()
-            label = _pipe.model.config.id2label[label_id].lower()
-            score = probs[label_id].item()
-
-        predictions.append((label, score))
-        logging.info(f"Chunk: {chunk[:100]}... → {label} ({score:.2f})")
-
-    # Combine results: majority voting weighted by confidence
-    ai_score = sum(score for label, score in predictions if "ai" in label)
-    human_score = sum(score for label, score in predictions if "human" in label)
-
-    return ai_score >= human_score
+_batcher = MicroBatcher(
+    detect_ai_generated_batch,
+    max_batch_size=settings.AI_DETECTOR_MAX_BATCH_SIZE,
+    max_wait_ms=settings.AI_DETECTOR_MAX_WAIT_MS,
+    name="ai-detector-batcher",
+)
@@ -0,0 +1,143 @@
+import threading
+from contextlib import contextmanager
+from typing import Dict, Iterator, Optional
+
+ASSISTED_DECODING_MODES = ("off", "draft", "prompt_lookup")
+
+
+class AssistedDecodingStats:
+    """
+    Collects acceptance statistics of assisted (speculative) generation.
+
+    Every verification round of assisted generation runs one forward pass of the target
+    model, which accepts some of the proposed candidate tokens and adds one token of its
+    own. So the number of accepted candidates is the number of new tokens minus the
+    number of target forward passes. With a draft model, every forward pass of the draft
+    model proposes one candidate token, which gives the acceptance rate. Prompt lookup
+    proposes candidates without a model, so only tokens per target forward is reported.
+
+    Forward passes are counted with forward hooks, which attribute every pass to the
+    generation running on the calling thread, so concurrent generations are measured
+    apart without waiting for each other. The hooks are shared by the generations in
+    flight and removed once the last of them finished.
+    """
+
+    def __init__(self):
+        self.generations = 0
+        self.new_tokens = 0
+        self.target_forwards = 0
+        self.draft_forwards = 0
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        # id of a hooked model -> [hook handle, generations using it]
+        self._hooks: Dict[int, list] = {}
+
+    @contextmanager
+    def measure(self, model, draft_model=None) -> Iterator["_Measurement"]:
+        """
+        Count forward passes of the target and draft models during one generation.
+
+        The generation must run on the thread that entered the context.
+
+        Args:
+            model: The target model.
+            draft_model: The draft model, if any.
+
+        Yields:
+            _Measurement: Call `record(new_tokens)` on it once the generation finished.
+        """
+        measurement = _Measurement()
+        counted = [(model, "target_forwards")]
+        if draft_model is not None:
+            counted.append((draft_model, "draft_forwards"))
+        with self._lock:
+            for module, counter in counted:
+                self._acquire_hook(module, counter)
+        self._local.measurement = measurement
+        try:
+            yield measurement
+        finally:
+            self._local.measurement = None
+            with self._lock:
+                for module, _ in counted:
+                    self._release_hook(module)
+                self.generations += 1
+                self.new_tokens += measurement.new_tokens
+                self.target_forwards += measurement.target_forwards
+                self.draft_forwards += measurement.draft_forwards
+
+    def stats(self) -> dict:
+        """Return totals, accepted tokens, tokens per target forward and acceptance rate."""
+        accepted = max(self.new_tokens - self.target_forwards, 0)
+        return {
+            "generations": self.generations,
+            "new_tokens": self.new_tokens,
+            "target_forwards": self.target_forwards,
+            "accepted_tokens": accepted,
+            "tokens_per_target_forward": (
+                self.new_tokens / self.target_forwards if self.target_forwards else None
+            ),
+            "acceptance_rate": (
+                accepted / self.draft_forwards if self.draft_forwards else None
+            ),
+        }
+
+    def _acquire_hook(self, module, counter: str) -> None:
+        entry = self._hooks.get(id(module))
+        if entry is not None:
+            entry[1] += 1
+            return
+
+        def count(module, args, output) -> None:
+            measurement = getattr(self._local, "measurement", None)
+            if measurement is not None:
+                setattr(measurement, counter, getattr(measurement, counter) + 1)
+
+        self._hooks[id(module)] = [module.register_forward_hook(count), 1]
+
+    def _release_hook(self, module) -> None:
+        entry = self._hooks[id(module)]
+        entry[1] -= 1
+        if entry[1] == 0:
+            entry[0].remove()
+            del self._hooks[id(module)]
+
+
+class _Measurement:
+    def __init__(self):
+        self.new_tokens = 0
+        self.target_forwards = 0
+        self.draft_forwards = 0
+
+    def record(self, new_tokens: int) -> None:
+        self.new_tokens = new_tokens
+
+
+def assisted_generate_kwargs(
+    mode: str, draft_model=None, prompt_lookup_num_tokens: Optional[int] = None
+) -> dict:
+    """
+    Build the `generate` arguments that enable an assisted decoding mode.
+
+    Args:
+        mode (str): One of "off", "draft" or "prompt_lookup".
+        draft_model: The draft model, required for the "draft" mode.
+        prompt_lookup_num_tokens (Optional[int]): Number of tokens copied from the prompt
+            per candidate, used by the "prompt_lookup" mode.
+
+    Returns:
+        dict: Keyword arguments for `model.generate`; empty when assisted decoding is off.
+    """
+    if mode not in ASSISTED_DECODING_MODES:
+        raise ValueError(
+            f"Unknown assisted decoding mode {mode!r}, expected one of {ASSISTED_DECODING_MODES}"
+        )
+    if mode == "draft":
+        if draft_model is None:
+            raise ValueError(
+                "The 'draft' assisted decoding mode requires a draft model"
+            )
+        return {"assistant_model": draft_model}
+    if mode == "prompt_lookup":
+        return {"prompt_lookup_num_tokens": prompt_lookup_num_tokens or 10}
+    return {}
@@ -0,0 +1,139 @@
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable, Generic, List, Optional, Tuple, TypeVar
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+logger = logging.getLogger(__name__)
+
+
+class MicroBatcher(Generic[T, R]):
+    """
+    Collects items submitted concurrently and processes them together as one batch.
+
+    A single background thread waits for the first pending item, then keeps collecting
+    items until either `max_batch_size` items are pending or `max_wait_ms` milliseconds
+    have passed. The whole batch is handed to `process_batch`, and each caller receives
+    its own result through the `Future` returned by `submit()`.
+
+    Args:
+        process_batch (Callable[[List[T]], List[R]]): Function that processes a list of
+            items and returns one result per item, in the same order.
+        max_batch_size (int): Maximum number of items processed in one batch.
+        max_wait_ms (float): Maximum time to wait for more items once the first one arrived.
+        name (str): Name of the background thread, used in logs.
+    """
+
+    def __init__(
+        self,
+        process_batch: Callable[[List[T]], List[R]],
+        max_batch_size: int = 8,
+        max_wait_ms: float = 10.0,
+        name: str = "micro-batcher",
+    ):
+        if max_batch_size < 1:
+            raise ValueError("max_batch_size must be at least 1")
+        self.process_batch = process_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait_ms = max_wait_ms
+        self.name = name
+        self._queue: "queue.Queue[Tuple[T, Future]]" = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._stopped = False
+
+    def submit(self, item: T) -> Future:
+        """
+        Enqueue an item for the next batch.
+
+        Args:
+            item (T): The item to process.
+
+        Returns:
+            Future: A future that resolves to the result for this item.
+        """
+        if self._stopped:
+            raise RuntimeError(f"{self.name} has been shut down")
+        self._ensure_started()
+        future: Future = Future()
+        self._queue.put((item, future))
+        return future
+
+    def __call__(self, item: T, timeout: Optional[float] = None) -> R:
+        """Submit an item and block until its result is available."""
+        return self.submit(item).result(timeout=timeout)
+
+    def shutdown(self) -> None:
+        """Stop the background thread after the pending batch has been processed."""
+        self._stopped = True
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join()
+            self._thread = None
+
+    def _ensure_started(self) -> None:
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name=self.name, daemon=True
+                )
+                self._thread.start()
+
+    def _collect_batch(self) -> List[Tuple[T, Future]]:
+        first = self._queue.get()
+        if first is None:
+            return []
+        batch = [first]
+        deadline = time.monotonic() + self.max_wait_ms / 1000
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                entry = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if entry is None:
+                self._stopped = True
+                break
+            batch.append(entry)
+        return batch
+
+    def _run(self) -> None:
+        while True:
+            batch = self._collect_batch()
+            if not batch:
+                return
+            # Skip callers that gave up (e.g. cancelled futures) before processing
+            batch = [
+                (item, fut) for item, fut in batch if fut.set_running_or_notify_cancel()
+            ]
+            if batch:
+                self._process(batch)
+            if self._stopped and self._queue.empty():
+                return
+
+    def _process(self, batch: List[Tuple[T, Future]]) -> None:
+        items = [item for item, _ in batch]
+        start = time.perf_counter()
+        try:
+            results = self.process_batch(items)
+            if len(results) != len(items):
+                raise RuntimeError(
+                    f"{self.name}: expected {len(items)} results, got {len(results)}"
+                )
+        except Exception as e:
+            logger.error(f"{self.name}: batch of {len(items)} failed: {e}")
+            for _, fut in batch:
+                fut.set_exception(e)
+            return
+
+        logger.info(
+            f"{self.name}: processed batch of {len(items)} in {time.perf_counter() - start:.3f}s"
+        )
+        for (_, fut), result in zip(batch, results):
+            fut.set_result(result)
@@ -0,0 +1,145 @@
+import hashlib
+import re
+import threading
+import unicodedata
+from typing import List, Optional, Tuple
+
+from app.core.cache import LRUCache, RedisCache, TieredCache
+
+
+def normalize_text(text: str) -> str:
+    """Apply Unicode NFC normalization, collapse whitespace and strip the text."""
+    return re.sub(r"\s+", " ", unicodedata.normalize("NFC", text)).strip()
+
+
+def text_key(text: str) -> str:
+    """Return the content hash of the normalized text."""
+    return hashlib.sha256(normalize_text(text).encode("utf-8")).hexdigest()
+
+
+def chunk_key(token_ids: List[int]) -> str:
+    """Return the content hash of a chunk's token IDs."""
+    return hashlib.sha256(",".join(map(str, token_ids)).encode("ascii")).hexdigest()
+
+
+class AIDetectionCache:
+    """
+    Content-hash cache of AI detection results, per document and per chunk.
+
+    Document results are keyed on the hash of the normalized text, so resubmitting a text
+    with different whitespace is still a hit. Chunk predictions are keyed on the hash of
+    the chunk's token IDs, so documents that share whole chunks, like revisions of the
+    same text, classify the shared chunks once. Both tiers live in an in-process LRU,
+    optionally backed by Redis.
+
+    Every key is namespaced by the model ID. Document keys also carry a `variant` that
+    describes settings that change a document result but not a chunk prediction, like
+    the chunk stride.
+
+    Args:
+        model_id (str): Identifier of the model that produces the cached results.
+        variant (str): Settings that change document results.
+        max_entries (int): Size of the in-process document tier.
+        chunk_max_entries (int): Size of the in-process chunk tier.
+        ttl_seconds (Optional[int]): Time-to-live of the entries.
+        use_redis (bool): Whether to share entries through Redis.
+    """
+
+    def __init__(
+        self,
+        model_id: str,
+        variant: str = "",
+        max_entries: int = 4096,
+        chunk_max_entries: int = 16384,
+        ttl_seconds: Optional[int] = None,
+        use_redis: bool = False,
+    ):
+        self.model_id = model_id
+        self.variant = variant
+        self.documents = TieredCache(
+            LRUCache(max_entries=max_entries, ttl_seconds=ttl_seconds),
+            (
+                RedisCache("ai_detector:doc:", ttl_seconds=ttl_seconds)
+                if use_redis
+                else None
+            ),
+        )
+        self.chunks = TieredCache(
+            LRUCache(max_entries=chunk_max_entries, ttl_seconds=ttl_seconds),
+            (
+                RedisCache("ai_detector:chunk:", ttl_seconds=ttl_seconds)
+                if use_redis
+                else None
+            ),
+        )
+        self.document_hits = 0
+        self.document_lookups = 0
+        self.chunk_hits = 0
+        self.chunk_lookups = 0
+        self._lock = threading.Lock()
+
+    def get_results(self, texts: List[str]) -> List[Optional[dict]]:
+        """Return the cached result, or None, for every text."""
+        results = self.documents.get_many([self._document_key(text) for text in texts])
+        with self._lock:
+            self.document_lookups += len(texts)
+            self.document_hits += sum(result is not None for result in results)
+        return results
+
+    def set_results(self, texts: List[str], results: List[dict]) -> None:
+        """Store the detection results of several texts."""
+        self.documents.set_many(
+            {self._document_key(text): result for text, result in zip(texts, results)}
+        )
+
+    def get_chunks(self, chunks: List[List[int]]) -> List[Optional[Tuple[str, float]]]:
+        """Return the cached prediction, or None, for every chunk."""
+        predictions = self.chunks.get_many([self._chunk_key(chunk) for chunk in chunks])
+        with self._lock:
+            self.chunk_lookups += len(chunks)
+            self.chunk_hits += sum(p is not None for p in predictions)
+        return [tuple(p) if p is not None else None for p in predictions]
+
+    def set_chunks(
+        self, chunks: List[List[int]], predictions: List[Tuple[str, float]]
+    ) -> None:
+        """Store the predictions of several chunks."""
+        self.chunks.set_many(
+            {
+                self._chunk_key(chunk): list(prediction)
+                for chunk, prediction in zip(chunks, predictions)
+            }
+        )
+
+    def clear(self) -> None:
+        """Drop every in-process entry."""
+        self.documents.clear()
+        self.chunks.clear()
+
+    def stats(self) -> dict:
+        """Return hit rates of the document and chunk tiers and the metrics of every tier."""
+        return {
+            "model_id": self.model_id,
+            "documents": {
+                "lookups": self.document_lookups,
+                "hits": self.document_hits,
+                "hit_rate": _rate(self.document_hits, self.document_lookups),
+                **self.documents.stats(),
+            },
+            "chunks": {
+                "lookups": self.chunk_lookups,
+                "hits": self.chunk_hits,
+                "hit_rate": _rate(self.chunk_hits, self.chunk_lookups),
+                **self.chunks.stats(),
+            },
+        }
+
+    def _document_key(self, text: str) -> str:
+        return f"{self.model_id}:{self.variant}:{text_key(text)}"
+
+    def _chunk_key(self, chunk: List[int]) -> str:
+        return f"{self.model_id}:{chunk_key(chunk)}"
+
+
+def _rate(hits: int, lookups: int) -> Optional[float]:
+    return hits / lookups if lookups else None
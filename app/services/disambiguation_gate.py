@@ -0,0 +1,196 @@
+import re
+import threading
+from collections import Counter
+from typing import Callable, List, NamedTuple, Optional
+
+import torch
+from transformers import AutoTokenizer
+
+from app.core.config import settings
+from app.core.model_registry import model_registry
+from app.retrieval.lexical_index import tokenize
+from app.services.model_backends import load_sequence_classifier
+
+_WORD = re.compile(r"[a-z0-9]+")
+# First words of questions and requests that ask for something in the table
+QUESTION_STARTS = frozenset(
+    "what which who whom whose when where how why is are was were do does did can "
+    "could has have had list show give find count get return name tell display "
+    "select compare".split()
+)
+# Words that refer to something the question itself does not name
+VAGUE_WORDS = frozenset(
+    "it its this these those they them stuff thing things something anything "
+    "whatever etc".split()
+)
+# Words of requests and aggregations that no header is expected to cover
+FILLER_WORDS = frozenset(
+    "whom whose why do does did can could has have had list show give find count get "
+    "return tell display select compare me all any many much number total each every "
+    "there please most least more less than highest lowest average sum per".split()
+)
+CLEAR = "clear"
+
+
+class GateDecision(NamedTuple):
+    """Whether a question is sent to the LLM for disambiguation, and why."""
+
+    needs_disambiguation: bool
+    reason: str
+    header_matches: int
+    coverage: float
+
+
+class DisambiguationGate:
+    """
+    Cheap check whether a question needs LLM disambiguation before SQL generation.
+
+    A question is considered clear, and skips the LLM, if it reads like a question or
+    request, does not refer to things it does not name, names at least
+    `min_header_matches` of the retrieved headers verbatim, and at least `min_coverage`
+    of its words occur in the retrieved headers. Numbers, which are usually values, and
+    words like "show" or "most", which no header names, are left out of the coverage.
+    Clear questions can then be scored by an optional classifier, which sends them to
+    the LLM if their probability of being ambiguous reaches `classifier_threshold`.
+
+    Args:
+        min_header_matches (int): Headers whose words must all occur in the question.
+        min_coverage (float): Share of the question's words found in the headers.
+        max_words (int): Longer questions are always disambiguated.
+        classifier (Optional[Callable[[str], float]]): Returns the probability that a
+            question is ambiguous.
+        classifier_threshold (float): Probability from which the classifier sends a
+            question to the LLM.
+    """
+
+    def __init__(
+        self,
+        min_header_matches: int = 1,
+        min_coverage: float = 0.25,
+        max_words: int = 40,
+        classifier: Optional[Callable[[str], float]] = None,
+        classifier_threshold: float = 0.5,
+    ):
+        self.min_header_matches = min_header_matches
+        self.min_coverage = min_coverage
+        self.max_words = max_words
+        self.classifier = classifier
+        self.classifier_threshold = classifier_threshold
+        self.reasons: Counter = Counter()
+        self._lock = threading.Lock()
+
+    def check(self, question: str, headers: List[str]) -> GateDecision:
+        """
+        Decide whether a question needs disambiguation.
+
+        Args:
+            question (str): The user input or question.
+            headers (List[str]): The headers retrieved for the question.
+
+        Returns:
+            GateDecision: The decision and the header match statistics behind it.
+        """
+        decision = self._decide(question, headers)
+        with self._lock:
+            self.reasons[decision.reason] += 1
+        return decision
+
+    def stats(self) -> dict:
+        """Return how many questions were checked and skipped, and why the rest were not."""
+        with self._lock:
+            reasons = dict(self.reasons)
+        checked = sum(reasons.values())
+        skipped = reasons.get(CLEAR, 0)
+        return {
+            "checked": checked,
+            "skipped": skipped,
+            "disambiguated": checked - skipped,
+            "skip_rate": skipped / checked if checked else None,
+            "reasons": reasons,
+        }
+
+    def _decide(self, question: str, headers: List[str]) -> GateDecision:
+        words = _WORD.findall(question.lower())
+        if not words:
+            return GateDecision(True, "empty", 0, 0.0)
+        if len(words) > self.max_words:
+            return GateDecision(True, "too_long", 0, 0.0)
+
+        question_words = {_stem(word) for word in tokenize(question)}
+        header_words = [{_stem(word) for word in tokenize(h)} for h in headers]
+        matches = sum(
+            1 for header in header_words if header and header <= question_words
+        )
+        known = set().union(*header_words) if header_words else set()
+        content = [
+            word
+            for word in question_words
+            if not word.isdigit() and word not in FILLER_WORDS
+        ]
+        coverage = (
+            sum(word in known for word in content) / len(content) if content else 0.0
+        )
+
+        if words[0] not in QUESTION_STARTS and not question.rstrip().endswith("?"):
+            return GateDecision(True, "no_question_form", matches, coverage)
+        if VAGUE_WORDS.intersection(words):
+            return GateDecision(True, "vague_reference", matches, coverage)
+        if matches < self.min_header_matches:
+            return GateDecision(True, "no_header_match", matches, coverage)
+        if coverage < self.min_coverage:
+            return GateDecision(True, "low_coverage", matches, coverage)
+        if (
+            self.classifier is not None
+            and self.classifier(question) >= self.classifier_threshold
+        ):
+            return GateDecision(True, "classifier", matches, coverage)
+        return GateDecision(False, CLEAR, matches, coverage)
+
+
+def _stem(word: str) -> str:
+    # Plural headers ("Goals") match singular questions ("most goal") and back
+    if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+        return word[:-1]
+    return word
+
+
+def _load_classifier() -> dict:
+    path = settings.PREPROCESS_GATE_CLASSIFIER_PATH
+    return {
+        "tokenizer": AutoTokenizer.from_pretrained(path),
+        "model": load_sequence_classifier(path),
+    }
+
+
+def ambiguity_probability(question: str) -> float:
+    """
+    Probability that a question is ambiguous, from the classifier at
+    `settings.PREPROCESS_GATE_CLASSIFIER_PATH`.
+
+    The classifier is a sequence classification model with an "ambiguous" label, or
+    with the ambiguous class at index 1 if it has no such label.
+    """
+    with model_registry.use("disambiguation_gate"):
+        loaded = model_registry.get("disambiguation_gate")
+        tokenizer, model = loaded["tokenizer"], loaded["model"]
+        inputs = tokenizer(
+            question, return_tensors="pt", truncation=True, max_length=128
+        ).to(model.device)
+        with torch.no_grad():
+            probabilities = torch.softmax(model(**inputs).logits[0].float(), dim=-1)
+    labels = {label.lower(): id_ for id_, label in model.config.id2label.items()}
+    return probabilities[labels.get("ambiguous", 1)].item()
+
+
+if settings.PREPROCESS_GATE_CLASSIFIER_PATH:
+    model_registry.register("disambiguation_gate", _load_classifier)
+
+disambiguation_gate = DisambiguationGate(
+    min_header_matches=settings.PREPROCESS_GATE_MIN_HEADER_MATCHES,
+    min_coverage=settings.PREPROCESS_GATE_MIN_COVERAGE,
+    max_words=settings.PREPROCESS_GATE_MAX_WORDS,
+    classifier=(
+        ambiguity_probability if settings.PREPROCESS_GATE_CLASSIFIER_PATH else None
+    ),
+    classifier_threshold=settings.PREPROCESS_GATE_CLASSIFIER_THRESHOLD,
+)
@@ -0,0 +1,185 @@
+import asyncio
+import logging
+from typing import Callable, List, Optional, Tuple
+
+from app.core.config import settings
+from app.core.dependencies import create_async_redis_client
+
+logger = logging.getLogger(__name__)
+
+# Values per RPUSH command of a flush
+_RPUSH_CHUNK = 1000
+
+
+class FeedbackWriter:
+    """
+    Pushes feedback events onto the Redis feedback queue with a shared async client.
+
+    By default every event is pushed with its own `RPUSH`. In buffered mode, events of
+    concurrent requests are collected and written together: a batch is flushed as one
+    pipelined round trip once it holds `max_batch_size` events, or `flush_interval_ms`
+    after its first event. `push` returns once its batch is written, so a request only
+    reports success for feedback that reached Redis, and a failed flush fails every
+    request of the batch.
+
+    The client is created on first use, or by `start` at startup, and recreated if the
+    event loop changes, since its connections are bound to the loop.
+
+    Args:
+        client_factory (Callable): Function returning an async Redis client.
+        queue (str): Name of the Redis list.
+        buffered (bool): Whether to group events into pipelined batches.
+        max_batch_size (int): Events that trigger a flush.
+        flush_interval_ms (float): Longest time an event waits for its batch.
+    """
+
+    def __init__(
+        self,
+        client_factory: Callable = create_async_redis_client,
+        queue: str = "feedback_queue",
+        buffered: bool = False,
+        max_batch_size: int = 500,
+        flush_interval_ms: float = 20.0,
+    ):
+        self.client_factory = client_factory
+        self.queue = queue
+        self.buffered = buffered
+        self.max_batch_size = max_batch_size
+        self.flush_interval_ms = flush_interval_ms
+        self.pushed = 0
+        self.failed = 0
+        self.flushes = 0
+        self._client = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._buffer: List[Tuple[str, asyncio.Future]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._flush_tasks = set()
+
+    async def start(self) -> None:
+        """Create the Redis client, so the first request does not pay for it."""
+        self._get_client()
+
+    async def push(self, event: str) -> None:
+        """
+        Append a serialized feedback event to the queue.
+
+        Raises:
+            redis.RedisError: If the event could not be written.
+        """
+        client = self._get_client()
+        if not self.buffered:
+            try:
+                await client.rpush(self.queue, event)
+            except Exception:
+                self.failed += 1
+                raise
+            self.pushed += 1
+            return
+
+        future = asyncio.get_running_loop().create_future()
+        self._buffer.append((event, future))
+        if len(self._buffer) >= self.max_batch_size:
+            await self.flush()
+        elif self._timer is None:
+            self._timer = self._loop.call_later(
+                self.flush_interval_ms / 1000, self._flush_in_background
+            )
+        await future
+
+    async def flush(self) -> None:
+        """Write the buffered events in one pipelined round trip."""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._buffer = self._buffer, []
+        if not batch:
+            return
+        events = [event for event, _ in batch]
+        try:
+            pipe = self._get_client().pipeline(transaction=False)
+            for start in range(0, len(events), _RPUSH_CHUNK):
+                pipe.rpush(self.queue, *events[start : start + _RPUSH_CHUNK])
+            await pipe.execute()
+        except Exception as e:
+            logger.error(f"Failed to write {len(batch)} feedback events: {e}")
+            self.failed += len(batch)
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        self.pushed += len(batch)
+        self.flushes += 1
+        for _, future in batch:
+            if not future.done():
+                future.set_result(None)
+
+    async def aclose(self) -> None:
+        """Flush the buffered events and close the client."""
+        await self.flush()
+        if self._flush_tasks:
+            await asyncio.gather(*self._flush_tasks, return_exceptions=True)
+        if self._client is not None:
+            await self._client.aclose()
+        self._client = None
+        self._loop = None
+
+    def stats(self) -> dict:
+        """Return the number of pushed and failed events and the mean batch size."""
+        return {
+            "buffered": self.buffered,
+            "pushed": self.pushed,
+            "failed": self.failed,
+            "flushes": self.flushes,
+            "mean_batch_size": self.pushed / self.flushes if self.flushes else None,
+            "pending": len(self._buffer),
+        }
+
+    def _flush_in_background(self) -> None:
+        self._timer = None
+        task = asyncio.ensure_future(self.flush())
+        # Keep a reference until the task is done, or it may be garbage collected
+        self._flush_tasks.add(task)
+        task.add_done_callback(self._flush_tasks.discard)
+
+    def _get_client(self):
+        loop = asyncio.get_running_loop()
+        if self._client is None or self._loop is not loop:
+            # Connections of a previous loop can not be reused, they are dropped with it.
+            # Events still buffered for that loop can not be flushed on it anymore, so
+            # their pushes fail instead of waiting forever.
+            self._fail_buffered(
+                RuntimeError("The event loop of the feedback writer changed")
+            )
+            self._client = self.client_factory()
+            self._loop = loop
+        return self._client
+
+    def _fail_buffered(self, error: Exception) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._buffer = self._buffer, []
+        if not batch:
+            return
+        logger.error(f"Dropping {len(batch)} buffered feedback events: {error}")
+        self.failed += len(batch)
+        for _, future in batch:
+            # Resolve the future on its own loop, which may be another thread's
+            try:
+                future.get_loop().call_soon_threadsafe(_set_exception, future, error)
+            except RuntimeError:
+                # The loop is closed, and nothing awaits the future anymore
+                pass
+
+
+def _set_exception(future: asyncio.Future, error: Exception) -> None:
+    if not future.done():
+        future.set_exception(error)
+
+
+feedback_writer = FeedbackWriter(
+    queue=settings.FEEDBACK_QUEUE,
+    buffered=settings.FEEDBACK_BUFFERED,
+    max_batch_size=settings.FEEDBACK_MAX_BATCH_SIZE,
+    flush_interval_ms=settings.FEEDBACK_FLUSH_INTERVAL_MS,
+)
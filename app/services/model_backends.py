@@ -0,0 +1,279 @@
+import hashlib
+import os
+import warnings
+from typing import Optional
+
+import numpy as np
+import torch
+from transformers import (
+    AutoConfig,
+    AutoModelForCausalLM,
+    AutoModelForSequenceClassification,
+    AutoTokenizer,
+)
+from transformers.modeling_outputs import SequenceClassifierOutput
+
+# "auto" loads the weights in the dtype they were saved in
+MODEL_BACKENDS = ("auto", "fp32", "bf16", "int8", "onnx")
+ONNX_MODEL_FILE = "model.onnx"
+# Files of a model directory that change what the model generates
+_MODEL_FILE_SUFFIXES = (".safetensors", ".bin", ".onnx", ".json")
+
+
+def check_backend(backend: str) -> None:
+    """Raise a ValueError if `backend` is not one of `MODEL_BACKENDS`."""
+    if backend not in MODEL_BACKENDS:
+        raise ValueError(
+            f"Unknown model backend {backend!r}, expected one of {MODEL_BACKENDS}"
+        )
+
+
+def load_sequence_classifier(
+    model_path: str, backend: str = "auto", onnx_path: Optional[str] = None
+):
+    """
+    Load a sequence classification model with the given inference backend.
+
+    Args:
+        model_path (str): Hugging Face model ID or local path of the model.
+        backend (str): One of `MODEL_BACKENDS`.
+        onnx_path (Optional[str]): Directory written by `export_sequence_classifier`,
+            required for the "onnx" backend.
+
+    Returns:
+        The model, in evaluation mode. The "onnx" backend returns an
+            `OnnxSequenceClassifier`, which is called like the PyTorch model.
+    """
+    check_backend(backend)
+    if backend == "onnx":
+        if not onnx_path:
+            raise ValueError(
+                "The 'onnx' backend requires the path of an exported model"
+            )
+        return OnnxSequenceClassifier.from_pretrained(onnx_path)
+    model = AutoModelForSequenceClassification.from_pretrained(
+        model_path, **_torch_load_kwargs(backend)
+    )
+    model.eval()
+    return quantize_int8(model) if backend == "int8" else model
+
+
+def load_causal_lm(
+    model_path: str, backend: str = "auto", onnx_path: Optional[str] = None, **kwargs
+):
+    """
+    Load a causal language model with the given inference backend.
+
+    The "onnx" backend needs `optimum[onnxruntime]` for generation with a KV cache, and
+    the "int8" backend quantizes for CPU, so the model is not dispatched to a GPU.
+
+    Args:
+        model_path (str): Hugging Face model ID or local path of the model.
+        backend (str): One of `MODEL_BACKENDS`.
+        onnx_path (Optional[str]): Directory written by `export_causal_lm`, required for
+            the "onnx" backend.
+        **kwargs: Further arguments of `from_pretrained`, like `device_map`.
+
+    Returns:
+        The model, in evaluation mode.
+    """
+    check_backend(backend)
+    if backend == "onnx":
+        if not onnx_path:
+            raise ValueError(
+                "The 'onnx' backend requires the path of an exported model"
+            )
+        return _ort_causal_lm_class().from_pretrained(onnx_path)
+    if backend == "int8":
+        kwargs.pop("device_map", None)
+    model = AutoModelForCausalLM.from_pretrained(
+        model_path, **_torch_load_kwargs(backend), **kwargs
+    )
+    model.eval()
+    return quantize_int8(model) if backend == "int8" else model
+
+
+def weights_fingerprint(model_dir: str) -> str:
+    """
+    Return a short fingerprint of the weights and config files of a local model.
+
+    The name, size and modification time of every file count, so replacing the weights
+    on disk changes the fingerprint without the weights being read.
+
+    Args:
+        model_dir (str): Directory of a model saved with `save_pretrained`.
+    """
+    digest = hashlib.sha1()
+    for name in sorted(os.listdir(model_dir)):
+        path = os.path.join(model_dir, name)
+        if name.endswith(_MODEL_FILE_SUFFIXES) and os.path.isfile(path):
+            stat = os.stat(path)
+            digest.update(f"{name}:{stat.st_size}:{stat.st_mtime_ns}\n".encode())
+    return digest.hexdigest()[:16]
+
+
+def quantize_int8(model: torch.nn.Module) -> torch.nn.Module:
+    """
+    Quantize the linear layers of a model to int8 with dynamic activation quantization.
+
+    Weights are stored as int8 and activations are quantized on the fly, which runs the
+    matrix multiplications of CPU inference in int8.
+    """
+    with warnings.catch_warnings():
+        # Eager mode quantization is deprecated in favour of torchao, which is not a
+        # dependency of this project
+        warnings.simplefilter("ignore")
+        from torch.ao.quantization import quantize_dynamic
+
+        return quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+
+def export_sequence_classifier(model_path: str, output_dir: str, opset: int = 17):
+    """
+    Export a sequence classification model to an ONNX graph with dynamic batch and length.
+
+    The config and tokenizer are saved next to the graph, so `output_dir` can be loaded
+    with the "onnx" backend on its own.
+
+    Args:
+        model_path (str): Hugging Face model ID or local path of the model.
+        output_dir (str): Directory to write `model.onnx`, the config and tokenizer to.
+        opset (int): ONNX opset version.
+    """
+    model = AutoModelForSequenceClassification.from_pretrained(
+        model_path, dtype=torch.float32
+    )
+    model.eval()
+    tokenizer = AutoTokenizer.from_pretrained(model_path)
+    os.makedirs(output_dir, exist_ok=True)
+
+    dummy = tokenizer(
+        ["an example", "a longer example text"], return_tensors="pt", padding=True
+    )
+    torch.onnx.export(
+        _LogitsOnly(model),
+        (dummy["input_ids"], dummy["attention_mask"]),
+        os.path.join(output_dir, ONNX_MODEL_FILE),
+        input_names=["input_ids", "attention_mask"],
+        output_names=["logits"],
+        dynamic_axes={
+            "input_ids": {0: "batch", 1: "sequence"},
+            "attention_mask": {0: "batch", 1: "sequence"},
+            "logits": {0: "batch"},
+        },
+        opset_version=opset,
+        dynamo=False,
+    )
+    model.config.save_pretrained(output_dir)
+    tokenizer.save_pretrained(output_dir)
+
+
+def export_causal_lm(model_path: str, output_dir: str) -> None:
+    """
+    Export a causal language model to ONNX with KV cache inputs, using optimum.
+
+    Args:
+        model_path (str): Hugging Face model ID or local path of the model.
+        output_dir (str): Directory to write the ONNX model and tokenizer to.
+    """
+    model = _ort_causal_lm_class().from_pretrained(
+        model_path, export=True, trust_remote_code=True
+    )
+    model.save_pretrained(output_dir)
+    AutoTokenizer.from_pretrained(model_path, trust_remote_code=True).save_pretrained(
+        output_dir
+    )
+
+
+class OnnxSequenceClassifier:
+    """
+    Sequence classifier running an exported ONNX graph with ONNX Runtime on CPU.
+
+    It is called with `input_ids` and `attention_mask` tensors like the PyTorch model
+    and returns its logits as a `SequenceClassifierOutput`.
+
+    Args:
+        session: The ONNX Runtime inference session.
+        config: The config of the exported model, for `id2label`.
+        model_bytes (int): Size of the graph, reported as the resident size.
+    """
+
+    device = torch.device("cpu")
+
+    def __init__(self, session, config, model_bytes: int = 0):
+        self.session = session
+        self.config = config
+        self.model_bytes = model_bytes
+
+    @classmethod
+    def from_pretrained(
+        cls, path: str, num_threads: Optional[int] = None
+    ) -> "OnnxSequenceClassifier":
+        """Load a directory written by `export_sequence_classifier`."""
+        try:
+            import onnxruntime
+        except ImportError as e:
+            raise ImportError(
+                "The 'onnx' backend requires onnxruntime: pip install onnxruntime"
+            ) from e
+
+        options = onnxruntime.SessionOptions()
+        options.graph_optimization_level = (
+            onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        )
+        if num_threads:
+            options.intra_op_num_threads = num_threads
+        model_file = os.path.join(path, ONNX_MODEL_FILE)
+        session = onnxruntime.InferenceSession(
+            model_file, options, providers=["CPUExecutionProvider"]
+        )
+        return cls(
+            session, AutoConfig.from_pretrained(path), os.path.getsize(model_file)
+        )
+
+    def __call__(
+        self, input_ids: torch.Tensor, attention_mask: Optional[torch.Tensor] = None
+    ) -> SequenceClassifierOutput:
+        if attention_mask is None:
+            attention_mask = torch.ones_like(input_ids)
+        (logits,) = self.session.run(
+            ["logits"],
+            {
+                "input_ids": _to_int64(input_ids),
+                "attention_mask": _to_int64(attention_mask),
+            },
+        )
+        return SequenceClassifierOutput(logits=torch.from_numpy(logits))
+
+
+class _LogitsOnly(torch.nn.Module):
+    # Traces to a graph with positional inputs and a single output
+    def __init__(self, model: torch.nn.Module):
+        super().__init__()
+        self.model = model
+
+    def forward(self, input_ids, attention_mask):
+        return self.model(input_ids=input_ids, attention_mask=attention_mask).logits
+
+
+def _torch_load_kwargs(backend: str) -> dict:
+    if backend == "bf16":
+        return {"dtype": torch.bfloat16}
+    if backend in ("fp32", "int8"):
+        return {"dtype": torch.float32}
+    return {}
+
+
+def _ort_causal_lm_class():
+    try:
+        from optimum.onnxruntime import ORTModelForCausalLM
+    except ImportError as e:
+        raise ImportError(
+            "The 'onnx' backend of causal language models requires optimum: "
+            "pip install optimum[onnxruntime]"
+        ) from e
+    return ORTModelForCausalLM
+
+
+def _to_int64(tensor: torch.Tensor) -> np.ndarray:
+    return tensor.detach().cpu().numpy().astype(np.int64, copy=False)
@@ -0,0 +1,121 @@
+import threading
+import time
+from collections import Counter, defaultdict, deque
+from contextlib import contextmanager
+from typing import Deque, Dict, Iterator, List
+
+import numpy as np
+
+from app.retrieval.lexical_index import tokenize
+
+
+class PipelineTrace:
+    """
+    Per-stage timings of one request through a staged pipeline.
+
+    Stages are timed with `stage`; a stage that runs several times, or on several
+    questions of a batch, adds up. Stages that missed their deadline and notable events,
+    like cache hits, are recorded by name.
+    """
+
+    def __init__(self):
+        self.stages: Dict[str, float] = {}
+        self.timeouts: List[str] = []
+        self.events: List[str] = []
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        """Time the block as the stage `name`."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                self.stages[name] = self.stages.get(name, 0.0) + elapsed
+
+    def timed_out(self, name: str) -> None:
+        """Record that the stage `name` missed its deadline."""
+        with self._lock:
+            self.timeouts.append(name)
+
+    def note(self, event: str) -> None:
+        """Record an event of the request, like a cache hit."""
+        with self._lock:
+            self.events.append(event)
+
+    def server_timing(self) -> str:
+        """Format the stage timings as the value of a `Server-Timing` HTTP header."""
+        return ", ".join(
+            f"{name};dur={seconds * 1000:.1f}" for name, seconds in self.stages.items()
+        )
+
+    def to_dict(self) -> dict:
+        """Return the stage timings in milliseconds, the timeouts and the events."""
+        return {
+            "stages_ms": {
+                name: seconds * 1000 for name, seconds in self.stages.items()
+            },
+            "timeouts": list(self.timeouts),
+            "events": list(self.events),
+        }
+
+
+class PipelineStats:
+    """
+    Latency distribution of every stage over the most recent requests.
+
+    Args:
+        window (int): Number of recent timings kept per stage.
+    """
+
+    def __init__(self, window: int = 1024):
+        self.window = window
+        self.requests = 0
+        self._timings: Dict[str, Deque[float]] = defaultdict(
+            lambda: deque(maxlen=self.window)
+        )
+        self._timeouts: Counter = Counter()
+        self._events: Counter = Counter()
+        self._lock = threading.Lock()
+
+    def record(self, trace: PipelineTrace) -> None:
+        """Add the timings of a finished request."""
+        with self._lock:
+            self.requests += 1
+            for name, seconds in trace.stages.items():
+                self._timings[name].append(seconds)
+            self._timeouts.update(trace.timeouts)
+            self._events.update(trace.events)
+
+    def stats(self) -> dict:
+        """Return the count, mean, median, 95th percentile and maximum of every stage."""
+        with self._lock:
+            timings = {name: np.array(t) * 1000 for name, t in self._timings.items()}
+            timeouts, events = dict(self._timeouts), dict(self._events)
+            requests = self.requests
+        return {
+            "requests": requests,
+            "stages": {
+                name: {
+                    "count": len(ms),
+                    "mean_ms": float(ms.mean()),
+                    "p50_ms": float(np.percentile(ms, 50)),
+                    "p95_ms": float(np.percentile(ms, 95)),
+                    "max_ms": float(ms.max()),
+                }
+                for name, ms in timings.items()
+                if len(ms)
+            },
+            "timeouts": timeouts,
+            "events": events,
+        }
+
+
+def word_overlap(a: str, b: str) -> float:
+    """Jaccard similarity of the content words of two texts, from 0 to 1."""
+    words_a, words_b = set(tokenize(a)), set(tokenize(b))
+    if not words_a and not words_b:
+        return 1.0
+    return len(words_a & words_b) / len(words_a | words_b)
@@ -0,0 +1,173 @@
+import copy
+import logging
+import threading
+from collections import OrderedDict
+from typing import List, Tuple
+
+import torch
+from transformers import DynamicCache
+
+logger = logging.getLogger(__name__)
+
+
+class PromptPrefixCache:
+    """
+    Keeps the KV cache (past_key_values) of prompt prefixes so that prefill only has to
+    cover the tokens that follow them.
+
+    The static prefix (e.g. the instruction block of the prompt template) is encoded once
+    when the cache is created and is never evicted. Longer prefixes that extend it, such
+    as the instruction block plus a recurring table schema, are computed on top of the
+    static prefix and kept in an LRU of at most `max_entries` entries.
+
+    Args:
+        model: The causal language model.
+        tokenizer: The model's tokenizer.
+        static_prefix (str): Text every prompt starts with.
+        max_entries (int): Maximum number of extended prefixes kept in memory.
+    """
+
+    def __init__(self, model, tokenizer, static_prefix: str, max_entries: int = 16):
+        self.model = model
+        self.tokenizer = tokenizer
+        self.static_prefix = static_prefix
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[str, Tuple[torch.Tensor, DynamicCache]]" = (
+            OrderedDict()
+        )
+        self._lock = threading.Lock()
+        static_ids = self._encode(static_prefix, add_special_tokens=True)
+        self._static_entry = (static_ids, self._prefill(static_ids, None))
+
+    def get(self, prefix: str) -> Tuple[torch.Tensor, DynamicCache]:
+        """
+        Return the token ids and KV cache for a prefix, computing them if needed.
+
+        Args:
+            prefix (str): The prefix text. It must start with the static prefix.
+
+        Returns:
+            Tuple[torch.Tensor, DynamicCache]: The prefix token ids of shape (1, n) and the
+                KV cache for them. The cache must not be modified; use a copy for generation.
+        """
+        if prefix == self.static_prefix:
+            return self._static_entry
+        if not prefix.startswith(self.static_prefix):
+            raise ValueError("Prefix does not start with the static prefix")
+
+        with self._lock:
+            entry = self._entries.get(prefix)
+            if entry is not None:
+                self._entries.move_to_end(prefix)
+                self.hits += 1
+                return entry
+            self.misses += 1
+
+        static_ids, static_cache = self._static_entry
+        extra_ids = self._encode(prefix[len(self.static_prefix) :])
+        cache = self._prefill(extra_ids, copy.deepcopy(static_cache))
+        entry = (torch.cat([static_ids, extra_ids], dim=-1), cache)
+
+        with self._lock:
+            self._entries[prefix] = entry
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return entry
+
+    def prepare(self, prompts: List[Tuple[str, str]]) -> dict:
+        """
+        Build `generate` inputs for prompts split into a cacheable prefix and a suffix.
+
+        If every prompt in the batch shares the same prefix, its cached KV values are reused.
+        Otherwise only the static prefix is reused and the rest of each prefix is prefilled
+        together with the suffix.
+
+        Args:
+            prompts (List[Tuple[str, str]]): (prefix, suffix) pairs.
+
+        Returns:
+            dict: `input_ids`, `attention_mask` and `past_key_values` for `model.generate`.
+                The prompt length is `input_ids.shape[-1]`.
+        """
+        prefixes = {prefix for prefix, _ in prompts}
+        if len(prefixes) == 1:
+            prefix = prefixes.pop()
+            suffixes = [suffix for _, suffix in prompts]
+        else:
+            prefix = self.static_prefix
+            suffixes = [p[len(self.static_prefix) :] + suffix for p, suffix in prompts]
+
+        prefix_ids, prefix_cache = self.get(prefix)
+        batch_size = len(suffixes)
+        encoded = self.tokenizer(
+            suffixes, return_tensors="pt", padding=True, add_special_tokens=False
+        )
+        # Suffixes are left-padded, so padding ends up between the prefix and the suffix.
+        # The attention mask hides it and position ids are derived from the mask, so every
+        # sequence still continues right where its prefix ended.
+        input_ids = torch.cat(
+            [prefix_ids.expand(batch_size, -1), encoded["input_ids"]], dim=-1
+        )
+        attention_mask = torch.cat(
+            [
+                torch.ones(batch_size, prefix_ids.shape[-1], dtype=torch.long),
+                encoded["attention_mask"],
+            ],
+            dim=-1,
+        )
+        past_key_values = copy.deepcopy(prefix_cache)
+        if batch_size > 1:
+            past_key_values.batch_repeat_interleave(batch_size)
+        return {
+            "input_ids": input_ids.to(self.model.device),
+            "attention_mask": attention_mask.to(self.model.device),
+            "past_key_values": past_key_values,
+        }
+
+    def generate(self, prompts: List[Tuple[str, str]], **generate_kwargs) -> List[str]:
+        """
+        Generate continuations for prompts split into a cacheable prefix and a suffix.
+
+        Args:
+            prompts (List[Tuple[str, str]]): (prefix, suffix) pairs.
+            **generate_kwargs: Extra arguments passed to `model.generate`.
+
+        Returns:
+            List[str]: The generated text for each prompt, without the prompt.
+        """
+        inputs = self.prepare(prompts)
+        with torch.no_grad():
+            outputs = self.model.generate(
+                **inputs, pad_token_id=self.tokenizer.pad_token_id, **generate_kwargs
+            )
+        return self.tokenizer.batch_decode(
+            outputs[:, inputs["input_ids"].shape[-1] :], skip_special_tokens=True
+        )
+
+    def stats(self) -> dict:
+        """Return cache hit/miss counters and the number of cached prefixes."""
+        return {
+            "static_prefix_tokens": self._static_entry[0].shape[-1],
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+    def _encode(self, text: str, add_special_tokens: bool = False) -> torch.Tensor:
+        return self.tokenizer(
+            text, return_tensors="pt", add_special_tokens=add_special_tokens
+        )["input_ids"]
+
+    def _prefill(self, input_ids: torch.Tensor, cache) -> DynamicCache:
+        if cache is None:
+            cache = DynamicCache()
+        with torch.no_grad():
+            outputs = self.model(
+                input_ids=input_ids.to(self.model.device),
+                past_key_values=cache,
+                use_cache=True,
+            )
+        logger.info(f"Prefilled {input_ids.shape[-1]} prefix tokens.")
+        return outputs.past_key_values
@@ -0,0 +1,245 @@
+import hashlib
+import re
+import threading
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from app.core.cache import LRUCache, RedisCache, TieredCache
+
+
+def normalize_question(question: str) -> str:
+    """
+    Collapse whitespace and drop trailing punctuation.
+
+    Case is kept: it can be part of a value ("players named Smith"), and the SQL
+    generated for one casing is not right for another.
+    """
+    question = re.sub(r"\s+", " ", question.strip())
+    return question.rstrip(" ?.!")
+
+
+# Quoted strings and numbers, matched before the words of a question
+_QUOTED_OR_NUMBER = re.compile(r"'[^']*'|\"[^\"]*\"|\d+(?:[.,]\d+)*")
+
+
+def question_literals(question: str) -> Tuple[str, ...]:
+    """
+    Return the values a question names: quoted strings, numbers and capitalized words.
+
+    The first word is not counted, since it is capitalized at the start of a sentence.
+    Paraphrases naming different values embed almost the same ("older than 30" and
+    "older than 31"), and the embedding model lowercases its input, so the semantic
+    tier compares these to tell them apart.
+    """
+    literals = _QUOTED_OR_NUMBER.findall(question)
+    words = re.findall(r"\w+", _QUOTED_OR_NUMBER.sub(" ", question))
+    literals += [word for word in words[1:] if word[0].isupper()]
+    return tuple(sorted(literals))
+
+
+def headers_key(headers: List[str]) -> str:
+    """Return a short, order-independent key for a set of headers."""
+    joined = "\x1f".join(sorted(set(headers)))
+    return hashlib.sha1(joined.encode("utf-8")).hexdigest()[:16]
+
+
+class SemanticCache:
+    """
+    In-process cache that matches questions by embedding similarity.
+
+    Entries are kept in a fixed-size ring buffer. A lookup only considers entries that
+    were generated for the same header set and name the same literals, so a paraphrase
+    can only reuse SQL written against the same schema and values.
+
+    Args:
+        max_entries (int): Number of entries kept; the oldest entry is overwritten first.
+        threshold (float): Minimum cosine similarity for a paraphrase to count as a hit.
+    """
+
+    def __init__(self, max_entries: int = 1024, threshold: float = 0.95):
+        self.max_entries = max_entries
+        self.threshold = threshold
+        self.hits = 0
+        self.misses = 0
+        self._embeddings: Optional[np.ndarray] = None
+        self._keys: List[Optional[str]] = [None] * max_entries
+        self._values: List[Optional[str]] = [None] * max_entries
+        self._literals: List[Tuple[str, ...]] = [()] * max_entries
+        self._next = 0
+        self._lock = threading.Lock()
+
+    def get(
+        self, embedding: np.ndarray, key: str, literals: Tuple[str, ...] = ()
+    ) -> Optional[str]:
+        """
+        Return the value of the most similar entry with the same key and literals, if
+        close enough.
+        """
+        query = _normalize(embedding)
+        with self._lock:
+            if self._embeddings is not None:
+                candidates = [
+                    i
+                    for i, k in enumerate(self._keys)
+                    if k == key and self._literals[i] == literals
+                ]
+                if candidates:
+                    scores = self._embeddings[candidates] @ query
+                    best = int(np.argmax(scores))
+                    if scores[best] >= self.threshold:
+                        self.hits += 1
+                        return self._values[candidates[best]]
+            self.misses += 1
+            return None
+
+    def set(
+        self,
+        embedding: np.ndarray,
+        key: str,
+        value: str,
+        literals: Tuple[str, ...] = (),
+    ) -> None:
+        """Store a value under an embedding, overwriting the oldest entry when full."""
+        vector = _normalize(embedding)
+        with self._lock:
+            if self._embeddings is None:
+                self._embeddings = np.zeros(
+                    (self.max_entries, vector.shape[0]), dtype=np.float32
+                )
+            self._embeddings[self._next] = vector
+            self._keys[self._next] = key
+            self._values[self._next] = value
+            self._literals[self._next] = literals
+            self._next = (self._next + 1) % self.max_entries
+
+    def clear(self) -> None:
+        """Drop every entry."""
+        with self._lock:
+            self._embeddings = None
+            self._keys = [None] * self.max_entries
+            self._values = [None] * self.max_entries
+            self._literals = [()] * self.max_entries
+            self._next = 0
+
+    def stats(self) -> dict:
+        """Return hit/miss counters and the number of cached entries."""
+        return {
+            "entries": sum(key is not None for key in self._keys),
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+class Text2SQLCache:
+    """
+    Result cache for text2sql with an exact-match tier and a semantic tier.
+
+    The exact tier is keyed on the normalized question and the retrieved header set and
+    lives in an in-process LRU, optionally backed by Redis. The semantic tier reuses the
+    question embedding computed for header retrieval to serve paraphrases that name the
+    same values (see `question_literals`).
+
+    Every key is namespaced by the model version, and changing the version clears the
+    in-process tiers, so results of a previous model are never served.
+
+    Args:
+        model_version (str): Identifier of the model that produces the cached results.
+        max_entries (int): Size of the in-process exact and semantic tiers.
+        ttl_seconds (Optional[int]): Time-to-live of exact-match entries.
+        use_redis (bool): Whether to share exact-match entries through Redis.
+        semantic_threshold (Optional[float]): Minimum cosine similarity for the semantic
+            tier. None disables the semantic tier.
+    """
+
+    def __init__(
+        self,
+        model_version: str,
+        max_entries: int = 1024,
+        ttl_seconds: Optional[int] = None,
+        use_redis: bool = False,
+        semantic_threshold: Optional[float] = 0.95,
+    ):
+        self.model_version = model_version
+        self.exact = TieredCache(
+            LRUCache(max_entries=max_entries, ttl_seconds=ttl_seconds),
+            RedisCache("text2sql:", ttl_seconds=ttl_seconds) if use_redis else None,
+        )
+        self.semantic = (
+            SemanticCache(max_entries=max_entries, threshold=semantic_threshold)
+            if semantic_threshold is not None
+            else None
+        )
+        self._lock = threading.Lock()
+
+    def set_model_version(self, model_version: str) -> None:
+        """Switch to a new model version, dropping results of the previous one."""
+        with self._lock:
+            if model_version == self.model_version:
+                return
+            self.model_version = model_version
+            self.clear()
+
+    def clear(self) -> None:
+        """Drop every in-process entry."""
+        self.exact.clear()
+        if self.semantic is not None:
+            self.semantic.clear()
+
+    def get(
+        self, question: str, headers: List[str], embedding: Optional[np.ndarray] = None
+    ) -> Optional[str]:
+        """
+        Look up a cached SQL query.
+
+        Args:
+            question (str): The question as asked by the user.
+            headers (List[str]): The headers retrieved for the question.
+            embedding (Optional[np.ndarray]): The question embedding, for the semantic tier.
+
+        Returns:
+            Optional[str]: The cached SQL query, or None on a miss.
+        """
+        result = self.exact.get(self._exact_key(question, headers))
+        if result is None and self.semantic is not None and embedding is not None:
+            result = self.semantic.get(
+                embedding, self._semantic_key(headers), question_literals(question)
+            )
+        return result
+
+    def set(
+        self,
+        question: str,
+        headers: List[str],
+        result: str,
+        embedding: Optional[np.ndarray] = None,
+    ) -> None:
+        """Store the SQL query generated for a question and header set."""
+        self.exact.set(self._exact_key(question, headers), result)
+        if self.semantic is not None and embedding is not None:
+            self.semantic.set(
+                embedding,
+                self._semantic_key(headers),
+                result,
+                question_literals(question),
+            )
+
+    def stats(self) -> dict:
+        """Return hit/miss metrics of every tier."""
+        stats = {"model_version": self.model_version, "exact": self.exact.stats()}
+        if self.semantic is not None:
+            stats["semantic"] = self.semantic.stats()
+        return stats
+
+    def _exact_key(self, question: str, headers: List[str]) -> str:
+        digest = hashlib.sha1(normalize_question(question).encode("utf-8")).hexdigest()
+        return f"{self.model_version}:{headers_key(headers)}:{digest}"
+
+    def _semantic_key(self, headers: List[str]) -> str:
+        return f"{self.model_version}:{headers_key(headers)}"
+
+
+def _normalize(embedding: np.ndarray) -> np.ndarray:
+    vector = np.asarray(embedding, dtype=np.float32).ravel()
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm > 0 else vector
@@ -0,0 +1,115 @@
+from typing import Iterable, Iterator, Optional
+
+import torch
+from transformers import StoppingCriteria
+
+# Marker the prompt template wraps its "Stop after generating the SQL query!" rule in
+RULE_MARKER = "<rule>"
+QUERY_PREFIX = "query="
+
+
+def _statement_end(text: str) -> Optional[int]:
+    """
+    Find where the generated SQL statement ends.
+
+    The statement is considered complete at the first `;` after `query=`, at the first
+    newline that follows statement text, or right before a `<rule>` marker.
+
+    Returns:
+        Optional[int]: Index right after the statement, or None if it is not complete yet.
+    """
+    ends = []
+    marker = text.find(RULE_MARKER)
+    if marker >= 0:
+        ends.append(marker)
+        text = text[:marker]
+
+    query_start = text.find(QUERY_PREFIX)
+    body_start = query_start + len(QUERY_PREFIX) if query_start >= 0 else 0
+    semicolon = text.find(";", body_start)
+    if semicolon >= 0:
+        ends.append(semicolon + 1)
+
+    body = text[body_start:]
+    content_start = len(body) - len(body.lstrip())
+    newline = body.find("\n", content_start)
+    if content_start < len(body) and newline >= 0:
+        ends.append(body_start + newline)
+
+    return min(ends) if ends else None
+
+
+def is_sql_complete(text: str) -> bool:
+    """Return True if the generated text already holds a complete `query=...` statement."""
+    return _statement_end(text) is not None
+
+
+def truncate_sql(text: str) -> str:
+    """Cut everything the model generated after the SQL statement."""
+    end = _statement_end(text)
+    return (text if end is None else text[:end]).strip()
+
+
+def stream_sql(chunks: Iterable[str]) -> Iterator[str]:
+    """
+    Forward streamed text chunks until the SQL statement is complete.
+
+    Text that could be the start of a `<rule>` marker is held back until it is known
+    not to be one, so the marker never reaches the client.
+
+    Args:
+        chunks (Iterable[str]): Text chunks as they are decoded.
+
+    Yields:
+        str: The parts of the statement that have not been sent yet.
+    """
+    text = ""
+    sent = 0
+    for chunk in chunks:
+        text += chunk
+        end = _statement_end(text)
+        if end is not None:
+            if end > sent:
+                yield text[sent:end]
+            return
+
+        safe = len(text)
+        for size in range(len(RULE_MARKER) - 1, 0, -1):
+            if text.endswith(RULE_MARKER[:size]):
+                safe -= size
+                break
+        if safe > sent:
+            yield text[sent:safe]
+            sent = safe
+
+    if len(text) > sent:
+        yield text[sent:]
+
+
+class SQLStatementStoppingCriteria(StoppingCriteria):
+    """
+    Stops generation of each sequence once it holds a complete `query=...` statement.
+
+    Args:
+        tokenizer: The tokenizer used to decode the generated tokens.
+        prompt_length (Optional[int]): Length of the (padded) prompt in tokens. If not
+            given, it is inferred on the first call, when one token has been generated.
+    """
+
+    def __init__(self, tokenizer, prompt_length: Optional[int] = None):
+        self.tokenizer = tokenizer
+        self.prompt_length = prompt_length
+
+    def __call__(
+        self, input_ids: torch.LongTensor, scores: torch.FloatTensor, **kwargs
+    ) -> torch.BoolTensor:
+        if self.prompt_length is None:
+            self.prompt_length = input_ids.shape[-1] - 1
+        texts = self.tokenizer.batch_decode(
+            input_ids[:, self.prompt_length :], skip_special_tokens=True
+        )
+        return torch.tensor(
+            [is_sql_complete(text) for text in texts],
+            dtype=torch.bool,
+            device=input_ids.device,
+        )
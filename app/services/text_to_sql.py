@@ -1,27 +1,187 @@
+import asyncio
 import os
-from typing import List
+import threading
+from collections import Counter
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from typing import Callable, Dict, Iterator, List, NamedTuple, Optional, Tuple
 import logging
+import numpy as np
+import torch
 from chromadb.utils.embedding_functions import SentenceTransformerEmbeddingFunction
-from app.chromadb.client import get_header_collection
-from app.llm.predictors import get_disambiguated_text
-from transformers import AutoTokenizer, AutoModelForCausalLM, pipeline
+from app.chromadb.client import get_embedding_function, get_header_collection
+from app.core.config import settings
+from app.core.model_registry import model_registry
+from app.core.executors import preprocess_executor
+from app.llm.predictors import (
+    aget_disambiguated_text,
+    get_disambiguated_text,
+    pipeline_get_disambiguated_text,
+)
+from app.retrieval.lexical_index import LexicalHeaderIndex, reciprocal_rank_fusion
+from app.retrieval.numpy_index import NumpyHeaderIndex
+from app.retrieval.table_index import (
+    TableSchemaIndex,
+    approximate_token_count,
+    format_column,
+)
+from app.services.assisted_decoding import (
+    AssistedDecodingStats,
+    assisted_generate_kwargs,
+)
+from app.services.batching import MicroBatcher
+from app.services.disambiguation_gate import disambiguation_gate
+from app.services.pipeline import PipelineStats, PipelineTrace, word_overlap
+from app.services.model_backends import load_causal_lm, weights_fingerprint
+from app.services.prefix_cache import PromptPrefixCache
+from app.services.sql_cache import Text2SQLCache
+from app.services.stopping import SQLStatementStoppingCriteria, stream_sql, truncate_sql
+from transformers import (
+    AutoTokenizer,
+    StoppingCriteriaList,
+    TextIteratorStreamer,
+    pipeline,
+)
 from app.core.constants import (
     IS_TOO_VAGUE_MESSAGE,
     MAX_HEADERS,
+    MAX_NEW_TOKENS,
     TEXT_TO_SQL_PROMPT_TEMPLATE,
 )
 
-MODEL_PATH = os.getenv("MODEL_TEXT2SQL_PATH", "nerzid/qwen2.5-3B-4bit-text2sql")
+MODEL_PATH = settings.MODEL_TEXT2SQL_PATH
 
 # Globals for lazy initialization
 _tokenizer = None
 _model = None
 _pipe = None
+_prefix_cache = None
+_draft_model = None
+_assisted_stats = AssistedDecodingStats()
+# Outcomes of the LLM disambiguation that runs before generation
+_preprocess_counts: Counter = Counter()
+_preprocess_lock = threading.Lock()
+_pipeline_stats = PipelineStats()
+# Runs model loading and re-retrieval next to the stages that wait for them
+_stage_executor = ThreadPoolExecutor(
+    max_workers=settings.TEXT2SQL_PIPELINE_WORKERS, thread_name_prefix="text2sql-stage"
+)
+# Runs the LLM calls of the pipeline, which hold no thread while they wait for the LLM
+# and are bounded by the client's timeout and circuit breaker. Started on first use.
+_llm_loop: Optional[asyncio.AbstractEventLoop] = None
+_llm_loop_lock = threading.Lock()
+
+# Everything up to the line holding the table schema is identical for every prompt, and
+# everything up to the line holding the question is identical for a given schema. Both
+# prefixes end on a newline so that tokenizing them separately does not change the tokens.
+_PROMPT_STATIC_PREFIX = TEXT_TO_SQL_PROMPT_TEMPLATE.split("{table_str}")[0]
+_PROMPT_STATIC_PREFIX = _PROMPT_STATIC_PREFIX[: _PROMPT_STATIC_PREFIX.rindex("\n") + 1]
+_PROMPT_BEFORE_QUESTION = TEXT_TO_SQL_PROMPT_TEMPLATE.split("{table_str}")[1].split(
+    "{question}"
+)[0]
 
 logger = logging.getLogger(__name__)
 
 
-collection = get_header_collection()
+def _load_header_index():
+    if settings.HEADER_INDEX_BACKEND == "tables":
+        # Flat header lookups search the columns of the schema index
+        return _schema_index.columns
+    if settings.HEADER_INDEX_BACKEND == "numpy":
+        return NumpyHeaderIndex.load(settings.HEADER_INDEX_PATH)
+    return get_header_collection()
+
+
+_schema_index = (
+    TableSchemaIndex.load(settings.SCHEMA_INDEX_PATH)
+    if settings.HEADER_INDEX_BACKEND == "tables"
+    else None
+)
+
+
+collection = _load_header_index()
+
+_lexical_index = (
+    LexicalHeaderIndex.from_file(settings.HEADERS_PATH)
+    if settings.HEADER_RETRIEVAL_MODE in ("lexical", "hybrid")
+    else None
+)
+
+_result_cache = (
+    Text2SQLCache(
+        MODEL_PATH,
+        max_entries=settings.TEXT2SQL_CACHE_MAX_ENTRIES,
+        ttl_seconds=settings.TEXT2SQL_CACHE_TTL_SECONDS,
+        use_redis=settings.TEXT2SQL_CACHE_USE_REDIS,
+        semantic_threshold=(
+            settings.TEXT2SQL_SEMANTIC_CACHE_THRESHOLD
+            if settings.TEXT2SQL_SEMANTIC_CACHE_ENABLED
+            else None
+        ),
+    )
+    if settings.TEXT2SQL_CACHE_ENABLED
+    else None
+)
+
+
+def _load_text2sql() -> dict:
+    backend = settings.TEXT2SQL_BACKEND
+    if backend == "onnx" and settings.TEXT2SQL_ASSISTED_DECODING != "off":
+        raise ValueError("Assisted decoding is not supported with the 'onnx' backend")
+    tokenizer = AutoTokenizer.from_pretrained(MODEL_PATH, trust_remote_code=True)
+    # Batched generation pads on the left so that every prompt ends right before
+    # the first generated token
+    tokenizer.padding_side = "left"
+    if tokenizer.pad_token is None:
+        tokenizer.pad_token = tokenizer.eos_token
+    model = load_causal_lm(
+        MODEL_PATH,
+        backend,
+        settings.TEXT2SQL_ONNX_PATH,
+        trust_remote_code=True,
+        device_map="auto",
+    )
+    # The ONNX Runtime model is not a PyTorch model, which the transformers pipeline
+    # expects; it generates through its own `generate` instead
+    pipe = (
+        pipeline("text-generation", model=model, tokenizer=tokenizer)
+        if isinstance(model, torch.nn.Module)
+        else None
+    )
+    draft_model = None
+    if settings.TEXT2SQL_ASSISTED_DECODING == "draft":
+        # The draft model must share the tokenizer of the text2sql model
+        draft_model = load_causal_lm(
+            settings.TEXT2SQL_DRAFT_MODEL_PATH,
+            backend,
+            trust_remote_code=True,
+            device_map="auto",
+        )
+    prefix_cache = None
+    # Prefix reuse feeds KV caches to the PyTorch model, which ONNX Runtime lacks. It is
+    # built here, so concurrent first requests share the one the registry loads.
+    if settings.TEXT2SQL_PREFIX_CACHE and isinstance(model, torch.nn.Module):
+        prefix_cache = PromptPrefixCache(
+            model,
+            tokenizer,
+            _PROMPT_STATIC_PREFIX,
+            max_entries=settings.TEXT2SQL_PREFIX_CACHE_MAX_ENTRIES,
+        )
+    return {
+        "tokenizer": tokenizer,
+        "model": model,
+        "pipe": pipe,
+        "draft_model": draft_model,
+        "prefix_cache": prefix_cache,
+    }
+
+
+def _unload_text2sql() -> None:
+    global _tokenizer, _model, _pipe, _prefix_cache, _draft_model
+    # The prefix cache holds KV tensors of the model, so it goes with it
+    _tokenizer = _model = _pipe = _prefix_cache = _draft_model = None
+
+
+model_registry.register("text2sql", _load_text2sql, on_unload=_unload_text2sql)
 
 
 def load_model():
@@ -29,49 +189,267 @@ def load_model():
     Load the model, tokenizer, and pipeline for text-to-SQL generation.
 
     This function uses lazy initialization to load the components only when they are first needed.
-    It sets up global variables for the tokenizer, model, and pipeline.
+    The models are loaded through the shared model registry, which may unload them again
+    when they are idle or memory is needed for another model; the globals are reset then.
 
     Global Variables:
         _tokenizer: The tokenizer for processing input text.
         _model: The pre-trained model for text-to-SQL generation.
-        _pipe: The pipeline for text generation.
+        _pipe: The pipeline for text generation, or None for the "onnx" backend.
+        _prefix_cache: The KV cache of the static prompt prefix, if prefix caching is enabled.
+        _draft_model: The draft model, if assisted decoding uses one.
 
     Returns:
         None
     """
-    global _tokenizer, _model, _pipe
-    if _tokenizer is None or _model is None or _pipe is None:
-        _tokenizer = AutoTokenizer.from_pretrained(MODEL_PATH, trust_remote_code=True)
-        _model = AutoModelForCausalLM.from_pretrained(
-            MODEL_PATH, trust_remote_code=True, device_map="auto"
-        )
-        _pipe = pipeline("text-generation", model=_model, tokenizer=_tokenizer)
+    global _tokenizer, _model, _pipe, _prefix_cache, _draft_model
+    if _tokenizer is None or _model is None:
+        # Pinned until the globals are assigned, so that an unload can not clear them
+        # before they are set to a model the registry no longer holds
+        with model_registry.use("text2sql"):
+            loaded = model_registry.get("text2sql")
+            # Threads loading at the same time all get the components loaded once by
+            # the registry, so they assign the same objects
+            _prefix_cache = loaded["prefix_cache"]
+            _draft_model = loaded["draft_model"]
+            _tokenizer, _model = loaded["tokenizer"], loaded["model"]
+            _pipe = loaded["pipe"]
+            if _result_cache is not None:
+                # Results of another model revision must not be served
+                _result_cache.set_model_version(_model_version(loaded["model"]))
 
 
-def get_relevant_headers(question: str, top_k: int = 20) -> List[str]:
+def _model_version(model) -> str:
+    # Hub models are identified by their commit. Local models by their files, so that
+    # replacing the weights on disk does not serve results cached in Redis.
+    weights_dir = (
+        settings.TEXT2SQL_ONNX_PATH
+        if settings.TEXT2SQL_BACKEND == "onnx"
+        else MODEL_PATH
+    )
+    if weights_dir and os.path.isdir(weights_dir):
+        return f"{MODEL_PATH}@local-{weights_fingerprint(weights_dir)}"
+    revision = getattr(model.config, "_commit_hash", None) or "local"
+    return f"{MODEL_PATH}@{revision}"
+
+
+def embed_question(question: str) -> Optional[np.ndarray]:
     """
-    Queries ChromaDB for headers most semantically similar to the input question.
+    Embeds a question with the same model that was used to index the headers.
+
+    Args:
+        question (str): The user input or question.
+
+    Returns:
+        Optional[np.ndarray]: The question embedding, or None if embedding failed.
+    """
+    embeddings = embed_questions([question])
+    return embeddings[0] if embeddings is not None else None
+
+
+def embed_questions(questions: List[str]) -> Optional[np.ndarray]:
+    """
+    Embeds several questions in a single forward pass of the embedding model.
+
+    Args:
+        questions (List[str]): The user inputs or questions.
+
+    Returns:
+        Optional[np.ndarray]: Embeddings of shape (len(questions), dim), or None if
+            embedding failed.
+    """
+    try:
+        return np.asarray(get_embedding_function()(questions), dtype=np.float32)
+    except Exception as e:
+        logger.error(f"Error embedding questions: {e}")
+        return None
+
+
+def get_relevant_headers(
+    question: str, top_k: int = 20, embedding: Optional[np.ndarray] = None
+) -> List[str]:
+    """
+    Queries the header index for headers most semantically similar to the input question.
+
+    The index is the ChromaDB collection or the in-process NumPy index, depending on
+    `settings.HEADER_INDEX_BACKEND`.
 
     Args:
         question (str): The user input or question.
         top_k (int): Number of top headers to return.
+        embedding (Optional[np.ndarray]): The question embedding, if it was already computed.
 
     Returns:
         List[str]: List of header strings.
     """
+    embeddings = embedding[np.newaxis] if embedding is not None else None
+    return get_relevant_headers_batch([question], top_k, embeddings=embeddings)[0]
+
+
+def get_relevant_headers_batch(
+    questions: List[str], top_k: int = 20, embeddings: Optional[np.ndarray] = None
+) -> List[List[str]]:
+    """
+    Retrieves the relevant headers of several questions at once.
+
+    All questions are embedded in one forward pass and searched with one query to the
+    header index, so retrieving the schemas of N questions costs about as much as one.
+
+    With `settings.HEADER_RETRIEVAL_MODE` set to "hybrid", the lexical index runs first.
+    Questions that name enough headers verbatim are answered from it without being
+    embedded. The lexical and vector rankings of the other questions are fused with
+    reciprocal rank fusion. The "lexical" mode never embeds.
+
+    Args:
+        questions (List[str]): The user inputs or questions.
+        top_k (int): Number of top headers to return per question.
+        embeddings (Optional[np.ndarray]): The question embeddings, if they were already
+            computed.
+
+    Returns:
+        List[List[str]]: The header strings of every question, in the order of `questions`.
+    """
+    top_k = min(top_k, MAX_HEADERS)
+    mode = settings.HEADER_RETRIEVAL_MODE
+    if mode == "lexical":
+        return [
+            [header for header, _ in _lexical_index.search(question, top_k)]
+            for question in questions
+        ]
+    if mode != "hybrid":
+        return _query_header_index(questions, top_k, embeddings)
+
+    candidates = max(top_k, settings.HYBRID_CANDIDATES)
+    results = [None] * len(questions)
+    rankings = {}
+    for i, question in enumerate(questions):
+        if _is_lexically_confident(question, top_k):
+            results[i] = [h for h, _ in _lexical_index.search(question, top_k)]
+        else:
+            rankings[i] = [h for h, _ in _lexical_index.search(question, candidates)]
+    if rankings:
+        indices = list(rankings)
+        vector_results = _query_header_index(
+            [questions[i] for i in indices],
+            candidates,
+            embeddings[indices] if embeddings is not None else None,
+        )
+        for i, vector_ranking in zip(indices, vector_results):
+            fused = reciprocal_rank_fusion([rankings[i], vector_ranking])
+            results[i] = [header for header, _ in fused[:top_k]]
+    return results
+
+
+def _query_header_index(
+    questions: List[str], n_results: int, embeddings: Optional[np.ndarray]
+) -> List[List[str]]:
     if not collection:
-        logger.warning("ChromaDB collection is not available.")
-        return []
+        logger.warning("Header index is not available.")
+        return [[] for _ in questions]
 
     try:
+        if embeddings is None:
+            embeddings = embed_questions(questions)
+        if embeddings is None:
+            return [[] for _ in questions]
         results = collection.query(
-            query_texts=[question], n_results=min(top_k, MAX_HEADERS)
+            query_embeddings=embeddings.tolist(), n_results=n_results
+        )
+        documents = results["documents"] or [[] for _ in questions]
+        logger.info(
+            f"Found {sum(map(len, documents))} relevant headers "
+            f"for {len(questions)} question(s)."
         )
-        logger.info(f"Found {len(results['documents'][0])} relevant headers.")
-        return results["documents"][0] if results["documents"] else []
+        return documents
     except Exception as e:
-        logger.error(f"Error querying headers from ChromaDB: {e}")
-        return []
+        logger.error(f"Error querying headers from the header index: {e}")
+        return [[] for _ in questions]
+
+
+def _is_lexically_confident(question: str, top_k: int = MAX_HEADERS) -> bool:
+    if _lexical_index is None:
+        return False
+    matches = _lexical_index.confident_matches(question, top_k)
+    return len(matches) >= settings.LEXICAL_CONFIDENT_MATCHES
+
+
+def _needs_embedding(question: str) -> bool:
+    # Questions answered by the lexical fast path skip the embedding model, and with it
+    # the semantic result cache
+    if _schema_index is not None:
+        return True
+    if settings.HEADER_RETRIEVAL_MODE == "lexical":
+        return False
+    return not (
+        settings.HEADER_RETRIEVAL_MODE == "hybrid" and _is_lexically_confident(question)
+    )
+
+
+def get_relevant_schema(
+    question: str, top_k: int = 20, embedding: Optional[np.ndarray] = None
+) -> Tuple[List[str], List[str]]:
+    """
+    Retrieves the columns and column types to put into the prompt for a question.
+
+    Args:
+        question (str): The user input or question.
+        top_k (int): Maximum number of columns to return.
+        embedding (Optional[np.ndarray]): The question embedding, if it was already computed.
+
+    Returns:
+        Tuple[List[str], List[str]]: The headers and their types.
+    """
+    embeddings = embedding[np.newaxis] if embedding is not None else None
+    return get_relevant_schema_batch([question], top_k, embeddings=embeddings)[0]
+
+
+def get_relevant_schema_batch(
+    questions: List[str], top_k: int = 20, embeddings: Optional[np.ndarray] = None
+) -> List[Tuple[List[str], List[str]]]:
+    """
+    Retrieves the prompt schema of several questions at once.
+
+    With the "tables" header index backend, whole candidate tables are retrieved first
+    and their columns ranked second, so each schema holds the columns of a few coherent
+    tables with their WikiSQL types, within `settings.SCHEMA_TOKEN_BUDGET` tokens. The
+    other backends return the most similar headers, all typed as text.
+
+    Args:
+        questions (List[str]): The user inputs or questions.
+        top_k (int): Maximum number of columns per question.
+        embeddings (Optional[np.ndarray]): The question embeddings, if they were already
+            computed.
+
+    Returns:
+        List[Tuple[List[str], List[str]]]: The headers and their types for every question.
+    """
+    if _schema_index is None:
+        return [
+            (headers, ["text"] * len(headers))
+            for headers in get_relevant_headers_batch(
+                questions, top_k, embeddings=embeddings
+            )
+        ]
+
+    try:
+        if embeddings is None:
+            embeddings = embed_questions(questions)
+        if embeddings is None:
+            return [([], []) for _ in questions]
+        schemas = _schema_index.search(
+            embeddings,
+            top_k=min(top_k, MAX_HEADERS),
+            n_tables=settings.SCHEMA_CANDIDATE_TABLES,
+            token_budget=settings.SCHEMA_TOKEN_BUDGET,
+            count_tokens=_count_tokens,
+        )
+        return [
+            ([header for header, _ in schema], [type_ for _, type_ in schema])
+            for schema in schemas
+        ]
+    except Exception as e:
+        logger.error(f"Error querying the schema index: {e}")
+        return [([], []) for _ in questions]
 
 
 def preprocess_text(question: str, top_k_headers: int = 20) -> dict:
@@ -101,7 +479,59 @@ def preprocess_text(question: str, top_k_headers: int = 20) -> dict:
         return question  # Fallback to original question
 
 
-def text2sql(question: str, top_k_headers: int = 20) -> str:
+async def preprocess_text_async(question: str, top_k_headers: int = 20) -> dict:
+    """
+    Async version of `preprocess_text` for the event loop of the API.
+
+    Header retrieval runs on the preprocess executor and the LLM call is awaited on the
+    pooled async client, so a request holds no worker thread while the LLM responds. If
+    the LLM fails, times out or its circuit breaker is open, the raw question is returned.
+
+    Args:
+        question (str): Natural language question to process.
+        top_k_headers (int): Number of relevant headers to include.
+
+    Returns:
+        dict: The `disambiguated_text` and whether the question `is_too_vague`.
+
+    Raises:
+        ExecutorSaturatedError: If the preprocess executor has no capacity left.
+    """
+    question = question.strip()
+    if not question:
+        return {"disambiguated_text": "", "is_too_vague": True}
+
+    relevant_headers = await preprocess_executor.run(
+        get_relevant_headers, question, top_k_headers
+    )
+    logger.info(f"Relevant headers: {relevant_headers}")
+    try:
+        result = await aget_disambiguated_text(
+            text=question, relevant_headers=relevant_headers
+        )
+        return {
+            "disambiguated_text": result["disambiguated_text"],
+            "is_too_vague": result["is_too_vague"],
+        }
+    except Exception as e:
+        logger.warning(f"Failed to disambiguate question, using it as is: {e!r}")
+        return {"disambiguated_text": question, "is_too_vague": False}
+
+
+class _Prepared(NamedTuple):
+    # A question after the stages that run before generation
+    question: str  # the question to generate SQL for, possibly rewritten
+    headers: List[str]
+    types: List[str]
+    original: str  # the question as asked; results are cached under it
+    columns: List[str]  # the columns retrieved for the original question
+    embedding: Optional[np.ndarray]  # the embedding of the original question
+    result: Optional[str]  # set if the question was answered without generation
+
+
+def text2sql(
+    question: str, top_k_headers: int = 20, trace: Optional[PipelineTrace] = None
+) -> str:
     """
     Converts a natural language question to a SQL query.
 
@@ -109,10 +539,16 @@ def text2sql(question: str, top_k_headers: int = 20) -> str:
     a corresponding SQL query. It uses a pre-trained language model to perform the
     text-to-SQL conversion.
 
+    The question runs through a pipeline of stages: retrieve (embedding and schema
+    retrieval), disambiguate (the LLM, if enabled), re_retrieve (the schema of the
+    rewritten question) and generate. The model loads while the first stages run, and
+    the optional stages fall back to their input when they miss their deadline.
+
     Args:
         question (str): The natural language question to convert to SQL.
         top_k_headers (int, optional): The number of relevant table headers to consider.
                                        Defaults to 20.
+        trace (Optional[PipelineTrace], optional): Receives the timings of the stages.
 
     Returns:
         str: The generated SQL query as a string, or an error message if the question
@@ -121,20 +557,552 @@ def text2sql(question: str, top_k_headers: int = 20) -> str:
     Note:
         This function requires a loaded model and access to relevant database headers.
         It also uses a predefined prompt template for generating the SQL query.
+        With `settings.TEXT2SQL_PREPROCESS` set to "gated" or "always", ambiguous
+        questions are disambiguated by the LLM first.
     """
-    load_model()
-    # turned off, because I'm gpu poor :(
-    # question = preprocess_text(question, top_k_headers)
     if question == IS_TOO_VAGUE_MESSAGE:
         return question
-    headers = get_relevant_headers(question, top_k_headers)
-    table_str = _build_table_str(headers)
-    prompt = TEXT_TO_SQL_PROMPT_TEMPLATE.format(table_str=table_str, question=question)
-    result = _pipe(prompt, max_new_tokens=100)[0]["generated_text"]
-    # Remove the prompt prefix
-    result = result[len(prompt) :].strip()
-    return result
+    trace = trace if trace is not None else PipelineTrace()
+    loading = _start_loading()
+    try:
+        [prepared] = _prepare_questions([question], top_k_headers, trace)
+        if prepared.result is not None:
+            return prepared.result
+        _wait_for_model(loading, trace)
+
+        prompt = _build_prompt(prepared.question, prepared.headers, prepared.types)
+        with trace.stage("generate"):
+            if _batcher.max_batch_size > 1:
+                # Concurrent requests are coalesced into one padded generate call
+                result = _batcher(prompt)
+            else:
+                result = generate_sql_batch([prompt])[0]
+        _cache_result(prepared, result)
+        return result
+    finally:
+        _record_trace(trace)
+
+
+def text2sql_batch(questions: List[str], top_k_headers: int = 20) -> List[str]:
+    """
+    Converts several natural language questions to SQL queries.
+
+    Headers are retrieved for all questions at once, cached results are reused, and the
+    remaining prompts are generated in padded batches. Meant for offline evaluation and
+    data generation, where the questions are known up front.
+
+    Args:
+        questions (List[str]): The natural language questions to convert to SQL.
+        top_k_headers (int, optional): The number of relevant table headers to consider.
+                                       Defaults to 20.
+
+    Returns:
+        List[str]: The generated SQL query of every question, in the order of `questions`,
+            or an error message for questions that are too vague to process.
+    """
+    trace = PipelineTrace()
+    loading = _start_loading()
+    try:
+        prepared = _prepare_questions(questions, top_k_headers, trace)
+        results = [p.result for p in prepared]
+        pending = [i for i, result in enumerate(results) if result is None]
+        if not pending:
+            return results
+        _wait_for_model(loading, trace)
+
+        batch_size = max(settings.TEXT2SQL_MAX_BATCH_SIZE, 1)
+        with trace.stage("generate"):
+            for start in range(0, len(pending), batch_size):
+                indices = pending[start : start + batch_size]
+                prompts = [
+                    _build_prompt(p.question, p.headers, p.types)
+                    for p in (prepared[i] for i in indices)
+                ]
+                for i, result in zip(indices, generate_sql_batch(prompts)):
+                    results[i] = result
+                    _cache_result(prepared[i], result)
+        return results
+    finally:
+        _record_trace(trace)
+
+
+def _prepare_questions(
+    questions: List[str], top_k_headers: int, trace: PipelineTrace
+) -> List[_Prepared]:
+    # Runs the stages before generation. Cached results are looked up right after the
+    # first retrieval, so repeated questions skip the generation, and the LLM unless its
+    # call started before the retrieval.
+    early = _start_early_disambiguation(questions, top_k_headers, trace)
+    with trace.stage("retrieve"):
+        embeddings = _embed_if_needed(questions)
+        schemas = get_relevant_schema_batch(
+            questions, top_k_headers, embeddings=embeddings
+        )
+    prepared = []
+    for i, (question, (headers, types)) in enumerate(zip(questions, schemas)):
+        # The embedding is shared by header retrieval and the semantic result cache
+        embedding = embeddings[i] if embeddings is not None else None
+        columns = _format_columns(headers, types)
+        cached = _get_cached_result(question, columns, embedding)
+        if cached is not None:
+            trace.note("cache_hit")
+        prepared.append(
+            _Prepared(question, headers, types, question, columns, embedding, cached)
+        )
+    if settings.TEXT2SQL_PREPROCESS != "off":
+        prepared = _disambiguate_prepared(prepared, top_k_headers, trace, early)
+    return prepared
+
+
+def _start_early_disambiguation(
+    questions: List[str], top_k_headers: int, trace: PipelineTrace
+) -> Dict[int, Future]:
+    # In "always" mode, the LLM calls start before the retrieval, on the headers of the
+    # lexical index, which are found without the embedding model. The retrieval then
+    # runs next to the calls, and its schema is kept unless the question is rewritten
+    # substantially. The gate of "gated" mode needs the retrieved headers, and without
+    # a lexical index there are no headers to start with, so the stages run in turn.
+    if settings.TEXT2SQL_PREPROCESS != "always" or _lexical_index is None:
+        return {}
+    trace.note("disambiguate_early")
+    top_k = min(top_k_headers, MAX_HEADERS)
+    return {
+        i: _run_on_llm_loop(
+            _disambiguate(
+                question, [h for h, _ in _lexical_index.search(question, top_k)]
+            )
+        )
+        for i, question in enumerate(questions)
+    }
+
+
+def _disambiguate_prepared(
+    prepared: List[_Prepared],
+    top_k_headers: int,
+    trace: PipelineTrace,
+    early: Optional[Dict[int, Future]] = None,
+) -> List[_Prepared]:
+    # Disambiguates the questions with the LLM, on the schemas already retrieved for
+    # them, or waits for the calls in `early` that started before the retrieval. In
+    # "gated" mode, questions the gate finds clear skip the LLM. The LLM calls of a
+    # batch run concurrently. Questions that changed more than a little are retrieved
+    # again, in one batch.
+    early = early or {}
+    pending = [i for i, p in enumerate(prepared) if p.result is None]
+    for i, future in early.items():
+        if prepared[i].result is not None:
+            # Answered from the cache, so the rewrite is not needed
+            future.cancel()
+    if settings.TEXT2SQL_PREPROCESS == "gated":
+        pending = [
+            i
+            for i in pending
+            if disambiguation_gate.check(
+                prepared[i].question, prepared[i].headers
+            ).needs_disambiguation
+        ]
+    if not pending:
+        return prepared
+
+    prepared = list(prepared)
+    with trace.stage("disambiguate"):
+        futures = {
+            i: (
+                early[i]
+                if i in early
+                else _run_on_llm_loop(
+                    _disambiguate(prepared[i].question, prepared[i].headers)
+                )
+            )
+            for i in pending
+        }
+        done, _ = wait(
+            futures.values(),
+            timeout=settings.TEXT2SQL_DISAMBIGUATE_DEADLINE_SECONDS or None,
+        )
+    rewritten = []
+    for i, future in futures.items():
+        if future not in done:
+            # The question is used as is, and the call is cancelled to free its LLM slot
+            future.cancel()
+            trace.timed_out("disambiguate")
+            continue
+        text = future.result()
+        if text is None:
+            trace.note("too_vague")
+            prepared[i] = prepared[i]._replace(result=IS_TOO_VAGUE_MESSAGE)
+        elif text != prepared[i].question:
+            trace.note("rewritten")
+            overlap = word_overlap(prepared[i].question, text)
+            if overlap >= settings.TEXT2SQL_RETRIEVAL_REUSE_SIMILARITY:
+                trace.note("retrieval_reused")
+                prepared[i] = prepared[i]._replace(question=text)
+            else:
+                rewritten.append((i, text))
+    if not rewritten:
+        return prepared
+
+    texts = [text for _, text in rewritten]
+    with trace.stage("re_retrieve"):
+        future = _stage_executor.submit(_retrieve_schemas, texts, top_k_headers)
+        done, _ = wait(
+            [future], timeout=settings.TEXT2SQL_RERETRIEVE_DEADLINE_SECONDS or None
+        )
+    if future in done:
+        schemas = future.result()
+    else:
+        # The schemas of the original questions are close enough to generate from
+        trace.timed_out("re_retrieve")
+        schemas = [(prepared[i].headers, prepared[i].types) for i, _ in rewritten]
+    for (i, text), (headers, types) in zip(rewritten, schemas):
+        prepared[i] = prepared[i]._replace(question=text, headers=headers, types=types)
+    return prepared
+
+
+async def _disambiguate(question: str, headers: List[str]) -> Optional[str]:
+    # Returns the rewritten question, or None if the LLM finds it too vague
+    try:
+        result = await pipeline_get_disambiguated_text(
+            text=question, relevant_headers=headers
+        )
+    except Exception as e:
+        logger.warning(f"Failed to disambiguate question, using it as is: {e!r}")
+        _count_preprocess("failed")
+        return question
+    if result["is_too_vague"]:
+        _count_preprocess("too_vague")
+        return None
+    text = (result["disambiguated_text"] or "").strip()
+    _count_preprocess("rewritten" if text and text != question else "unchanged")
+    return text or question
+
+
+def _start_loading() -> Optional[Future]:
+    # Loads the model next to the stages before generation, unless it is loaded already
+    if _tokenizer is not None and _model is not None:
+        load_model()
+        return None
+    return _stage_executor.submit(load_model)
+
+
+def _wait_for_model(loading: Optional[Future], trace: PipelineTrace) -> None:
+    with trace.stage("load"):
+        if loading is None:
+            return
+        done, _ = wait(
+            [loading], timeout=settings.TEXT2SQL_LOAD_DEADLINE_SECONDS or None
+        )
+    if loading not in done:
+        trace.timed_out("load")
+        raise TimeoutError(
+            f"The text2sql model did not load within "
+            f"{settings.TEXT2SQL_LOAD_DEADLINE_SECONDS}s"
+        )
+    loading.result()
+
+
+def _run_on_llm_loop(coroutine) -> Future:
+    global _llm_loop
+    with _llm_loop_lock:
+        if _llm_loop is None:
+            _llm_loop = asyncio.new_event_loop()
+            threading.Thread(
+                target=_llm_loop.run_forever, name="text2sql-llm", daemon=True
+            ).start()
+    return asyncio.run_coroutine_threadsafe(coroutine, _llm_loop)
+
+
+def _retrieve_schemas(
+    questions: List[str], top_k_headers: int
+) -> List[Tuple[List[str], List[str]]]:
+    return get_relevant_schema_batch(
+        questions, top_k_headers, embeddings=_embed_if_needed(questions)
+    )
+
+
+def _embed_if_needed(questions: List[str]) -> Optional[np.ndarray]:
+    needs_embedding = any(_needs_embedding(question) for question in questions)
+    return embed_questions(questions) if needs_embedding else None
+
+
+def _cache_result(prepared: _Prepared, result: str) -> None:
+    if result and _result_cache is not None:
+        _result_cache.set(
+            prepared.original, prepared.columns, result, embedding=prepared.embedding
+        )
+
+
+def _record_trace(trace: PipelineTrace) -> None:
+    _pipeline_stats.record(trace)
+    logger.info(f"Text2SQL stage timings: {trace.server_timing()}")
+
+
+def _count_preprocess(outcome: str) -> None:
+    with _preprocess_lock:
+        _preprocess_counts[outcome] += 1
+
+
+def get_preprocess_stats() -> dict:
+    """
+    Returns how often questions were disambiguated before generation.
+
+    Returns:
+        dict: The preprocessing mode, the decisions of the disambiguation gate and the
+            outcomes of the LLM calls.
+    """
+    with _preprocess_lock:
+        outcomes = dict(_preprocess_counts)
+    return {
+        "mode": settings.TEXT2SQL_PREPROCESS,
+        "gate": disambiguation_gate.stats(),
+        "llm_calls": sum(outcomes.values()),
+        "outcomes": outcomes,
+    }
+
+
+def get_pipeline_stats() -> dict:
+    """
+    Returns the latency of every text2sql pipeline stage over the recent requests.
+
+    Returns:
+        dict: Count, mean, median, 95th percentile and maximum of every stage, and how
+            often stages missed their deadline.
+    """
+    return _pipeline_stats.stats()
+
+
+def stream_text2sql(
+    question: str,
+    top_k_headers: int = 20,
+    submit: Optional[Callable] = None,
+    trace: Optional[PipelineTrace] = None,
+) -> Iterator[str]:
+    """
+    Converts a natural language question to a SQL query and streams it as it is generated.
+
+    Generation stops as soon as a complete `query=...` statement has been produced. The
+    stages before generation are those of `text2sql`.
+
+    Args:
+        question (str): The natural language question to convert to SQL.
+        top_k_headers (int, optional): The number of relevant table headers to consider.
+                                       Defaults to 20.
+        submit (Optional[Callable], optional): Function used to start the generation in
+            the background, e.g. a bounded executor's `submit`. Defaults to a new thread.
+        trace (Optional[PipelineTrace], optional): Receives the timings of the stages.
+
+    Returns:
+        Iterator[str]: Text chunks of the generated SQL query.
+    """
+    if question == IS_TOO_VAGUE_MESSAGE:
+        return iter([question])
+    trace = trace if trace is not None else PipelineTrace()
+    loading = _start_loading()
+    [prepared] = _prepare_questions([question], top_k_headers, trace)
+    if prepared.result is not None:
+        _record_trace(trace)
+        return iter([prepared.result])
+    _wait_for_model(loading, trace)
+
+    prompt = _build_prompt(prepared.question, prepared.headers, prepared.types)
+    with model_registry.use("text2sql"):
+        # Loads the model again if it was unloaded after the wait
+        load_model()
+        streamer = TextIteratorStreamer(
+            _tokenizer, skip_prompt=True, skip_special_tokens=True
+        )
+    if submit is None:
+        threading.Thread(
+            target=_generate_streaming, args=(prompt, streamer), daemon=True
+        ).start()
+    else:
+        submit(_generate_streaming, prompt, streamer)
+    return _cache_streamed_result(stream_sql(streamer), prepared, trace)
+
+
+def get_cache_stats() -> dict:
+    """
+    Returns hit/miss metrics of the text2sql result cache.
+
+    Returns:
+        dict: Metrics per cache tier, or an empty dict if the cache is disabled.
+    """
+    return _result_cache.stats() if _result_cache is not None else {}
+
+
+def generate_sql_batch(prompts: List[str]) -> List[str]:
+    """
+    Generates SQL queries for several prompts with a single padded `generate` call.
+
+    Assisted decoding only supports a batch size of 1, so it is used for single prompts;
+    several prompts are decoded together without it, which gains more than assisting
+    each of them in turn.
+
+    Args:
+        prompts (List[str]): Fully formatted text-to-SQL prompts.
+
+    Returns:
+        List[str]: The generated SQL for each prompt, without the prompt prefix and
+            anything generated after the statement.
+    """
+    with model_registry.use("text2sql"):
+        load_model()
+        return _generate_sql_batch(prompts)
+
+
+def _generate_sql_batch(prompts: List[str]) -> List[str]:
+    assisted = settings.TEXT2SQL_ASSISTED_DECODING != "off" and len(prompts) == 1
+    if assisted or _prefix_cache is not None or _pipe is None:
+        return [truncate_sql(result) for result in _generate(prompts)]
+
+    # Every sequence stops decoding once its statement is complete
+    stopping_criteria = StoppingCriteriaList([SQLStatementStoppingCriteria(_tokenizer)])
+    if len(prompts) == 1:
+        outputs = [
+            _pipe(
+                prompts[0],
+                max_new_tokens=MAX_NEW_TOKENS,
+                stopping_criteria=stopping_criteria,
+            )
+        ]
+    else:
+        outputs = _pipe(
+            prompts,
+            max_new_tokens=MAX_NEW_TOKENS,
+            batch_size=len(prompts),
+            stopping_criteria=stopping_criteria,
+        )
+    results = []
+    for prompt, output in zip(prompts, outputs):
+        result = output[0]["generated_text"]
+        # Remove the prompt prefix
+        results.append(truncate_sql(result[len(prompt) :]))
+    return results
+
+
+def get_assisted_decoding_stats() -> dict:
+    """
+    Returns acceptance statistics of assisted decoding.
+
+    Returns:
+        dict: Statistics of the generations run with assisted decoding so far.
+    """
+    return {"mode": settings.TEXT2SQL_ASSISTED_DECODING, **_assisted_stats.stats()}
+
+
+def _generate(
+    prompts: List[str], streamer: Optional[TextIteratorStreamer] = None
+) -> List[str]:
+    if _prefix_cache is not None:
+        inputs = _prefix_cache.prepare([_split_prompt(prompt) for prompt in prompts])
+    else:
+        inputs = _tokenizer(prompts, return_tensors="pt", padding=True).to(
+            _model.device
+        )
+    prompt_length = inputs["input_ids"].shape[-1]
+    generate_kwargs = dict(
+        max_new_tokens=MAX_NEW_TOKENS,
+        # Every sequence stops decoding once its statement is complete
+        stopping_criteria=StoppingCriteriaList(
+            [SQLStatementStoppingCriteria(_tokenizer, prompt_length)]
+        ),
+        pad_token_id=_tokenizer.pad_token_id,
+        streamer=streamer,
+    )
+
+    # Assisted generation only supports a batch size of 1
+    assisted_kwargs = (
+        assisted_generate_kwargs(
+            settings.TEXT2SQL_ASSISTED_DECODING,
+            draft_model=_draft_model,
+            prompt_lookup_num_tokens=settings.TEXT2SQL_PROMPT_LOOKUP_NUM_TOKENS,
+        )
+        if len(prompts) == 1
+        else {}
+    )
+    with torch.no_grad():
+        if assisted_kwargs:
+            with _assisted_stats.measure(_model, _draft_model) as measurement:
+                outputs = _model.generate(
+                    **inputs, **generate_kwargs, **assisted_kwargs
+                )
+                measurement.record(outputs.shape[-1] - prompt_length)
+        else:
+            outputs = _model.generate(**inputs, **generate_kwargs)
+    return _tokenizer.batch_decode(outputs[:, prompt_length:], skip_special_tokens=True)
+
+
+def _generate_streaming(prompt: str, streamer: TextIteratorStreamer) -> None:
+    try:
+        with model_registry.use("text2sql"):
+            load_model()
+            _generate([prompt], streamer=streamer)
+    except Exception as e:
+        logger.error(f"Streaming generation failed: {e}")
+        # Unblock the consumer of the stream
+        streamer.end()
+
+
+_batcher = MicroBatcher(
+    generate_sql_batch,
+    max_batch_size=settings.TEXT2SQL_MAX_BATCH_SIZE,
+    max_wait_ms=settings.TEXT2SQL_MAX_WAIT_MS,
+    name="text2sql-batcher",
+)
+
+
+def _get_cached_result(
+    question: str, columns: List[str], embedding: Optional[np.ndarray]
+) -> Optional[str]:
+    if _result_cache is None:
+        return None
+    cached = _result_cache.get(question, columns, embedding)
+    if cached is not None:
+        logger.info("Text2SQL result served from cache.")
+    return cached
+
+
+def _cache_streamed_result(
+    chunks: Iterator[str], prepared: _Prepared, trace: PipelineTrace
+) -> Iterator[str]:
+    streamed = []
+    try:
+        with trace.stage("generate"):
+            for chunk in chunks:
+                streamed.append(chunk)
+                yield chunk
+    finally:
+        _record_trace(trace)
+    _cache_result(prepared, "".join(streamed).strip())
+
+
+def _build_prompt(
+    question: str, headers: List[str], types: Optional[List[str]] = None
+) -> str:
+    table_str = _build_table_str(headers, types)
+    return TEXT_TO_SQL_PROMPT_TEMPLATE.format(table_str=table_str, question=question)
+
+
+def _split_prompt(prompt: str) -> tuple[str, str]:
+    """Split a prompt into its cacheable prefix (instructions and schema) and the question."""
+    question_start = prompt.find(_PROMPT_BEFORE_QUESTION, len(_PROMPT_STATIC_PREFIX))
+    if not prompt.startswith(_PROMPT_STATIC_PREFIX) or question_start < 0:
+        return _PROMPT_STATIC_PREFIX, prompt[len(_PROMPT_STATIC_PREFIX) :]
+    question_start += len(_PROMPT_BEFORE_QUESTION)
+    cut = prompt.rindex("\n", 0, question_start) + 1
+    return prompt[:cut], prompt[cut:]
+
+
+def _build_table_str(headers: list[str], types: Optional[list[str]] = None) -> str:
+    return " | ".join(_format_columns(headers, types))
+
+
+def _format_columns(headers: list[str], types: Optional[list[str]] = None) -> list[str]:
+    types = types if types is not None else ["text"] * len(headers)
+    return [format_column(h, t) for h, t in zip(headers, types)]
 
 
-def _build_table_str(headers: list[str]) -> str:
-    return " | ".join([f"{h} (text)" for h in headers])
+def _count_tokens(text: str) -> int:
+    if _tokenizer is None:
+        return approximate_token_count(text)
+    return len(_tokenizer(text, add_special_tokens=False)["input_ids"])
@@ -1,13 +1,12 @@
 import os
+import json
 import asyncio
 import logging
 from datetime import datetime, timedelta, date
+from typing import Optional, Tuple
 
 import asyncpg
-from datasets import Dataset, load_dataset, concatenate_datasets
-from unsloth import FastLanguageModel
-from trl import SFTTrainer, SFTConfig
-import torch
+import pyarrow as pa
 
 # Configure logging
 logging.basicConfig(
@@ -17,37 +16,138 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+FEEDBACK_SCHEMA = pa.schema(
+    [("question", pa.string()), ("sql", pa.string()), ("table_str", pa.string())]
+)
+
 
 # ----------------------------
-# 1. Load feedback from PostgreSQL
+# 1. Load new feedback from PostgreSQL
 # ----------------------------
-async def fetch_all_feedback_from_db(dsn: str, task: str = "text2sql"):
-    query = """
-        SELECT input, prediction, correct_output, is_correct
-        FROM feedback
-        WHERE task = $1
+async def fetch_watermark(conn, task: str) -> int:
+    """Return the id of the last feedback row a model was trained on, 0 if none."""
+    await conn.execute("""
+        CREATE TABLE IF NOT EXISTS retrain_watermark (
+            task TEXT PRIMARY KEY,
+            last_feedback_id BIGINT NOT NULL,
+            model_version TEXT,
+            trained_at TIMESTAMPTZ NOT NULL DEFAULT now()
+        )
+        """)
+    watermark = await conn.fetchval(
+        "SELECT last_feedback_id FROM retrain_watermark WHERE task = $1", task
+    )
+    return watermark or 0
+
+
+async def record_watermark(
+    conn, task: str, last_feedback_id: int, model_version: Optional[str]
+) -> None:
     """
-    conn = await asyncpg.connect(dsn)
-    rows = await conn.fetch(query, task)
-    await conn.close()
-
-    feedback = []
-    for row in rows:
-        correct = row["correct_output"] if not row["is_correct"] else row["prediction"]
-        if not correct:
-            continue
-        try:
-            parsed_input = json.loads(row["input"])
-            feedback.append(
-                {
-                    "question": parsed_input["question"],
-                    "sql": correct,
-                    "table_str": parsed_input["table_str"],
-                }
+    Record that the feedback up to `last_feedback_id` was used.
+
+    `model_version` is the model trained on it, or None if none of the rows could be
+    used for training; the previous model version and training time are kept then.
+    """
+    await conn.execute(
+        """
+        INSERT INTO retrain_watermark (task, last_feedback_id, model_version)
+        VALUES ($1, $2, $3)
+        ON CONFLICT (task) DO UPDATE SET
+            last_feedback_id = EXCLUDED.last_feedback_id,
+            model_version = COALESCE(
+                EXCLUDED.model_version, retrain_watermark.model_version
+            ),
+            trained_at = CASE WHEN EXCLUDED.model_version IS NULL
+                THEN retrain_watermark.trained_at ELSE now() END
+        """,
+        task,
+        last_feedback_id,
+        model_version,
+    )
+
+
+def feedback_to_example(row) -> Optional[dict]:
+    """Turn a feedback row into a training example, or None if it has no usable SQL."""
+    correct = row["correct_output"] if not row["is_correct"] else row["prediction"]
+    if not correct:
+        return None
+    try:
+        parsed_input = json.loads(row["input"])
+        return {
+            "question": parsed_input["question"],
+            "sql": correct,
+            "table_str": parsed_input["table_str"],
+        }
+    except Exception as e:
+        logger.warning(f"Skipping malformed feedback row: {e}")
+        return None
+
+
+async def export_new_feedback(
+    conn, path: str, task: str = "text2sql", batch_size: int = 5000
+) -> Tuple[int, int]:
+    """
+    Stream the feedback added since the last training run into an Arrow file.
+
+    Rows are read in id order with a server-side cursor, from the recorded watermark up
+    to the newest row at the start of the export, and every batch is appended to the
+    file as it arrives, so memory use does not grow with the size of the table.
+
+    Args:
+        conn (asyncpg.Connection): Connection to the database containing feedback data
+        path (str): Path of the Arrow file to write
+        task (str): Task of the feedback rows
+        batch_size (int): Rows fetched per round trip
+
+    Returns:
+        Tuple[int, int]: The number of examples written and the id of the newest row
+            read, which is the watermark to record once the model is trained.
+    """
+    watermark = await fetch_watermark(conn, task)
+    # Rows added during the export are left for the next run
+    upper = await conn.fetchval(
+        "SELECT COALESCE(MAX(id), 0) FROM feedback WHERE task = $1", task
+    )
+    logger.info(f"Exporting {task} feedback with ids in ({watermark}, {upper}]")
+    examples = 0
+    with pa.OSFile(path, "wb") as sink, pa.ipc.new_stream(
+        sink, FEEDBACK_SCHEMA
+    ) as writer:
+        # Server-side cursors only live inside a transaction
+        async with conn.transaction(readonly=True):
+            cursor = await conn.cursor(
+                """
+                SELECT id, input, prediction, correct_output, is_correct
+                FROM feedback
+                WHERE task = $1 AND id > $2 AND id <= $3
+                ORDER BY id
+                """,
+                task,
+                watermark,
+                upper,
             )
-        except Exception as e:
-            logger.warning(f"Skipping malformed feedback row: {e}")
-    return feedback
+            while rows := await cursor.fetch(batch_size):
+                batch = [
+                    example
+                    for example in map(feedback_to_example, rows)
+                    if example is not None
+                ]
+                if batch:
+                    writer.write_batch(
+                        pa.RecordBatch.from_pylist(batch, schema=FEEDBACK_SCHEMA)
+                    )
+                    examples += len(batch)
+    return examples, upper
+
+
+async def run_with_connection(dsn: str, function, *args):
+    """Run `function(conn, *args)` on a new connection to `dsn`."""
+    conn = await asyncpg.connect(dsn)
+    try:
+        return await function(conn, *args)
+    finally:
+        await conn.close()
 
 
 # ----------------------------
@@ -93,32 +193,58 @@ def build_formatting_func(tokenizer):
     return formatting_func
 
 
-def improve_lm_performance(model_id: str, db_url: str) -> None:
+def improve_lm_performance(
+    model_id: str,
+    db_url: str,
+    export_dir: str = "data/feedback_export",
+    fetch_batch_size: int = 5000,
+) -> None:
     """
     Improve the language model's performance by fine-tuning on feedback data and curated base data.
 
     This function performs the following steps:
-    1. Fetches feedback data from the database
+    1. Streams the feedback added since the last training run into an Arrow file
     2. Loads and samples curated base data
     3. Merges feedback and base data
     4. Loads the pre-trained model and tokenizer
     5. Sets up and runs the trainer for fine-tuning
     6. Pushes the fine-tuned model to the Hugging Face Hub
+    7. Records the feedback watermark the model was trained up to
 
     Args:
         model_id (str): The identifier of the pre-trained model to use
         db_url (str): The URL of the PostgreSQL database containing feedback data
+        export_dir (str): Directory of the exported feedback
+        fetch_batch_size (int): Feedback rows fetched per round trip
 
     Returns:
         None
     """
-    # 1. Fetch all feedback data
-    all_feedback_data = asyncio.run(fetch_all_feedback_from_db(db_url))
-    if not all_feedback_data:
-        logger.info("No feedback available for fine-tuning.")
+    # 1. Export the new feedback; the dataset memory-maps the file instead of loading it
+    os.makedirs(export_dir, exist_ok=True)
+    export_path = os.path.join(export_dir, "feedback.arrow")
+    examples, last_feedback_id = asyncio.run(
+        run_with_connection(
+            db_url, export_new_feedback, export_path, "text2sql", fetch_batch_size
+        )
+    )
+    if not examples:
+        # Move past rows that could not be used, so they are not read again every run
+        asyncio.run(
+            run_with_connection(
+                db_url, record_watermark, "text2sql", last_feedback_id, None
+            )
+        )
+        logger.info("No new feedback available for fine-tuning.")
         return
 
-    feedback_dataset = Dataset.from_list(all_feedback_data)
+    # Training dependencies are only needed once there is feedback to train on
+    from datasets import Dataset, load_dataset, concatenate_datasets
+    from trl import SFTTrainer, SFTConfig
+    from unsloth import FastLanguageModel
+
+    logger.info(f"Fine-tuning on {examples} new feedback examples")
+    feedback_dataset = Dataset.from_file(export_path)
 
     # 2. Load and sample curated WikiSQL base
     base_data = load_dataset("json", data_files="data/curated_base.jsonl")["train"]
@@ -182,14 +308,25 @@ def improve_lm_performance(model_id: str, db_url: str) -> None:
     trainer.train()
     logger.info(f"Model pushed to 🤗 Hub with tag: {version_tag}")
 
+    # 7. Only feedback after this id is used by the next run
+    asyncio.run(
+        run_with_connection(
+            db_url, record_watermark, "text2sql", last_feedback_id, version_tag
+        )
+    )
+    logger.info(f"Recorded feedback watermark {last_feedback_id}")
+
 
 # ----------------------------
 # 4. Run
 # ----------------------------
-MODEL = os.getenv("HF_MODEL", "nerzid/qwen2.5-3B-4bit-text2sql")
-DB_URL = os.getenv("POSTGRES_URL")
+if __name__ == "__main__":
+    MODEL = os.getenv("HF_MODEL", "nerzid/qwen2.5-3B-4bit-text2sql")
+    DB_URL = os.getenv("POSTGRES_URL")
+    EXPORT_DIR = os.getenv("FEEDBACK_EXPORT_DIR", "data/feedback_export")
+    FETCH_BATCH_SIZE = int(os.getenv("FEEDBACK_FETCH_BATCH_SIZE", 5000))
 
-if not DB_URL:
-    raise ValueError("Missing POSTGRES_URL in environment")
+    if not DB_URL:
+        raise ValueError("Missing POSTGRES_URL in environment")
 
-improve_lm_performance(MODEL, DB_URL)
+    improve_lm_performance(MODEL, DB_URL, EXPORT_DIR, FETCH_BATCH_SIZE)
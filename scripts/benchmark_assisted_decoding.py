@@ -0,0 +1,104 @@
+"""
+Benchmark decoding throughput of the text2sql model with and without assisted decoding.
+
+Run on CPU from the project root:
+
+    CUDA_VISIBLE_DEVICES="" python -m scripts.benchmark_assisted_decoding --runs 10 \
+        --draft-model Qwen/Qwen2.5-0.5B-Instruct
+"""
+
+import argparse
+import random
+import time
+
+import torch
+from transformers import AutoModelForCausalLM
+
+from app.core.constants import MAX_HEADERS, TEXT_TO_SQL_PROMPT_TEMPLATE
+from app.services import text_to_sql
+from app.services.assisted_decoding import (
+    AssistedDecodingStats,
+    assisted_generate_kwargs,
+)
+from scripts.benchmark_prefix_cache import load_questions
+from scripts.vectorize_headers import load_headers_from_file
+
+
+def run(prompts: list[str], mode: str, draft_model=None, num_tokens: int = 10):
+    tokenizer, model = text_to_sql._tokenizer, text_to_sql._model
+    stats = AssistedDecodingStats()
+    kwargs = assisted_generate_kwargs(
+        mode, draft_model=draft_model, prompt_lookup_num_tokens=num_tokens
+    )
+    outputs = []
+    start = time.perf_counter()
+    for prompt in prompts:
+        inputs = tokenizer(prompt, return_tensors="pt").to(model.device)
+        prompt_length = inputs["input_ids"].shape[-1]
+        with stats.measure(model, draft_model) as measurement, torch.no_grad():
+            # Greedy decoding, so every mode must produce the same SQL
+            output = model.generate(
+                **inputs,
+                max_new_tokens=text_to_sql.MAX_NEW_TOKENS,
+                do_sample=False,
+                pad_token_id=tokenizer.pad_token_id,
+                **kwargs,
+            )
+            measurement.record(output.shape[-1] - prompt_length)
+        outputs.append(output[0, prompt_length:].tolist())
+    elapsed = time.perf_counter() - start
+
+    result = stats.stats()
+    print(
+        f"{mode:<14} {result['new_tokens'] / elapsed:8.1f} tokens/s "
+        f"tokens/target forward={result['tokens_per_target_forward'] or 0:5.2f} "
+        f"acceptance rate={result['acceptance_rate'] or 0:5.2f}"
+    )
+    return outputs
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--headers-path", default="data/unique_headers.txt")
+    parser.add_argument("--questions-path", default="wikisql_sql_to_text_dataset.csv")
+    parser.add_argument("--draft-model", default=None)
+    parser.add_argument("--prompt-lookup-num-tokens", type=int, default=10)
+    parser.add_argument("--threads", type=int, default=None)
+    args = parser.parse_args()
+
+    if args.threads:
+        torch.set_num_threads(args.threads)
+    random.seed(42)
+
+    text_to_sql.load_model()
+    headers = load_headers_from_file(args.headers_path)
+    prompts = [
+        TEXT_TO_SQL_PROMPT_TEMPLATE.format(
+            table_str=text_to_sql._build_table_str(random.sample(headers, MAX_HEADERS)),
+            question=question,
+        )
+        for question in load_questions(args.questions_path, args.runs)
+    ]
+
+    # Warm up kernels
+    run(prompts[:1], "off")
+    baseline = run(prompts, "off")
+    candidates = {
+        "prompt_lookup": run(
+            prompts, "prompt_lookup", num_tokens=args.prompt_lookup_num_tokens
+        )
+    }
+    if args.draft_model:
+        draft_model = AutoModelForCausalLM.from_pretrained(
+            args.draft_model, trust_remote_code=True
+        ).to(text_to_sql._model.device)
+        candidates["draft"] = run(prompts, "draft", draft_model=draft_model)
+
+    for mode, outputs in candidates.items():
+        matches = sum(a == b for a, b in zip(baseline, outputs))
+        print(f"{mode}: {matches}/{len(prompts)} outputs identical to plain decoding")
+
+
+if __name__ == "__main__":
+    main()
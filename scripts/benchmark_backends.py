@@ -0,0 +1,179 @@
+"""
+Benchmark latency, memory and agreement with fp32 of the model inference backends.
+
+The AI detector classifies texts of wikisql_ai_dataset.csv and the text2sql model
+generates SQL for questions of wikisql_sql_to_text_dataset.csv. Agreement is the share
+of predicted labels, or generated SQL queries, identical to those of the fp32 backend.
+Run on CPU from the project root, after `scripts.export_models` for the onnx backend:
+
+    CUDA_VISIBLE_DEVICES="" python -m scripts.benchmark_backends --runs 200 \
+        --backends fp32 bf16 int8 onnx
+"""
+
+import argparse
+import csv
+import random
+import statistics
+import time
+
+import torch
+from transformers import AutoTokenizer
+
+from app.core.config import settings
+from app.core.constants import MAX_HEADERS, TEXT_TO_SQL_PROMPT_TEMPLATE
+from app.core.model_registry import resident_bytes
+from app.services import ai_detector, text_to_sql
+from app.services.model_backends import (
+    MODEL_BACKENDS,
+    load_causal_lm,
+    load_sequence_classifier,
+)
+from app.services.stopping import truncate_sql
+from scripts.benchmark_header_retrieval import percentile
+from scripts.benchmark_prefix_cache import load_questions
+from scripts.vectorize_headers import load_headers_from_file
+
+
+def load_texts(path: str, n: int) -> list[str]:
+    with open(path, "r", encoding="utf-8") as f:
+        return [row["text"].strip() for row in csv.DictReader(f)][:n]
+
+
+def summarize(name: str, timings: list[float], size_bytes: int, agreement) -> None:
+    print(
+        f"{name:<24} p50={statistics.median(timings):8.1f}ms "
+        f"p95={percentile(timings, 0.95):8.1f}ms "
+        f"weights={size_bytes / 2**20:8.1f}MiB "
+        f"agreement={'n/a' if agreement is None else f'{agreement:.3f}'}"
+    )
+
+
+def agreement_with(reference, predictions):
+    if reference is None:
+        return None
+    return sum(a == b for a, b in zip(reference, predictions)) / len(predictions)
+
+
+def benchmark_detector(backend: str, texts: list[str], batch_size: int, reference):
+    tokenizer = AutoTokenizer.from_pretrained(ai_detector.MODEL_PATH)
+    model = load_sequence_classifier(
+        ai_detector.MODEL_PATH, backend, settings.AI_DETECTOR_ONNX_PATH
+    )
+    labels, timings = [], []
+    for start in range(0, len(texts), batch_size):
+        inputs = tokenizer(
+            texts[start : start + batch_size],
+            return_tensors="pt",
+            padding=True,
+            truncation=True,
+        )
+        begin = time.perf_counter()
+        with torch.no_grad():
+            logits = model(
+                input_ids=inputs["input_ids"], attention_mask=inputs["attention_mask"]
+            ).logits
+        timings.append((time.perf_counter() - begin) * 1000)
+        labels.extend(logits.argmax(dim=-1).tolist())
+    summarize(
+        f"ai_detector/{backend}",
+        timings,
+        resident_bytes(model),
+        agreement_with(reference, labels),
+    )
+    return labels
+
+
+def benchmark_text2sql(backend: str, prompts: list[str], reference):
+    tokenizer = AutoTokenizer.from_pretrained(
+        text_to_sql.MODEL_PATH, trust_remote_code=True
+    )
+    model = load_causal_lm(
+        text_to_sql.MODEL_PATH,
+        backend,
+        settings.TEXT2SQL_ONNX_PATH,
+        trust_remote_code=True,
+        device_map="cpu",
+    )
+    queries, timings = [], []
+    for prompt in prompts:
+        inputs = tokenizer(prompt, return_tensors="pt")
+        prompt_length = inputs["input_ids"].shape[-1]
+        begin = time.perf_counter()
+        with torch.no_grad():
+            # Greedy decoding, so differences come from the backend only
+            output = model.generate(
+                **inputs,
+                max_new_tokens=text_to_sql.MAX_NEW_TOKENS,
+                do_sample=False,
+                pad_token_id=tokenizer.pad_token_id or tokenizer.eos_token_id,
+            )
+        timings.append((time.perf_counter() - begin) * 1000)
+        queries.append(
+            truncate_sql(
+                tokenizer.decode(output[0, prompt_length:], skip_special_tokens=True)
+            )
+        )
+    summarize(
+        f"text2sql/{backend}",
+        timings,
+        resident_bytes(model),
+        agreement_with(reference, queries),
+    )
+    return queries
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--runs", type=int, default=200)
+    parser.add_argument("--text2sql-runs", type=int, default=20)
+    parser.add_argument("--batch-size", type=int, default=16)
+    parser.add_argument(
+        "--backends",
+        nargs="+",
+        choices=MODEL_BACKENDS,
+        default=["fp32", "bf16", "int8"],
+    )
+    parser.add_argument(
+        "--models",
+        nargs="+",
+        choices=["ai_detector", "text2sql"],
+        default=["ai_detector", "text2sql"],
+    )
+    parser.add_argument("--ai-dataset-path", default="wikisql_ai_dataset.csv")
+    parser.add_argument("--questions-path", default="wikisql_sql_to_text_dataset.csv")
+    parser.add_argument("--headers-path", default="data/unique_headers.txt")
+    parser.add_argument("--threads", type=int, default=None)
+    args = parser.parse_args()
+
+    if args.threads:
+        torch.set_num_threads(args.threads)
+    random.seed(42)
+    # fp32 runs first, it is the reference for agreement
+    backends = ["fp32"] + [backend for backend in args.backends if backend != "fp32"]
+
+    if "ai_detector" in args.models:
+        texts = load_texts(args.ai_dataset_path, args.runs)
+        reference = None
+        for backend in backends:
+            labels = benchmark_detector(backend, texts, args.batch_size, reference)
+            reference = reference or labels
+
+    if "text2sql" in args.models:
+        headers = load_headers_from_file(args.headers_path)
+        prompts = [
+            TEXT_TO_SQL_PROMPT_TEMPLATE.format(
+                table_str=text_to_sql._build_table_str(
+                    random.sample(headers, MAX_HEADERS)
+                ),
+                question=question,
+            )
+            for question in load_questions(args.questions_path, args.text2sql_runs)
+        ]
+        reference = None
+        for backend in backends:
+            queries = benchmark_text2sql(backend, prompts, reference)
+            reference = reference or queries
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""
+Benchmark throughput and verdict agreement of early exit for long-document AI detection.
+
+Long documents are built by joining texts of the same label from wikisql_ai_dataset.csv.
+Every mode is compared with classifying all chunks. Run on CPU from the project root:
+
+    CUDA_VISIBLE_DEVICES="" python -m scripts.benchmark_early_exit --documents 50 \
+        --texts-per-document 400 --margins 0.5 0.8
+"""
+
+import argparse
+import csv
+import random
+import time
+from unittest.mock import patch
+
+import torch
+
+from app.services import ai_detector
+
+
+def build_documents(path: str, n: int, texts_per_document: int) -> list[str]:
+    with open(path, "r", encoding="utf-8") as f:
+        rows = list(csv.DictReader(f))
+    by_label = {}
+    for row in rows:
+        by_label.setdefault(row["label"], []).append(row["text"].strip())
+    labels = sorted(by_label)
+    return [
+        " ".join(random.sample(by_label[labels[i % len(labels)]], texts_per_document))
+        for i in range(n)
+    ]
+
+
+def run(name: str, documents: list[str], reference, **settings) -> list[bool]:
+    with patch.multiple(ai_detector.settings, **settings):
+        start = time.perf_counter()
+        results = ai_detector.detect_ai_generated_batch(documents)
+        elapsed = time.perf_counter() - start
+    verdicts = [result["ai_generated"] for result in results]
+    evaluated = sum(result["chunks_evaluated"] for result in results)
+    chunks = sum(result["chunks"] for result in results)
+    agreement = (
+        sum(a == b for a, b in zip(reference, verdicts)) / len(verdicts)
+        if reference
+        else 1.0
+    )
+    print(
+        f"{name:<16} {len(documents) / elapsed:8.2f} docs/s "
+        f"chunks evaluated={evaluated}/{chunks} ({evaluated / chunks:6.1%}) "
+        f"verdict agreement={agreement:6.1%}"
+    )
+    return verdicts
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--documents", type=int, default=50)
+    parser.add_argument("--texts-per-document", type=int, default=400)
+    parser.add_argument("--dataset-path", default="wikisql_ai_dataset.csv")
+    parser.add_argument("--margins", type=float, nargs="*", default=[0.5, 0.8])
+    parser.add_argument("--threads", type=int, default=None)
+    args = parser.parse_args()
+
+    if args.threads:
+        torch.set_num_threads(args.threads)
+    random.seed(42)
+    ai_detector.load_model()
+    documents = build_documents(
+        args.dataset_path, args.documents, args.texts_per_document
+    )
+    # Warm up kernels
+    run("warmup", documents[:2], None, AI_DETECTOR_EARLY_EXIT=False)
+
+    reference = run("all chunks", documents, None, AI_DETECTOR_EARLY_EXIT=False)
+    run(
+        "early exit",
+        documents,
+        reference,
+        AI_DETECTOR_EARLY_EXIT=True,
+        AI_DETECTOR_EARLY_EXIT_MARGIN=0,
+    )
+    for margin in args.margins:
+        run(
+            f"margin {margin}",
+            documents,
+            reference,
+            AI_DETECTOR_EARLY_EXIT=True,
+            AI_DETECTOR_EARLY_EXIT_MARGIN=margin,
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""
+Benchmark recall@10 and latency of lexical, vector and hybrid header retrieval.
+
+Gold columns are the selected and filtered columns of WikiSQL questions. Run from the
+project root with the WikiSQL question and table files:
+
+    python -m scripts.benchmark_header_retrieval --questions-path data/train.jsonl \
+        --tables-path data/train.tables.jsonl --runs 1000
+"""
+
+import argparse
+import json
+import statistics
+import time
+from unittest.mock import patch
+
+from app.retrieval.lexical_index import LexicalHeaderIndex
+from app.services import text_to_sql
+
+
+def load_examples(questions_path: str, tables_path: str, n: int) -> list[tuple]:
+    with open(tables_path, "r", encoding="utf-8") as f:
+        tables = {table["id"]: table["header"] for table in map(json.loads, f)}
+    examples = []
+    with open(questions_path, "r", encoding="utf-8") as f:
+        for line in f:
+            example = json.loads(line)
+            headers = tables[example["table_id"]]
+            sql = example["sql"]
+            gold = {headers[sql["sel"]]} | {headers[cond[0]] for cond in sql["conds"]}
+            examples.append((example["question"], {h.strip() for h in gold}))
+            if len(examples) == n:
+                break
+    return examples
+
+
+def percentile(timings: list[float], q: float) -> float:
+    timings = sorted(timings)
+    return timings[min(len(timings) - 1, int(len(timings) * q))]
+
+
+def evaluate(mode: str, examples: list[tuple], top_k: int) -> None:
+    hits, total, timings, embedded = 0, 0, [], 0
+    with patch.object(text_to_sql.settings, "HEADER_RETRIEVAL_MODE", mode):
+        for question, gold in examples:
+            start = time.perf_counter()
+            needs_embedding = text_to_sql._needs_embedding(question)
+            headers = text_to_sql.get_relevant_headers_batch([question], top_k)[0]
+            timings.append((time.perf_counter() - start) * 1000)
+            embedded += needs_embedding
+            hits += len(gold & set(headers))
+            total += len(gold)
+    print(
+        f"{mode:<8} recall@{top_k}={hits / total:.3f} "
+        f"p50={statistics.median(timings):7.2f}ms p99={percentile(timings, 0.99):7.2f}ms "
+        f"embedded={embedded / len(examples):.0%}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--questions-path", default="data/train.jsonl")
+    parser.add_argument("--tables-path", default="data/train.tables.jsonl")
+    parser.add_argument("--headers-path", default=text_to_sql.settings.HEADERS_PATH)
+    parser.add_argument("--runs", type=int, default=1000)
+    parser.add_argument("--top-k", type=int, default=10)
+    args = parser.parse_args()
+
+    examples = load_examples(args.questions_path, args.tables_path, args.runs)
+    if text_to_sql._lexical_index is None:
+        text_to_sql._lexical_index = LexicalHeaderIndex.from_file(args.headers_path)
+    # Warm up the embedding model
+    text_to_sql.embed_questions([examples[0][0]])
+
+    print(f"{len(examples)} questions, header index: {type(text_to_sql.collection)}")
+    for mode in ("lexical", "vector", "hybrid"):
+        evaluate(mode, examples, args.top_k)
+
+
+if __name__ == "__main__":
+    main()
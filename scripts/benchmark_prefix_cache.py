@@ -0,0 +1,119 @@
+"""
+Benchmark time-to-first-token of the text2sql model with and without prompt prefix reuse.
+
+Run on CPU from the project root:
+
+    CUDA_VISIBLE_DEVICES="" python -m scripts.benchmark_prefix_cache --runs 20
+"""
+
+import argparse
+import csv
+import random
+import statistics
+import time
+
+import torch
+
+from app.core.constants import MAX_HEADERS, TEXT_TO_SQL_PROMPT_TEMPLATE
+from app.services import text_to_sql
+from scripts.vectorize_headers import load_headers_from_file
+
+
+def load_questions(path: str, n: int) -> list[str]:
+    with open(path, "r", encoding="utf-8") as f:
+        questions = [row["text"].strip() for row in csv.DictReader(f)]
+    return questions[:n]
+
+
+def time_first_token(fn) -> float:
+    start = time.perf_counter()
+    fn()
+    return (time.perf_counter() - start) * 1000
+
+
+def summarize(name: str, timings: list[float]) -> None:
+    timings = sorted(timings)
+    p95 = timings[min(len(timings) - 1, int(len(timings) * 0.95))]
+    print(
+        f"{name:<28} mean={statistics.mean(timings):8.1f}ms "
+        f"p50={statistics.median(timings):8.1f}ms p95={p95:8.1f}ms"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--runs", type=int, default=20)
+    parser.add_argument("--headers-path", default="data/unique_headers.txt")
+    parser.add_argument("--questions-path", default="wikisql_sql_to_text_dataset.csv")
+    parser.add_argument("--threads", type=int, default=None)
+    args = parser.parse_args()
+
+    if args.threads:
+        torch.set_num_threads(args.threads)
+    random.seed(42)
+
+    text_to_sql.load_model()
+    tokenizer, model = text_to_sql._tokenizer, text_to_sql._model
+    prefix_cache = text_to_sql._prefix_cache or text_to_sql.PromptPrefixCache(
+        model, tokenizer, text_to_sql._PROMPT_STATIC_PREFIX
+    )
+
+    headers = load_headers_from_file(args.headers_path)
+    questions = load_questions(args.questions_path, args.runs)
+    # A handful of schemas that recur across requests, like popular tables do in production
+    schemas = [
+        text_to_sql._build_table_str(random.sample(headers, MAX_HEADERS))
+        for _ in range(4)
+    ]
+    prompts = [
+        TEXT_TO_SQL_PROMPT_TEMPLATE.format(
+            table_str=schemas[i % len(schemas)], question=question
+        )
+        for i, question in enumerate(questions)
+    ]
+
+    def full_prefill(prompt):
+        inputs = tokenizer(prompt, return_tensors="pt").to(model.device)
+        with torch.no_grad():
+            model.generate(**inputs, max_new_tokens=1, do_sample=False)
+
+    def static_prefix_only(prompt):
+        prefix, suffix = text_to_sql._split_prompt(prompt)
+        prefix_cache.generate(
+            [
+                (
+                    prefix_cache.static_prefix,
+                    prefix[len(prefix_cache.static_prefix) :] + suffix,
+                )
+            ],
+            max_new_tokens=1,
+            do_sample=False,
+        )
+
+    def static_and_schema_prefix(prompt):
+        prefix_cache.generate(
+            [text_to_sql._split_prompt(prompt)], max_new_tokens=1, do_sample=False
+        )
+
+    # Warm up kernels and populate the schema prefixes once
+    for prompt in prompts[: len(schemas)]:
+        full_prefill(prompt)
+        static_and_schema_prefix(prompt)
+
+    print(f"Prompt tokens: {len(tokenizer(prompts[0])['input_ids'])}")
+    print(f"Static prefix tokens: {prefix_cache.stats()['static_prefix_tokens']}")
+    summarize(
+        "no prefix reuse", [time_first_token(lambda: full_prefill(p)) for p in prompts]
+    )
+    summarize(
+        "static prefix reuse",
+        [time_first_token(lambda: static_prefix_only(p)) for p in prompts],
+    )
+    summarize(
+        "static + schema prefix reuse",
+        [time_first_token(lambda: static_and_schema_prefix(p)) for p in prompts],
+    )
+
+
+if __name__ == "__main__":
+    main()
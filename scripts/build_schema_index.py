@@ -0,0 +1,35 @@
+"""
+Build the table-aware schema index from a WikiSQL-style tables file.
+
+    python -m scripts.build_schema_index --tables-path data/train.tables.jsonl
+"""
+
+import argparse
+
+from app.chromadb.client import EMBEDDING_MODEL_NAME
+from app.core.config import settings
+from app.retrieval.table_index import build_table_index
+from scripts.headers_utils import iter_tables_from_file
+from scripts.vectorize_headers import embed_headers
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--tables-path", default="data/train.tables.jsonl")
+    parser.add_argument("--output", default=settings.SCHEMA_INDEX_PATH)
+    args = parser.parse_args()
+
+    counts = build_table_index(
+        args.output,
+        iter_tables_from_file(args.tables_path),
+        embed_headers,
+        model_name=EMBEDDING_MODEL_NAME,
+    )
+    print(
+        f"Done. Stored {counts['tables']} tables with {counts['columns']} distinct "
+        f"columns in {args.output}."
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,44 @@
+"""
+Export the AI detector and text2sql models to ONNX for the "onnx" inference backend.
+
+Run once from the project root, then set AI_DETECTOR_BACKEND=onnx or
+TEXT2SQL_BACKEND=onnx:
+
+    python -m scripts.export_models --model ai_detector
+    python -m scripts.export_models --model text2sql  # needs optimum[onnxruntime]
+"""
+
+import argparse
+import logging
+
+# The model paths come from the settings; importing the services would load the
+# header collection and the embedding model
+from app.core.config import settings
+from app.services.model_backends import export_causal_lm, export_sequence_classifier
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument(
+        "--model", choices=["ai_detector", "text2sql", "all"], default="all"
+    )
+    parser.add_argument("--ai-detector-output", default=settings.AI_DETECTOR_ONNX_PATH)
+    parser.add_argument("--text2sql-output", default=settings.TEXT2SQL_ONNX_PATH)
+    parser.add_argument("--opset", type=int, default=17)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    if args.model in ("ai_detector", "all"):
+        model_path = settings.MODEL_SQL2TEXT_AI_DETECTOR_PATH
+        export_sequence_classifier(
+            model_path, args.ai_detector_output, opset=args.opset
+        )
+        logging.info(f"Exported {model_path} to {args.ai_detector_output}")
+    if args.model in ("text2sql", "all"):
+        model_path = settings.MODEL_TEXT2SQL_PATH
+        export_causal_lm(model_path, args.text2sql_output)
+        logging.info(f"Exported {model_path} to {args.text2sql_output}")
+
+
+if __name__ == "__main__":
+    main()
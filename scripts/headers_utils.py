@@ -1,26 +1,69 @@
 import json
-from typing import Set
+from typing import Iterator, Set
 
 
-def extract_unique_headers_from_file(jsonl_path: str) -> Set[str]:
+def iter_headers_from_file(jsonl_path: str) -> Iterator[str]:
     """
-    Extracts a set of unique headers from a JSONL file of tables.
+    Streams the column headers of a JSONL file of tables, one table at a time.
 
     Args:
         jsonl_path (str): Path to the JSONL file.
 
-    Returns:
-        Set[str]: A set of unique column headers.
+    Yields:
+        str: Every non-empty header, including duplicates across tables.
+    """
+    with open(jsonl_path, "r", encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            for header in json.loads(line).get("header", []):
+                header = header.strip()
+                if header:
+                    yield header
+
+
+def iter_tables_from_file(jsonl_path: str) -> Iterator[dict]:
     """
-    unique_headers = set()
+    Streams the schemas of a JSONL file of tables, keeping the columns of each table.
+
+    Args:
+        jsonl_path (str): Path to the JSONL file.
 
+    Yields:
+        dict: The table id, its non-empty headers and their WikiSQL `types`
+            ("text" or "real"), and its caption or page title if it has one.
+    """
     with open(jsonl_path, "r", encoding="utf-8") as f:
         for line in f:
+            if not line.strip():
+                continue
             table = json.loads(line)
             headers = table.get("header", [])
-            unique_headers.update(headers)
+            types = table.get("types") or ["text"] * len(headers)
+            columns = [
+                (header.strip(), type_)
+                for header, type_ in zip(headers, types)
+                if header.strip()
+            ]
+            yield {
+                "id": table.get("id"),
+                "header": [header for header, _ in columns],
+                "types": [type_ for _, type_ in columns],
+                "caption": table.get("caption") or table.get("page_title") or "",
+            }
+
+
+def extract_unique_headers_from_file(jsonl_path: str) -> Set[str]:
+    """
+    Extracts a set of unique headers from a JSONL file of tables.
 
-    return unique_headers
+    Args:
+        jsonl_path (str): Path to the JSONL file.
+
+    Returns:
+        Set[str]: A set of unique column headers.
+    """
+    return set(iter_headers_from_file(jsonl_path))
 
 
 def save_headers(headers: Set[str], output_path: str) -> None:
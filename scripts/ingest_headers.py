@@ -0,0 +1,41 @@
+"""
+Incrementally ingest the headers of a WikiSQL-style tables file into ChromaDB.
+
+Only headers that are not in the manifest yet are embedded, so re-running on an
+unchanged or extended dataset only embeds what is new, and a crashed run resumes
+where it stopped:
+
+    python -m scripts.ingest_headers --tables-path data/train.tables.jsonl
+"""
+
+import argparse
+import time
+
+from app.chromadb.client import EMBEDDING_MODEL_NAME
+from app.chromadb.ingestion import HeaderManifest, ingest_headers
+from app.core.config import settings
+from scripts.headers_utils import iter_headers_from_file
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--tables-path", default="data/train.tables.jsonl")
+    parser.add_argument("--manifest-path", default=settings.HEADER_MANIFEST_PATH)
+    parser.add_argument("--batch-size", type=int, default=512)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    manifest = HeaderManifest(args.manifest_path, EMBEDDING_MODEL_NAME)
+    counts = ingest_headers(
+        iter_headers_from_file(args.tables_path),
+        manifest,
+        batch_size=args.batch_size,
+    )
+    print(
+        f"Done in {time.perf_counter() - start:.1f}s. Saw {counts['seen']} unique "
+        f"headers, ingested {counts['ingested']} new ones."
+    )
+
+
+if __name__ == "__main__":
+    main()
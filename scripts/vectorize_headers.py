@@ -1,4 +1,11 @@
-from app.chromadb.client import get_chroma_client, get_header_collection, upsert_headers
+import argparse
+
+import numpy as np
+
+from app.chromadb.client import EMBEDDING_MODEL_NAME, get_embedding_function
+from app.chromadb.ingestion import HeaderManifest, ingest_headers
+from app.core.config import settings
+from app.retrieval.numpy_index import build_numpy_index
 
 
 def load_headers_from_file(path: str) -> list[str]:
@@ -6,11 +13,54 @@ def load_headers_from_file(path: str) -> list[str]:
         return [line.strip() for line in f if line.strip()]
 
 
+def embed_headers(headers: list[str], batch_size: int = 5000) -> np.ndarray:
+    """
+    Embeds headers with the model used to embed questions at query time.
+
+    Args:
+        headers (list[str]): The headers to embed.
+        batch_size (int): Number of headers embedded per call.
+
+    Returns:
+        np.ndarray: Embeddings of shape (len(headers), dim).
+    """
+    embedding_function = get_embedding_function()
+    batches = []
+    for i in range(0, len(headers), batch_size):
+        batches.append(
+            np.asarray(embedding_function(headers[i : i + batch_size]), np.float32)
+        )
+        print(
+            f"Embedded batch {(i // batch_size) + 1} with {len(batches[-1])} headers."
+        )
+    return np.concatenate(batches)
+
+
 def main():
-    headers = load_headers_from_file("unique_headers.txt")
-    client = get_chroma_client()
-    collection = get_header_collection(client)
-    upsert_headers(collection, headers)
+    parser = argparse.ArgumentParser(description="Index the unique WikiSQL headers.")
+    parser.add_argument("--headers-path", default="data/unique_headers.txt")
+    parser.add_argument("--backend", choices=["chroma", "numpy"], default="chroma")
+    parser.add_argument("--output", default=settings.HEADER_INDEX_PATH)
+    parser.add_argument("--dtype", choices=["float32", "int8"], default="float32")
+    parser.add_argument("--manifest-path", default=settings.HEADER_MANIFEST_PATH)
+    args = parser.parse_args()
+
+    headers = load_headers_from_file(args.headers_path)
+    if args.backend == "numpy":
+        build_numpy_index(
+            args.output,
+            headers,
+            embed_headers(headers),
+            dtype=args.dtype,
+            model_name=get_embedding_function().model_name,
+        )
+        print(f"Done. Stored {len(headers)} headers in {args.output}.")
+    else:
+        # Goes through the manifest like scripts/ingest_headers.py, which also replaces
+        # headers stored under positional IDs
+        manifest = HeaderManifest(args.manifest_path, EMBEDDING_MODEL_NAME)
+        counts = ingest_headers(headers, manifest, batch_size=5000)
+        print(f"Done. Ingested {counts['ingested']} new headers into ChromaDB.")
 
 
 if __name__ == "__main__":
@@ -1,14 +1,22 @@
 from unittest.mock import patch, MagicMock
 
-from app.services.ai_detector import is_ai_generated
+import pytest
+import torch
+
+from app.services.ai_detector import (
+    classify_chunks,
+    detect_ai_generated_batch,
+    is_ai_generated,
+    sliding_windows,
+    spread_order,
+)
+from app.services.detection_cache import AIDetectionCache
 
 
 def test_is_ai_generated():
-    with patch("app.services.ai_detector._pipe") as mock_pipe:
+    with patch("app.services.ai_detector._model") as mock_model:
         # Setup mock
-        mock_model = MagicMock()
-        mock_pipe.model = mock_model
-        mock_pipe.model.config.id2label = {0: "HUMAN", 1: "AI"}
+        mock_model.config.id2label = {0: "HUMAN", 1: "AI"}
 
         # Test AI generated text
         mock_outputs = MagicMock()
@@ -26,3 +34,119 @@ def test_is_ai_generated():
 
                 result = is_ai_generated("This is a test text")
                 assert result is True
+
+
+def test_classify_chunks_batches_within_token_budget():
+    chunks = [[5, 6], [7, 8], [9]]
+    with patch("app.services.ai_detector._tokenizer") as mock_tokenizer, patch(
+        "app.services.ai_detector._model"
+    ) as mock_model, patch(
+        "app.services.ai_detector.settings.AI_DETECTOR_MAX_BATCH_TOKENS", 8
+    ):
+        mock_tokenizer.encode.side_effect = lambda text, add_special_tokens: (
+            [0, 42, 2] if add_special_tokens else [42]
+        )
+        mock_tokenizer.pad_token_id = 1
+        mock_model.device = "cpu"
+        mock_model.config.id2label = {0: "HUMAN", 1: "AI"}
+        mock_model.side_effect = lambda input_ids, attention_mask: MagicMock(
+            logits=torch.tensor([[0.0, 1.0]] * len(input_ids))
+        )
+
+        predictions = classify_chunks(chunks)
+
+    # Sorted by length, the short chunk and one chunk of four tokens fit into the
+    # budget of eight padded tokens
+    assert mock_model.call_count == 2
+    first_batch = mock_model.call_args_list[0].kwargs
+    assert first_batch["input_ids"].tolist() == [[0, 9, 2, 1], [0, 5, 6, 2]]
+    assert first_batch["attention_mask"].tolist() == [[1, 1, 1, 0], [1, 1, 1, 1]]
+    assert [label for label, _ in predictions] == ["ai", "ai", "ai"]
+    assert predictions[0][1] == pytest.approx(
+        torch.softmax(torch.tensor([0.0, 1.0]), 0)[1].item()
+    )
+
+
+def test_sliding_windows_overlap_by_stride():
+    assert sliding_windows(list(range(10)), window=4) == [
+        [0, 1, 2, 3],
+        [4, 5, 6, 7],
+        [8, 9],
+    ]
+    assert sliding_windows(list(range(10)), window=4, stride=2) == [
+        [0, 1, 2, 3],
+        [2, 3, 4, 5],
+        [4, 5, 6, 7],
+        [6, 7, 8, 9],
+    ]
+    assert sliding_windows([], window=4) == []
+    with pytest.raises(ValueError):
+        sliding_windows([1], window=4, stride=4)
+
+
+def test_detect_ai_generated_batch_aggregates_chunks_per_text():
+    with patch("app.services.ai_detector.load_model"), patch(
+        "app.services.ai_detector._tokenizer"
+    ), patch("app.services.ai_detector.chunk_tokens") as mock_chunk, patch(
+        "app.services.ai_detector.classify_chunks"
+    ) as mock_classify:
+        mock_chunk.side_effect = lambda text, max_tokens, stride: [[1]] * len(text)
+        mock_classify.return_value = [("ai", 0.9), ("human", 0.6), ("human", 0.7)]
+
+        results = detect_ai_generated_batch(["a", "bb"])
+
+    # One classification call covers the chunks of both texts
+    mock_classify.assert_called_once_with([[1], [1], [1]])
+    assert results[0] == {
+        "ai_generated": True,
+        "score": 1.0,
+        "chunks": 1,
+        "chunks_evaluated": 1,
+    }
+    assert results[1]["ai_generated"] is False
+    assert results[1]["score"] == 0.0
+
+
+def test_early_exit_stops_once_remaining_chunks_cannot_flip_the_vote():
+    chunks = [[i] for i in range(10)]
+    # Confident AI chunks first, human chunks later
+    labels = {i: ("ai", 0.95) if i < 6 else ("human", 0.9) for i in range(10)}
+    with patch("app.services.ai_detector.load_model"), patch(
+        "app.services.ai_detector._tokenizer"
+    ), patch("app.services.ai_detector.chunk_tokens", return_value=chunks), patch(
+        "app.services.ai_detector.classify_chunks",
+        side_effect=lambda batch: [labels[chunk[0]] for chunk in batch],
+    ) as mock_classify, patch.multiple(
+        "app.services.ai_detector.settings",
+        AI_DETECTOR_EARLY_EXIT=True,
+        AI_DETECTOR_EARLY_EXIT_MIN_CHUNKS=2,
+        AI_DETECTOR_EARLY_EXIT_MARGIN=0,
+    ):
+        (result,) = detect_ai_generated_batch(["long text"])
+
+    # After 2 + 4 chunks AI leads by 5.7, more than the 4 remaining chunks can add
+    assert [len(call.args[0]) for call in mock_classify.call_args_list] == [2, 4]
+    assert result["ai_generated"] is True
+    assert result["chunks"] == 10
+    assert result["chunks_evaluated"] == 6
+
+
+def test_spread_order_is_a_permutation_covering_the_text_early():
+    assert spread_order(8) == [0, 4, 2, 6, 1, 5, 3, 7]
+    order = spread_order(37)
+    assert sorted(order) == list(range(37))
+    assert max(order[:4]) >= 27
+
+
+def test_classify_chunks_classifies_each_uncached_chunk_once():
+    cache = AIDetectionCache("detector")
+    cache.set_chunks([[1]], [("human", 0.7)])
+    with patch("app.services.ai_detector._detection_cache", cache), patch(
+        "app.services.ai_detector._classify_chunks",
+        side_effect=lambda chunks: [("ai", 0.9)] * len(chunks),
+    ) as mock_classify:
+        predictions = classify_chunks([[1], [2, 3], [2, 3]])
+        assert classify_chunks([[2, 3]]) == [("ai", 0.9)]
+
+    mock_classify.assert_called_once_with([[2, 3]])
+    assert predictions == [("human", 0.7), ("ai", 0.9), ("ai", 0.9)]
@@ -0,0 +1,75 @@
+import threading
+
+import pytest
+import torch
+
+from app.services.assisted_decoding import (
+    AssistedDecodingStats,
+    assisted_generate_kwargs,
+)
+
+
+def test_assisted_generate_kwargs_per_mode():
+    draft = torch.nn.Linear(2, 2)
+    assert assisted_generate_kwargs("off") == {}
+    assert assisted_generate_kwargs("draft", draft_model=draft) == {
+        "assistant_model": draft
+    }
+    assert assisted_generate_kwargs("prompt_lookup", prompt_lookup_num_tokens=4) == {
+        "prompt_lookup_num_tokens": 4
+    }
+    with pytest.raises(ValueError):
+        assisted_generate_kwargs("draft")
+    with pytest.raises(ValueError):
+        assisted_generate_kwargs("medusa")
+
+
+def test_stats_count_forward_passes_and_accepted_tokens():
+    model, draft = torch.nn.Linear(2, 2), torch.nn.Linear(2, 2)
+    stats = AssistedDecodingStats()
+    with stats.measure(model, draft) as measurement:
+        # Two verification rounds, each checking three draft tokens
+        for _ in range(2):
+            for _ in range(3):
+                draft(torch.zeros(2))
+            model(torch.zeros(2))
+        measurement.record(new_tokens=6)
+    # Hooks are removed once the generation finished
+    model(torch.zeros(2))
+
+    result = stats.stats()
+    assert result["target_forwards"] == 2
+    assert result["accepted_tokens"] == 4
+    assert result["tokens_per_target_forward"] == 3
+    assert result["acceptance_rate"] == pytest.approx(4 / 6)
+
+
+def test_concurrent_generations_are_measured_apart_without_waiting():
+    model = torch.nn.Linear(2, 2)
+    stats = AssistedDecodingStats()
+    inside = threading.Barrier(2, timeout=5)
+    counts = {}
+
+    def generate(name, forwards):
+        with stats.measure(model) as measurement:
+            # Both generations are measured at the same time
+            inside.wait()
+            for _ in range(forwards):
+                model(torch.zeros(2))
+            inside.wait()
+            measurement.record(new_tokens=forwards)
+        counts[name] = measurement.target_forwards
+
+    threads = [
+        threading.Thread(target=generate, args=(name, forwards))
+        for name, forwards in (("short", 2), ("long", 5))
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert counts == {"short": 2, "long": 5}
+    assert stats.stats()["target_forwards"] == 7
+    # The shared hook is removed once the last generation finished
+    assert not model._forward_hooks
@@ -0,0 +1,57 @@
+import threading
+
+import pytest
+
+from app.services.batching import MicroBatcher
+
+
+def test_micro_batcher_returns_each_caller_its_result():
+    batch_sizes = []
+
+    def process(items):
+        batch_sizes.append(len(items))
+        return [item * 2 for item in items]
+
+    batcher = MicroBatcher(process, max_batch_size=4, max_wait_ms=50)
+    results = {}
+
+    def worker(i):
+        results[i] = batcher(i)
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(10)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    batcher.shutdown()
+
+    assert results == {i: i * 2 for i in range(10)}
+    assert sum(batch_sizes) == 10
+    assert max(batch_sizes) <= 4
+    assert len(batch_sizes) < 10  # concurrent requests were coalesced
+
+
+def test_micro_batcher_propagates_errors_to_all_callers():
+    def process(items):
+        raise ValueError("boom")
+
+    batcher = MicroBatcher(process, max_batch_size=2, max_wait_ms=50)
+    futures = [batcher.submit(i) for i in range(2)]
+    for future in futures:
+        with pytest.raises(ValueError):
+            future.result(timeout=5)
+    batcher.shutdown()
+
+
+def test_micro_batcher_rejects_wrong_number_of_results():
+    batcher = MicroBatcher(lambda items: [], max_batch_size=1, max_wait_ms=0)
+    with pytest.raises(RuntimeError):
+        batcher(1, timeout=5)
+    batcher.shutdown()
+
+
+def test_micro_batcher_rejects_submit_after_shutdown():
+    batcher = MicroBatcher(lambda items: items)
+    batcher.shutdown()
+    with pytest.raises(RuntimeError):
+        batcher.submit(1)
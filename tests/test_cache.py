@@ -0,0 +1,194 @@
+import time
+
+import numpy as np
+
+from app.core.cache import LRUCache, RedisCache, TieredCache
+from app.services.detection_cache import AIDetectionCache
+from app.services.sql_cache import (
+    Text2SQLCache,
+    normalize_question,
+    question_literals,
+)
+
+
+class FakeRedis:
+    """Minimal in-memory stand-in for the redis client."""
+
+    def __init__(self, fail: bool = False):
+        self.data = {}
+        self.fail = fail
+        self.calls = 0
+
+    def get(self, key):
+        self.calls += 1
+        if self.fail:
+            raise ConnectionError("redis down")
+        return self.data.get(key)
+
+    def set(self, key, value, ex=None):
+        self.calls += 1
+        if self.fail:
+            raise ConnectionError("redis down")
+        self.data[key] = value
+
+    def mget(self, keys):
+        self.calls += 1
+        if self.fail:
+            raise ConnectionError("redis down")
+        return [self.data.get(key) for key in keys]
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
+
+
+class FakePipeline:
+    def __init__(self, redis: FakeRedis):
+        self.redis = redis
+        self.commands = []
+
+    def set(self, key, value, ex=None):
+        self.commands.append((key, value))
+
+    def execute(self):
+        self.redis.calls += 1
+        if self.redis.fail:
+            raise ConnectionError("redis down")
+        self.redis.data.update(self.commands)
+
+
+def test_lru_cache_evicts_least_recently_used():
+    cache = LRUCache(max_entries=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1
+    cache.set("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+    assert cache.stats() == {"entries": 2, "hits": 3, "misses": 1}
+
+
+def test_lru_cache_expires_entries():
+    cache = LRUCache(max_entries=2, ttl_seconds=0.01)
+    cache.set("a", 1)
+    time.sleep(0.02)
+    assert cache.get("a") is None
+    assert len(cache) == 0
+
+
+def test_tiered_cache_promotes_redis_hits_to_memory():
+    redis = FakeRedis()
+    shared = RedisCache("test:", client_factory=lambda: redis)
+    TieredCache(LRUCache(), shared).set("key", {"sql": "SELECT 1"})
+
+    cache = TieredCache(LRUCache(), shared)
+    assert cache.get("key") == {"sql": "SELECT 1"}
+    calls = redis.calls
+    assert cache.get("key") == {"sql": "SELECT 1"}
+    assert redis.calls == calls
+    assert cache.stats()["redis"]["hits"] == 1
+
+
+def test_redis_cache_errors_are_misses_and_back_off():
+    redis = FakeRedis(fail=True)
+    cache = RedisCache("test:", client_factory=lambda: redis, retry_after_seconds=60)
+    assert cache.get("key") is None
+    cache.set("key", "value")
+    assert redis.calls == 1  # skipped while backing off
+    assert cache.stats()["errors"] == 1
+
+
+def test_text2sql_cache_exact_and_semantic_tiers():
+    cache = Text2SQLCache("model@1", semantic_threshold=0.9)
+    headers = ["Notes", "State"]
+    embedding = np.array([1.0, 0.0, 0.0])
+    cache.set("Notes for South Australia?", headers, "query=SELECT Notes", embedding)
+
+    # Exact tier ignores whitespace and trailing punctuation, but not case
+    assert (
+        cache.get("Notes  for South Australia", ["State", "Notes"])
+        == "query=SELECT Notes"
+    )
+    assert cache.get("notes for south australia", ["State", "Notes"]) is None
+    # Semantic tier serves close paraphrases for the same header set only
+    paraphrase = np.array([0.99, 0.1, 0.0])
+    paraphrased = "What are the notes for South Australia?"
+    assert cache.get(paraphrased, headers, paraphrase) == "query=SELECT Notes"
+    assert cache.get(paraphrased, ["Notes"], paraphrase) is None
+    assert cache.get("Unrelated", headers, np.array([0.0, 1.0, 0.0])) is None
+    assert cache.stats()["semantic"]["hits"] == 1
+
+
+def test_semantic_tier_requires_the_same_literals():
+    cache = Text2SQLCache("model@1", semantic_threshold=0.9)
+    headers = ["Name", "Age"]
+    # The embedding model lowercases, and close numbers barely move the embedding
+    embedding = np.array([1.0, 0.0, 0.0])
+    cache.set("Players named Smith", headers, "query=... = 'Smith'", embedding)
+    cache.set("Players older than 30", headers, "query=... > 30", embedding)
+
+    assert cache.get("players named smith", headers, embedding) is None
+    assert cache.get("Players older than 31", headers, embedding) is None
+    assert cache.get("List players named Smith", headers, embedding) == (
+        "query=... = 'Smith'"
+    )
+    assert cache.get("Which players are older than 30", headers, embedding) == (
+        "query=... > 30"
+    )
+
+
+def test_question_literals():
+    assert question_literals("Show players named 'van Dijk' older than 30.5") == (
+        "'van Dijk'",
+        "30.5",
+    )
+    assert question_literals("Players from South Australia") == ("Australia", "South")
+    assert question_literals("players from south australia") == ()
+
+
+def test_text2sql_cache_is_invalidated_by_model_version():
+    cache = Text2SQLCache("model@1")
+    cache.set("question", ["a"], "query=SELECT a")
+    cache.set_model_version("model@1")
+    assert cache.get("question", ["a"]) == "query=SELECT a"
+    cache.set_model_version("model@2")
+    assert cache.get("question", ["a"]) is None
+
+
+def test_normalize_question():
+    assert normalize_question("  What IS\tthis?? ") == "What IS this"
+    assert normalize_question("players named Smith") != normalize_question(
+        "players named smith"
+    )
+
+
+def test_tiered_cache_get_many_asks_redis_for_memory_misses_only():
+    redis = FakeRedis()
+    shared = RedisCache("test:", client_factory=lambda: redis)
+    TieredCache(LRUCache(), shared).set_many({"a": 1, "b": 2})
+    assert redis.calls == 1
+
+    cache = TieredCache(LRUCache(), shared)
+    cache.memory.set("a", 10)
+    assert cache.get_many(["a", "b", "c"]) == [10, 2, None]
+    assert redis.calls == 2
+    assert shared.stats() == {"hits": 1, "misses": 1, "errors": 0}
+    # The Redis hit was promoted to memory
+    assert cache.memory.get("b") == 2
+
+
+def test_ai_detection_cache_keys_on_normalized_text_and_model():
+    cache = AIDetectionCache("detector@fp32")
+    result = {"ai_generated": True, "score": 0.9, "chunks": 1, "chunks_evaluated": 1}
+    cache.set_results(["Some  text\n"], [result])
+
+    assert cache.get_results(["Some text", "Other text"]) == [result, None]
+    assert AIDetectionCache("detector@int8").get_results(["Some text"]) == [None]
+
+    cache.set_chunks([[1, 2], [3]], [("ai", 0.9), ("human", 0.6)])
+    assert cache.get_chunks([[3], [1, 2], [1]]) == [("human", 0.6), ("ai", 0.9), None]
+
+    stats = cache.stats()
+    assert stats["documents"]["hit_rate"] == 0.5
+    assert stats["chunks"]["hits"] == 2
+    assert stats["chunks"]["lookups"] == 3
@@ -0,0 +1,52 @@
+from app.services.disambiguation_gate import DisambiguationGate
+
+HEADERS = ["Player", "Goals", "Club", "Season"]
+
+
+def test_questions_naming_their_columns_skip_the_llm():
+    gate = DisambiguationGate()
+    decision = gate.check("Which player scored the most goals in 2010?", HEADERS)
+    assert not decision.needs_disambiguation
+    assert decision.header_matches == 2
+    # Singular and plural forms match
+    assert not gate.check("who has most goal", HEADERS).needs_disambiguation
+
+
+def test_ambiguous_questions_are_sent_to_the_llm():
+    gate = DisambiguationGate()
+    assert gate.check("", HEADERS).reason == "empty"
+    assert gate.check("players goals", HEADERS).reason == "no_question_form"
+    assert gate.check("How many goals did they score?", HEADERS).reason == (
+        "vague_reference"
+    )
+    assert gate.check("Who won the award?", HEADERS).reason == "no_header_match"
+    assert gate.check(
+        "Which club had the best goalkeeper and striker during playoffs?", HEADERS
+    ).reason == ("low_coverage")
+    long_question = "What is " + " ".join(["goals"] * 50)
+    assert gate.check(long_question, HEADERS).reason == "too_long"
+
+
+def test_classifier_is_consulted_for_questions_the_heuristics_find_clear():
+    scores = []
+
+    def classifier(question):
+        scores.append(question)
+        return 0.9
+
+    gate = DisambiguationGate(classifier=classifier, classifier_threshold=0.8)
+    assert gate.check("Who won the award?", HEADERS).needs_disambiguation
+    assert scores == []
+    assert gate.check("Show goals per club", HEADERS).reason == "classifier"
+    assert scores == ["Show goals per club"]
+
+
+def test_stats_count_skipped_checks():
+    gate = DisambiguationGate()
+    gate.check("List the goals of every player", HEADERS)
+    gate.check("list it", HEADERS)
+    stats = gate.stats()
+    assert stats["checked"] == 2
+    assert stats["skipped"] == 1
+    assert stats["skip_rate"] == 0.5
+    assert stats["reasons"] == {"clear": 1, "vague_reference": 1}
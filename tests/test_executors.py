@@ -0,0 +1,32 @@
+import asyncio
+import threading
+
+import pytest
+
+from app.core.executors import BoundedExecutor, ExecutorSaturatedError
+
+
+def test_bounded_executor_runs_jobs():
+    executor = BoundedExecutor("test", max_workers=2, max_queue_depth=2)
+    assert executor.submit(lambda x: x + 1, 1).result(timeout=5) == 2
+    assert asyncio.run(executor.run(lambda: "done")) == "done"
+    executor.shutdown()
+
+
+def test_bounded_executor_rejects_when_saturated():
+    executor = BoundedExecutor("test", max_workers=1, max_queue_depth=1, retry_after=7)
+    release = threading.Event()
+    running = executor.submit(release.wait)
+    queued = executor.submit(release.wait)
+    assert executor.in_flight == 2
+
+    with pytest.raises(ExecutorSaturatedError) as exc_info:
+        executor.submit(release.wait)
+    assert exc_info.value.retry_after == 7
+
+    release.set()
+    running.result(timeout=5)
+    queued.result(timeout=5)
+    # Slots are released once jobs finish
+    assert executor.submit(lambda: 1).result(timeout=5) == 1
+    executor.shutdown()
@@ -0,0 +1,151 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from app.services.feedback import FeedbackWriter
+
+
+class FakeAsyncRedis:
+    """In-memory stand-in for the async redis client, with a round-trip counter."""
+
+    def __init__(self, fail: bool = False):
+        self.lists = {}
+        self.round_trips = 0
+        self.fail = fail
+        self.closed = False
+
+    async def rpush(self, key, *values):
+        self.round_trips += 1
+        if self.fail:
+            raise ConnectionError("redis down")
+        self.lists.setdefault(key, []).extend(values)
+        return len(self.lists[key])
+
+    def pipeline(self, transaction=True):
+        return FakeAsyncPipeline(self)
+
+    async def aclose(self):
+        self.closed = True
+
+
+class FakeAsyncPipeline:
+    def __init__(self, redis: FakeAsyncRedis):
+        self.redis = redis
+        self.commands = []
+
+    def rpush(self, key, *values):
+        self.commands.append((key, values))
+
+    async def execute(self):
+        self.redis.round_trips += 1
+        if self.redis.fail:
+            raise ConnectionError("redis down")
+        for key, values in self.commands:
+            self.redis.lists.setdefault(key, []).extend(values)
+        return [len(self.redis.lists[key]) for key, _ in self.commands]
+
+
+def test_direct_mode_pushes_every_event():
+    redis = FakeAsyncRedis()
+    writer = FeedbackWriter(lambda: redis, queue="q")
+
+    async def run():
+        await writer.start()
+        for i in range(3):
+            await writer.push(f"event {i}")
+        await writer.aclose()
+
+    asyncio.run(run())
+    assert redis.lists["q"] == ["event 0", "event 1", "event 2"]
+    assert redis.round_trips == 3
+    assert redis.closed
+
+
+def test_buffered_mode_groups_concurrent_events_into_pipelined_batches():
+    redis = FakeAsyncRedis()
+    writer = FeedbackWriter(
+        lambda: redis, queue="q", buffered=True, max_batch_size=100, flush_interval_ms=5
+    )
+
+    async def run():
+        await asyncio.gather(*(writer.push(f"event {i}") for i in range(250)))
+        await writer.aclose()
+
+    asyncio.run(run())
+    # Two full batches, and the rest flushed once the interval elapsed
+    assert redis.lists["q"] == [f"event {i}" for i in range(250)]
+    assert redis.round_trips == 3
+    assert writer.stats()["pushed"] == 250
+    assert writer.stats()["flushes"] == 3
+
+
+def test_buffered_event_is_flushed_after_the_interval():
+    redis = FakeAsyncRedis()
+    writer = FeedbackWriter(
+        lambda: redis, queue="q", buffered=True, max_batch_size=100, flush_interval_ms=5
+    )
+
+    async def run():
+        await asyncio.wait_for(writer.push("event"), timeout=1)
+        return list(redis.lists["q"])
+
+    assert asyncio.run(run()) == ["event"]
+
+
+def test_failed_flush_fails_every_request_of_the_batch():
+    redis = FakeAsyncRedis(fail=True)
+    writer = FeedbackWriter(lambda: redis, buffered=True, max_batch_size=2)
+
+    async def run():
+        return await asyncio.gather(
+            writer.push("a"), writer.push("b"), return_exceptions=True
+        )
+
+    results = asyncio.run(run())
+    assert all(isinstance(result, ConnectionError) for result in results)
+    assert writer.stats()["failed"] == 2
+
+
+def test_events_buffered_on_a_previous_loop_fail_instead_of_hanging():
+    redis = FakeAsyncRedis()
+    writer = FeedbackWriter(
+        lambda: redis, buffered=True, max_batch_size=10, flush_interval_ms=10000
+    )
+    old_loop = asyncio.new_event_loop()
+    thread = threading.Thread(target=old_loop.run_forever, daemon=True)
+    thread.start()
+    try:
+        pending = asyncio.run_coroutine_threadsafe(writer.push("a"), old_loop)
+        time.sleep(0.05)
+
+        async def run():
+            push = asyncio.create_task(writer.push("b"))
+            await asyncio.sleep(0)
+            await writer.flush()
+            await push
+
+        asyncio.run(run())
+        with pytest.raises(RuntimeError):
+            pending.result(timeout=1)
+    finally:
+        old_loop.call_soon_threadsafe(old_loop.stop)
+        thread.join()
+        old_loop.close()
+    assert redis.lists["feedback_queue"] == ["b"]
+    assert writer.stats()["failed"] == 1
+
+
+def test_buffered_mode_sustains_thousands_of_events_per_second():
+    redis = FakeAsyncRedis()
+    writer = FeedbackWriter(lambda: redis, buffered=True, max_batch_size=500)
+
+    async def run():
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        await asyncio.gather(*(writer.push("{}") for _ in range(20000)))
+        return 20000 / (loop.time() - start)
+
+    assert asyncio.run(run()) > 5000
+    assert redis.round_trips == 40
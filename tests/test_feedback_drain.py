@@ -0,0 +1,227 @@
+import asyncio
+import json
+import sqlite3
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.services.feedback_drain import (
+    FeedbackDrain,
+    SQLiteFeedbackStore,
+    parse_feedback,
+)
+
+
+class FakeAsyncRedis:
+    """In-memory stand-in for the list commands of the async redis client."""
+
+    def __init__(self):
+        self.lists = {}
+        self.closed = False
+
+    async def lrange(self, key, start, end):
+        values = self.lists.get(key, [])
+        return values[start : None if end == -1 else end + 1]
+
+    def pipeline(self, transaction=True):
+        return FakeAsyncPipeline(self)
+
+    async def aclose(self):
+        self.closed = True
+
+
+class FakeAsyncPipeline:
+    def __init__(self, redis: FakeAsyncRedis):
+        self.redis = redis
+        self.commands = []
+
+    def __getattr__(self, name):
+        return lambda *args: self.commands.append((name, args))
+
+    async def execute(self):
+        lists, results = self.redis.lists, []
+        for name, args in self.commands:
+            key = args[0]
+            if name == "rpush":
+                lists.setdefault(key, []).extend(args[1:])
+                results.append(len(lists[key]))
+            elif name == "ltrim":
+                lists[key] = lists.get(key, [])[args[1] :]
+                results.append(True)
+            elif name == "llen":
+                results.append(len(lists.get(key, [])))
+            elif name == "lindex":
+                values = lists.get(key, [])
+                results.append(values[args[1]] if values else None)
+        return results
+
+
+class FailingStore:
+    def __init__(self):
+        self.attempts = 0
+
+    async def connect(self):
+        pass
+
+    async def write(self, rows):
+        self.attempts += 1
+        raise ConnectionError("database down")
+
+    async def close(self):
+        pass
+
+
+class DroppingStore(SQLiteFeedbackStore):
+    """SQLite store whose first connection is dropped before the first write."""
+
+    def __init__(self, path):
+        super().__init__(path)
+        self.connects = 0
+        self.closes = 0
+
+    async def connect(self):
+        self.connects += 1
+        await super().connect()
+
+    async def write(self, rows):
+        if self.connects == 1:
+            raise ConnectionError("connection was closed in the middle of operation")
+        return await super().write(rows)
+
+    async def close(self):
+        self.closes += 1
+        await super().close()
+
+
+def event(question="How many users?", is_correct=True, age_seconds=0, **fields):
+    payload = {
+        "input": {"question": question, "table_str": "Users(id, name)"},
+        "prediction": "SELECT COUNT(*) FROM Users",
+        "is_correct": is_correct,
+        "correct_output": "SELECT COUNT(*) FROM Users",
+        "task": "text2sql",
+        "model": "text2sql-model",
+        "timestamp": (datetime.utcnow() - timedelta(seconds=age_seconds)).isoformat(),
+    }
+    payload.update(fields)
+    return json.dumps(payload).encode()
+
+
+def stored_rows(path):
+    with sqlite3.connect(path) as conn:
+        return conn.execute(
+            "SELECT input, prediction, is_correct, task FROM feedback ORDER BY id"
+        ).fetchall()
+
+
+def test_parse_feedback_hashes_content_without_timestamp():
+    first = parse_feedback(event(age_seconds=60))
+    second = parse_feedback(event())
+
+    assert first.content_hash == second.content_hash
+    assert first.content_hash != parse_feedback(event(question="Other?")).content_hash
+    assert json.loads(first.input)["question"] == "How many users?"
+    assert isinstance(first.created_at, datetime)
+    with pytest.raises(ValueError):
+        parse_feedback(b'{"prediction": "SELECT 1"}')
+    with pytest.raises(ValueError):
+        parse_feedback(b"not json")
+
+
+def test_drain_writes_batches_and_dedupes_replays(tmp_path):
+    db = str(tmp_path / "feedback.db")
+    redis = FakeAsyncRedis()
+    redis.lists["q"] = [event(f"Question {i}?") for i in range(25)]
+    # A replay of an event that was stored but not trimmed before a crash
+    redis.lists["q"].append(event("Question 3?"))
+    drain = FeedbackDrain(SQLiteFeedbackStore(db), lambda: redis, "q", batch_size=10)
+
+    asyncio.run(drain.run(once=True))
+
+    rows = stored_rows(db)
+    assert len(rows) == 25
+    assert json.loads(rows[0][0])["question"] == "Question 0?"
+    assert rows[0][1:] == ("SELECT COUNT(*) FROM Users", 1, "text2sql")
+    assert redis.lists["q"] == []
+    stats = drain.stats()
+    assert stats["drained"] == 26
+    assert stats["inserted"] == 25
+    assert stats["duplicates"] == 1
+    assert stats["batches"] == 3
+    assert stats["lag_events"] == 0
+    assert redis.closed
+
+
+def test_invalid_events_go_to_the_dead_letter_queue(tmp_path):
+    db = str(tmp_path / "feedback.db")
+    redis = FakeAsyncRedis()
+    redis.lists["q"] = [event(), b"not json", event(prediction=None)]
+    drain = FeedbackDrain(SQLiteFeedbackStore(db), lambda: redis, "q")
+
+    asyncio.run(drain.run(once=True))
+
+    assert len(stored_rows(db)) == 1
+    assert len(redis.lists["q:dead"]) == 2
+    assert drain.stats()["invalid"] == 2
+
+
+def test_failed_writes_keep_the_batch_and_back_off():
+    redis = FakeAsyncRedis()
+    redis.lists["q"] = [event(age_seconds=30), event("Other?")]
+    store = FailingStore()
+    drain = FeedbackDrain(
+        store,
+        lambda: redis,
+        "q",
+        poll_interval_seconds=0.01,
+        max_backoff_seconds=0.04,
+    )
+
+    async def run_briefly():
+        stop = asyncio.Event()
+        task = asyncio.create_task(drain.run(stop))
+        await asyncio.sleep(0.2)
+        stop.set()
+        await task
+
+    asyncio.run(run_briefly())
+
+    # Backing off 0.01, 0.02, 0.04, 0.04... leaves a handful of attempts, not hundreds
+    assert 3 <= store.attempts <= 10
+    assert drain.stats()["failures"] == store.attempts
+    assert len(redis.lists["q"]) == 2
+
+    drain.store = FailingStore()
+    with pytest.raises(ConnectionError):
+        asyncio.run(drain.run(once=True))
+    asyncio.run(drain._update_lag(redis))
+    assert drain.stats()["lag_events"] == 2
+    assert drain.stats()["lag_seconds"] >= 30
+
+
+def test_drain_reconnects_to_the_store_after_a_connection_error(tmp_path):
+    db = str(tmp_path / "feedback.db")
+    redis = FakeAsyncRedis()
+    redis.lists["q"] = [event(f"Question {i}?") for i in range(3)]
+    store = DroppingStore(db)
+    drain = FeedbackDrain(store, lambda: redis, "q", poll_interval_seconds=0.01)
+
+    async def run_until_drained():
+        stop = asyncio.Event()
+        task = asyncio.create_task(drain.run(stop))
+        for _ in range(100):
+            await asyncio.sleep(0.01)
+            if not redis.lists["q"]:
+                break
+        stop.set()
+        await task
+
+    asyncio.run(run_until_drained())
+
+    assert store.connects == 2
+    # Closed once to reconnect, and once when the drain stopped
+    assert store.closes == 2
+    assert drain.stats()["failures"] == 1
+    assert drain.stats()["reconnects"] == 1
+    assert len(stored_rows(db)) == 3
+    assert redis.lists["q"] == []
@@ -0,0 +1,95 @@
+import pytest
+
+from app.chromadb.client import header_id
+from app.chromadb.ingestion import (
+    HeaderManifest,
+    delete_positional_headers,
+    ingest_headers,
+)
+
+
+class FakeCollection:
+    def __init__(self, fail_after_batches=None):
+        self.documents = {}
+        self.batches = 0
+        self.fail_after_batches = fail_after_batches
+
+    def upsert(self, ids, documents):
+        if self.batches == self.fail_after_batches:
+            raise RuntimeError("crash")
+        self.batches += 1
+        self.documents.update(zip(ids, documents))
+
+    def get(self, include, limit=None, offset=0):
+        ids = list(self.documents)[offset:]
+        return {"ids": ids[:limit] if limit is not None else ids}
+
+    def delete(self, ids):
+        for id_ in ids:
+            del self.documents[id_]
+
+
+def test_header_ids_are_content_addressed():
+    assert header_id("Name") == header_id("Name")
+    assert header_id("Name") != header_id("name")
+
+
+def test_reingesting_only_embeds_new_headers(tmp_path):
+    path = str(tmp_path / "manifest.jsonl")
+    collection = FakeCollection()
+
+    counts = ingest_headers(
+        ["a", "b", "a", "c"], HeaderManifest(path, "model"), lambda: collection
+    )
+    assert counts == {"seen": 3, "ingested": 3}
+
+    collection.batches = 0
+    counts = ingest_headers(
+        ["c", "b", "a", "d"], HeaderManifest(path, "model"), lambda: collection
+    )
+    assert counts == {"seen": 4, "ingested": 1}
+    assert collection.batches == 1
+    assert sorted(collection.documents.values()) == ["a", "b", "c", "d"]
+
+
+def test_ingestion_resumes_after_crash(tmp_path):
+    path = str(tmp_path / "manifest.jsonl")
+    headers = [f"header {i}" for i in range(10)]
+
+    crashing = FakeCollection(fail_after_batches=2)
+    with pytest.raises(RuntimeError):
+        ingest_headers(headers, HeaderManifest(path, "model"), lambda: crashing, 3)
+    # A write interrupted mid-line is cut off on resume
+    with open(path, "a", encoding="utf-8") as f:
+        f.write('{"id": "h_')
+
+    manifest = HeaderManifest(path, "model")
+    assert len(manifest) == 6
+    crashing.fail_after_batches = None
+    counts = ingest_headers(headers, manifest, lambda: crashing, batch_size=3)
+    assert counts["ingested"] == 4
+    # The batch after the torn line was not glued onto it
+    assert len(HeaderManifest(path, "model")) == 10
+
+    with pytest.raises(ValueError):
+        HeaderManifest(path, "another-model")
+
+
+def test_delete_positional_headers():
+    collection = FakeCollection()
+    collection.upsert(["header_0", "header_1", header_id("a")], ["x", "y", "a"])
+    assert delete_positional_headers(collection, page_size=2) == 2
+    assert list(collection.documents.values()) == ["a"]
+
+
+def test_new_manifest_replaces_headers_stored_under_positional_ids(tmp_path):
+    collection = FakeCollection()
+    collection.upsert(["header_0", "header_1"], ["a", "b"])
+
+    ingest_headers(
+        ["a", "b"],
+        HeaderManifest(str(tmp_path / "m.jsonl"), "model"),
+        lambda: collection,
+    )
+
+    assert collection.documents == {header_id("a"): "a", header_id("b"): "b"}
@@ -0,0 +1,39 @@
+from app.retrieval.lexical_index import (
+    LexicalHeaderIndex,
+    reciprocal_rank_fusion,
+    tokenize,
+)
+
+HEADERS = ["Notes", "South Australia", "Goals", "Order Year", "Year", "Position"]
+
+
+def test_tokenize_drops_stopwords():
+    assert tokenize("What are the Notes for South-Australia?") == [
+        "notes",
+        "south",
+        "australia",
+    ]
+
+
+def test_columns_named_verbatim_rank_first():
+    index = LexicalHeaderIndex(HEADERS)
+    ranked = [header for header, _ in index.search("notes for south australia")]
+    assert ranked[:2] == ["South Australia", "Notes"]
+    assert "Position" not in ranked
+
+
+def test_trigrams_match_inflected_words():
+    index = LexicalHeaderIndex(HEADERS)
+    assert index.search("who scored the most goal", top_k=1)[0][0] == "Goals"
+    # Only headers whose words all occur in the question are confident
+    assert index.confident_matches("who scored the most goal") == []
+    assert index.confident_matches("notes for order year 1998") == [
+        "Order Year",
+        "Notes",
+        "Year",
+    ]
+
+
+def test_reciprocal_rank_fusion_rewards_agreement():
+    fused = reciprocal_rank_fusion([["a", "b", "c"], ["b", "d"]])
+    assert [item for item, _ in fused] == ["b", "a", "d", "c"]
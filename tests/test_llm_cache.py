@@ -0,0 +1,121 @@
+from app.llm.cache import RedisLMCache
+
+
+class FakeRedis:
+    """In-memory stand-in for the redis commands used by the LM cache."""
+
+    def __init__(self, fail: bool = False):
+        self.data = {}
+        self.index = {}
+        self.fail = fail
+
+    def get(self, key):
+        return self.data.get(key)
+
+    def set(self, key, value, ex=None):
+        self.data[key] = value
+
+    def zadd(self, key, mapping, xx=False):
+        for member, score in mapping.items():
+            if not xx or member in self.index:
+                self.index[member] = score
+
+    def zcard(self, key):
+        return len(self.index)
+
+    def zpopmin(self, key, count):
+        oldest = sorted(self.index.items(), key=lambda item: item[1])[:count]
+        for member, _ in oldest:
+            del self.index[member]
+        return oldest
+
+    def delete(self, *keys):
+        for key in keys:
+            self.data.pop(key, None)
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
+
+
+class FakePipeline:
+    def __init__(self, redis: FakeRedis):
+        self.redis = redis
+        self.commands = []
+
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: self.commands.append((name, args, kwargs))
+
+    def execute(self):
+        if self.redis.fail:
+            raise ConnectionError("redis down")
+        return [
+            getattr(self.redis, name)(*args, **kwargs)
+            for name, args, kwargs in self.commands
+        ]
+
+
+def request(text: str) -> dict:
+    return {
+        "model": "lm_studio/qwen3-4b",
+        "messages": [{"role": "user", "content": text}],
+        "api_key": "secret",
+    }
+
+
+class Response:
+    """Pickleable stand-in for a litellm response."""
+
+    def __init__(self, content: str):
+        self.content = content
+        self.usage = {"total_tokens": 15}
+
+
+def test_completions_are_shared_across_processes_through_redis():
+    redis = FakeRedis()
+    writer = RedisLMCache(client_factory=lambda: redis, ttl_seconds=60)
+    writer.put(request("who has most goal"), Response("SELECT 1"), ["api_key"])
+
+    key = next(iter(redis.data))
+    assert key.startswith("dspy:lm:lm_studio/qwen3-4b:")
+    # Stored compressed, not as a plain pickle
+    assert b"SELECT 1" not in redis.data[key]
+
+    # A fresh worker has nothing in memory and is served from Redis
+    reader = RedisLMCache(client_factory=lambda: redis)
+    cached = reader.get(request("who has most goal"), ["api_key"])
+    assert cached.content == "SELECT 1"
+    # No tokens were spent on a cache hit
+    assert cached.usage == {}
+    assert reader.get(request("another question"), ["api_key"]) is None
+    assert reader.stats()["redis_hits"] == 1
+    assert reader.stats()["misses"] == 1
+
+
+def test_least_recently_used_entries_are_evicted_beyond_the_limit():
+    redis = FakeRedis()
+    cache = RedisLMCache(client_factory=lambda: redis, max_entries=2)
+    cache.put(request("a"), "A")
+    cache.put(request("b"), "B")
+    cache.reset_memory_cache()
+    assert cache.get(request("a")) == "A"
+    cache.put(request("c"), "C")
+    cache.reset_memory_cache()
+
+    assert len(redis.data) == 2
+    assert cache.get(request("b")) is None
+    assert cache.get(request("a")) == "A"
+    assert cache.stats()["evictions"] == 1
+
+
+def test_oversized_values_and_redis_errors_are_not_fatal():
+    redis = FakeRedis()
+    cache = RedisLMCache(client_factory=lambda: redis, max_entry_bytes=64)
+    cache.put(request("long"), "x" * 10_000 + "".join(map(str, range(1000))))
+    assert redis.data == {}
+    assert cache.stats()["oversized"] == 1
+
+    redis.fail = True
+    cache.put(request("short"), "A")
+    # Still served from the in-process tier
+    assert cache.get(request("short")) == "A"
+    assert cache.stats()["errors"] == 1
@@ -0,0 +1,227 @@
+import asyncio
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest.mock import patch
+
+import dspy
+import pytest
+from dspy.clients.cache import Cache
+
+from app.llm.client import AsyncLLMClient, CircuitBreaker, CircuitOpenError
+from app.llm.predictors import AsyncPredictor
+from app.llm.signatures import DisambiguateTextForSQL
+from app.services import text_to_sql
+
+COMPLETION = (
+    "[[ ## disambiguated_text ## ]]\nWhich player scored the most goals?\n\n"
+    "[[ ## is_too_vague ## ]]\nFalse\n\n[[ ## completed ## ]]"
+)
+
+
+class StubLLMServer:
+    """OpenAI-compatible chat completions server on localhost."""
+
+    def __init__(self, delay: float = 0.0, status: int = 200):
+        self.delay = delay
+        self.status = status
+        self.requests = []
+        self.concurrent = 0
+        self.max_concurrent = 0
+        self.connections = set()
+        self._lock = threading.Lock()
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                with stub._lock:
+                    stub.requests.append((self.path, body))
+                    stub.connections.add(self.client_address)
+                    stub.concurrent += 1
+                    stub.max_concurrent = max(stub.max_concurrent, stub.concurrent)
+                time.sleep(stub.delay)
+                with stub._lock:
+                    stub.concurrent -= 1
+                payload = json.dumps(
+                    {"choices": [{"message": {"content": COMPLETION}}]}
+                ).encode()
+                self.send_response(stub.status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_port}/v1"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture(autouse=True)
+def memory_lm_cache():
+    # Completions must not be served from the on-disk cache of an earlier run
+    with patch.object(
+        dspy,
+        "cache",
+        Cache(enable_disk_cache=False, enable_memory_cache=True, disk_cache_dir=None),
+    ):
+        yield
+
+
+@pytest.fixture
+def stub_server():
+    servers = []
+
+    def start(**kwargs):
+        servers.append(StubLLMServer(**kwargs))
+        return servers[-1]
+
+    yield start
+    for server in servers:
+        server.close()
+
+
+def test_predictor_parses_completion_over_keep_alive_connections(stub_server):
+    server = stub_server()
+    client = AsyncLLMClient(server.url, "qwen3-4b", max_connections=2)
+    predict = AsyncPredictor(DisambiguateTextForSQL, client=client, max_tokens=100)
+
+    async def run():
+        results = [
+            await predict(text=f"who has most goal in {year}", relevant_headers="[]")
+            for year in (2001, 2002, 2003)
+        ]
+        await client.aclose()
+        return results
+
+    results = asyncio.run(run())
+    assert results[0]["disambiguated_text"] == "Which player scored the most goals?"
+    assert results[0]["is_too_vague"] is False
+    path, body = server.requests[0]
+    assert path == "/v1/chat/completions"
+    assert body["model"] == "qwen3-4b"
+    assert body["max_tokens"] == 100
+    # Sequential calls reuse one pooled connection
+    assert len(server.connections) == 1
+
+
+def test_predictor_serves_repeated_prompts_from_the_lm_cache(stub_server):
+    server = stub_server()
+    client = AsyncLLMClient(server.url, "qwen3-4b")
+    predict = AsyncPredictor(DisambiguateTextForSQL, client=client)
+
+    async def run():
+        results = [
+            await predict(text="who has most goal", relevant_headers="['Goals']")
+            for _ in range(2)
+        ]
+        await client.aclose()
+        return results
+
+    first, second = asyncio.run(run())
+    assert first["disambiguated_text"] == second["disambiguated_text"]
+    assert len(server.requests) == 1
+
+
+def test_client_limits_requests_in_flight(stub_server):
+    server = stub_server(delay=0.1)
+    client = AsyncLLMClient(server.url, "model", max_concurrency=2)
+
+    async def run():
+        await asyncio.gather(*(client.complete([]) for _ in range(6)))
+        await client.aclose()
+
+    asyncio.run(run())
+    assert len(server.requests) == 6
+    assert server.max_concurrent == 2
+
+
+def test_circuit_opens_after_failures_and_closes_after_trial(stub_server):
+    server = stub_server(delay=0.6)
+    breaker = CircuitBreaker(failure_threshold=2, reset_seconds=0.3)
+    client = AsyncLLMClient(server.url, "model", timeout_seconds=0.2, breaker=breaker)
+
+    async def run():
+        for _ in range(2):
+            with pytest.raises(asyncio.TimeoutError):
+                await client.complete([])
+        # Open: rejected without reaching the server
+        with pytest.raises(CircuitOpenError):
+            await client.complete([])
+        requests = len(server.requests)
+
+        await asyncio.sleep(0.3)
+        server.delay = 0
+        assert await client.complete([]) == COMPLETION
+        await client.aclose()
+        return requests
+
+    assert asyncio.run(run()) == 2
+    assert breaker.state == "closed"
+    assert client.stats()["timeouts"] == 2
+    assert client.stats()["rejected"] == 1
+
+
+def test_cancelled_trial_call_does_not_keep_the_circuit_half_open(stub_server):
+    server = stub_server(delay=0.5)
+    breaker = CircuitBreaker(failure_threshold=1, reset_seconds=0.05)
+    client = AsyncLLMClient(server.url, "model", breaker=breaker)
+    breaker.record_failure()
+
+    async def run():
+        await asyncio.sleep(0.05)
+        trial = asyncio.create_task(client.complete([]))
+        await asyncio.sleep(0.1)
+        trial.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await trial
+        server.delay = 0
+        result = await client.complete([])
+        await client.aclose()
+        return result
+
+    assert asyncio.run(run()) == COMPLETION
+    assert breaker.state == "closed"
+
+
+def test_preprocess_text_async_falls_back_to_raw_question():
+    async def failing_predictor(**inputs):
+        raise CircuitOpenError("down")
+
+    with patch.object(
+        text_to_sql, "get_relevant_headers", return_value=["Goals"]
+    ), patch.object(text_to_sql, "aget_disambiguated_text", failing_predictor):
+        result = asyncio.run(text_to_sql.preprocess_text_async(" who has most goal "))
+
+    assert result == {"disambiguated_text": "who has most goal", "is_too_vague": False}
+
+
+def test_aclose_closes_the_pool_on_the_loop_that_created_it(stub_server):
+    server = stub_server()
+    client = AsyncLLMClient(server.url, "model")
+    loop = asyncio.new_event_loop()
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    try:
+        # Used from a loop in another thread, like the text2sql pipeline does
+        asyncio.run_coroutine_threadsafe(client.complete([]), loop).result(5)
+        pool = client._client
+
+        asyncio.run(client.aclose())
+
+        assert pool.is_closed
+        assert client.stats()["requests"] == 1
+    finally:
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join(5)
+        loop.close()
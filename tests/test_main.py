@@ -1,5 +1,9 @@
+import json
+import threading
+
 import pytest
 from fastapi.testclient import TestClient
+from app.core.executors import BoundedExecutor
 from app.main import app
 from app.schemas.base_models import TextRequest, QueryRequest
 
@@ -22,9 +26,121 @@ def test_health_check():
 def test_endpoints_with_valid_input(endpoint, request_data, monkeypatch):
     # Mock the actual processing functions
     if endpoint == "/is_ai_generated":
-        monkeypatch.setattr("app.main.is_ai_generated", lambda text: True)
+        monkeypatch.setattr(
+            "app.main.detect_ai_generated",
+            lambda text: {
+                "ai_generated": True,
+                "score": 1.0,
+                "chunks": 3,
+                "chunks_evaluated": 2,
+            },
+        )
     elif endpoint == "/text2sql":
-        monkeypatch.setattr("app.main.text2sql", lambda question: "SELECT * FROM users")
+        monkeypatch.setattr(
+            "app.main.text2sql", lambda question, trace=None: "SELECT * FROM users"
+        )
 
     response = client.post(endpoint, json=request_data)
     assert response.status_code == 200
+    if endpoint == "/text2sql":
+        assert "Server-Timing" in response.headers
+
+
+def test_saturated_service_rejects_with_retry_after(monkeypatch):
+    executor = BoundedExecutor("text2sql", max_workers=1, max_queue_depth=0)
+    monkeypatch.setattr("app.main.text2sql_executor", executor)
+    release = threading.Event()
+    blocked = executor.submit(release.wait)
+    try:
+        response = client.post("/text2sql", json={"question": "Show me all users"})
+        assert response.status_code == 503
+        assert response.headers["Retry-After"] == "1"
+
+        # Cheap endpoints stay responsive while inference is saturated
+        assert client.get("/health").status_code == 200
+    finally:
+        release.set()
+        blocked.result(timeout=5)
+        executor.shutdown()
+
+
+def test_text2sql_stream_sends_tokens_as_events(monkeypatch):
+    monkeypatch.setattr(
+        "app.main.stream_text2sql",
+        lambda question, submit=None, trace=None: iter(
+            ["query=SELECT", " * FROM users;"]
+        ),
+    )
+    response = client.post("/text2sql/stream", json={"question": "Show me all users"})
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+    assert response.text == (
+        'data: {"token": "query=SELECT"}\n\n'
+        'data: {"token": " * FROM users;"}\n\n'
+        "event: done\ndata: {}\n\n"
+    )
+
+
+def test_batch_ai_detection_returns_results_in_order(monkeypatch):
+    monkeypatch.setattr(
+        "app.main.detect_ai_generated_many",
+        lambda texts: [
+            {
+                "ai_generated": "AI" in text,
+                "score": 0.9 if "AI" in text else 0.1,
+                "chunks_evaluated": 1,
+            }
+            for text in texts
+        ],
+    )
+    response = client.post(
+        "/is_ai_generated/batch", json={"texts": ["Written by AI", "Written by me"]}
+    )
+    assert response.status_code == 200
+    results = response.json()["results"]
+    assert [result["ai_generated"] for result in results] == [True, False]
+    assert results[0]["score"] == 0.9
+
+    response = client.post("/is_ai_generated/batch", json={"texts": ["ok", " "]})
+    assert response.status_code == 400
+
+
+def test_feedback_is_enqueued_on_the_shared_writer(monkeypatch):
+    class RecordingWriter:
+        def __init__(self):
+            self.events = []
+
+        async def push(self, event):
+            self.events.append(json.loads(event))
+
+    writer = RecordingWriter()
+    monkeypatch.setattr("app.main.feedback_writer", writer)
+    feedback = {
+        "input": {"question": "Show me all users", "table_str": "id (text)"},
+        "prediction": "SELECT * FROM users",
+        "is_correct": True,
+        "task": "text2sql",
+    }
+    response = client.post("/feedback", json=feedback)
+    assert response.status_code == 200
+    assert writer.events[0]["correct_output"] == "SELECT * FROM users"
+
+    response = client.post("/feedback", json={**feedback, "task": "unknown"})
+    assert response.status_code == 400
+    assert len(writer.events) == 1
+
+
+def test_llm_clients_are_reported_and_closed_at_shutdown(monkeypatch):
+    closed = []
+
+    async def aclose(name):
+        closed.append(name)
+
+    monkeypatch.setattr("app.main.llm_client.aclose", lambda: aclose("api"))
+    monkeypatch.setattr(
+        "app.main.pipeline_llm_client.aclose", lambda: aclose("pipeline")
+    )
+    with TestClient(app) as lifespan_client:
+        metrics = lifespan_client.get("/metrics").json()
+    assert metrics["llm_pipeline"]["circuit"] == metrics["llm"]["circuit"]
+    assert closed == ["api", "pipeline"]
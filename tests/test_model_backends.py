@@ -0,0 +1,71 @@
+from types import SimpleNamespace
+from unittest.mock import MagicMock, patch
+
+import numpy as np
+import pytest
+import torch
+
+from app.core.model_registry import resident_bytes
+from app.services.model_backends import (
+    OnnxSequenceClassifier,
+    check_backend,
+    load_causal_lm,
+    quantize_int8,
+    weights_fingerprint,
+)
+
+
+def test_quantize_int8_shrinks_linear_layers_and_keeps_predictions():
+    torch.manual_seed(0)
+    model = torch.nn.Sequential(
+        torch.nn.Linear(64, 64), torch.nn.ReLU(), torch.nn.Linear(64, 2)
+    )
+    inputs = torch.randn(32, 64)
+    expected = model(inputs).argmax(dim=-1)
+
+    quantized = quantize_int8(model)
+
+    assert resident_bytes(quantized) < resident_bytes(model) / 2
+    agreement = (quantized(inputs).argmax(dim=-1) == expected).float().mean()
+    assert agreement >= 0.9
+
+
+def test_onnx_sequence_classifier_runs_session_with_int64_inputs():
+    session = MagicMock()
+    session.run.return_value = [np.array([[0.1, 0.9]], dtype=np.float32)]
+    model = OnnxSequenceClassifier(session, SimpleNamespace(id2label={0: "HUMAN"}), 7)
+
+    outputs = model(input_ids=torch.tensor([[0, 5, 2]], dtype=torch.int32))
+
+    names, feed = session.run.call_args.args
+    assert names == ["logits"]
+    assert feed["input_ids"].dtype == np.int64
+    assert feed["attention_mask"].tolist() == [[1, 1, 1]]
+    assert outputs.logits[0].tolist() == pytest.approx([0.1, 0.9])
+    assert resident_bytes(model) == 7
+
+
+def test_load_causal_lm_int8_stays_on_cpu():
+    with patch(
+        "app.services.model_backends.AutoModelForCausalLM.from_pretrained"
+    ) as mock_load, patch("app.services.model_backends.quantize_int8") as mock_quantize:
+        load_causal_lm("model", "int8", device_map="auto", trust_remote_code=True)
+
+    mock_load.assert_called_once_with(
+        "model", dtype=torch.float32, trust_remote_code=True
+    )
+    mock_quantize.assert_called_once()
+    with pytest.raises(ValueError):
+        check_backend("fp8")
+
+
+def test_weights_fingerprint_changes_when_the_weights_are_replaced(tmp_path):
+    (tmp_path / "config.json").write_text("{}")
+    (tmp_path / "model.safetensors").write_bytes(b"weights")
+    (tmp_path / "README.md").write_text("notes")
+    fingerprint = weights_fingerprint(str(tmp_path))
+
+    (tmp_path / "README.md").write_text("other notes")
+    assert weights_fingerprint(str(tmp_path)) == fingerprint
+    (tmp_path / "model.safetensors").write_bytes(b"new weights")
+    assert weights_fingerprint(str(tmp_path)) != fingerprint
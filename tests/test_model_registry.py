@@ -0,0 +1,98 @@
+import threading
+import time
+
+import pytest
+import torch
+
+from app.core.model_registry import ModelRegistry, resident_bytes
+
+
+def _linear(n_in: int) -> torch.nn.Module:
+    # float32 weights plus bias: (n_in + 1) * 4 bytes
+    return torch.nn.Linear(n_in, 1)
+
+
+def test_resident_bytes_counts_shared_tensors_once():
+    model = _linear(255)
+    assert resident_bytes(model) == 1024
+    assert resident_bytes({"model": model, "again": [model]}) == 1024
+    assert resident_bytes("no tensors") == 0
+
+
+def test_concurrent_first_gets_load_once():
+    registry = ModelRegistry()
+    calls = []
+
+    def loader():
+        calls.append(1)
+        time.sleep(0.05)
+        return _linear(3)
+
+    registry.register("model", loader)
+    results = []
+    threads = [
+        threading.Thread(target=lambda: results.append(registry.get("model")))
+        for _ in range(8)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(calls) == 1
+    assert all(result is results[0] for result in results)
+    stats = registry.stats()["models"]["model"]
+    assert stats["loads"] == 1
+    assert stats["load_seconds"] >= 0.05
+
+
+def test_budget_evicts_least_recently_used_unpinned_model():
+    unloaded = []
+    registry = ModelRegistry(max_memory_bytes=2048)
+    for name in ("a", "b", "c"):
+        registry.register(
+            name,
+            lambda: _linear(255),
+            on_unload=lambda name=name: unloaded.append(name),
+        )
+
+    registry.get("a")
+    registry.get("b")
+    registry.get("a")  # "b" is now least recently used
+    registry.get("c")
+    assert unloaded == ["b"]
+    assert registry.resident_bytes == 2048
+
+    # A pinned model survives even though it is least recently used
+    with registry.use("a"):
+        registry.get("b")
+    assert unloaded == ["b", "c"]
+    assert registry.stats()["models"]["a"]["loaded"] is True
+
+
+def test_evict_idle_unloads_models_past_ttl():
+    registry = ModelRegistry(idle_ttl_seconds=0.05)
+    registry.register("idle", lambda: _linear(3))
+    registry.register("busy", lambda: _linear(3))
+    registry.get("idle")
+    registry.get("busy")
+    time.sleep(0.1)
+
+    with registry.use("busy"):
+        assert registry.evict_idle() == 1
+    stats = registry.stats()["models"]
+    assert stats["idle"]["loaded"] is False
+    assert stats["busy"]["loaded"] is True
+
+    # An unloaded model is loaded again on the next use
+    registry.get("idle")
+    assert registry.stats()["models"]["idle"]["loads"] == 2
+
+
+def test_unknown_and_duplicate_models_are_rejected():
+    registry = ModelRegistry()
+    registry.register("model", lambda: None)
+    with pytest.raises(ValueError):
+        registry.register("model", lambda: None)
+    with pytest.raises(KeyError):
+        registry.get("missing")
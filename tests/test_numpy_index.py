@@ -0,0 +1,49 @@
+import numpy as np
+import pytest
+
+from app.retrieval.numpy_index import NumpyHeaderIndex, build_numpy_index
+
+
+@pytest.fixture
+def header_data():
+    rng = np.random.default_rng(0)
+    headers = [f"header_{i}" for i in range(500)]
+    return headers, rng.normal(size=(500, 32)).astype(np.float32)
+
+
+@pytest.mark.parametrize("dtype", ["float32", "int8"])
+def test_search_matches_brute_force_ranking(tmp_path, header_data, dtype):
+    headers, embeddings = header_data
+    build_numpy_index(str(tmp_path), headers, embeddings, dtype=dtype)
+    index = NumpyHeaderIndex.load(str(tmp_path))
+    assert isinstance(index.embeddings, np.memmap)
+    assert not index.embeddings.flags.writeable
+
+    queries = embeddings[:3] + 0.01
+    ids, scores = index.search(queries, top_k=10)
+
+    normalized = embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True)
+    expected = np.argsort(
+        -(queries / np.linalg.norm(queries, axis=1, keepdims=True)) @ normalized.T,
+        axis=1,
+    )[:, :10]
+    assert ids.shape == (3, 10)
+    assert list(ids[:, 0]) == [0, 1, 2]
+    assert np.all(np.diff(scores, axis=1) <= 0)
+    if dtype == "float32":
+        np.testing.assert_array_equal(ids, expected)
+    else:
+        # Quantization may swap near ties, but keeps the neighbourhood
+        assert np.mean([len(set(a) & set(b)) for a, b in zip(ids, expected)]) >= 8
+
+
+def test_query_returns_chroma_layout(tmp_path, header_data):
+    headers, embeddings = header_data
+    build_numpy_index(str(tmp_path), headers, embeddings)
+    index = NumpyHeaderIndex.load(str(tmp_path))
+
+    result = index.query([embeddings[7].tolist()], n_results=3)
+    assert result["documents"][0][0] == "header_7"
+    assert len(result["documents"][0]) == 3
+    assert result["distances"][0][0] == pytest.approx(0.0, abs=1e-5)
+    assert index.query([embeddings[7]], n_results=1000)["documents"][0][-1] in headers
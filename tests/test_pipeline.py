@@ -0,0 +1,47 @@
+import time
+
+import pytest
+
+from app.services.pipeline import PipelineStats, PipelineTrace, word_overlap
+
+
+def test_trace_adds_up_repeated_stages_and_formats_server_timing():
+    trace = PipelineTrace()
+    for _ in range(2):
+        with trace.stage("retrieve"):
+            time.sleep(0.01)
+    with trace.stage("generate"):
+        pass
+    trace.timed_out("disambiguate")
+    trace.note("cache_hit")
+
+    assert trace.stages["retrieve"] >= 0.02
+    assert list(trace.stages) == ["retrieve", "generate"]
+    assert trace.server_timing().startswith("retrieve;dur=")
+    assert ", generate;dur=" in trace.server_timing()
+    assert trace.to_dict()["timeouts"] == ["disambiguate"]
+    assert trace.to_dict()["events"] == ["cache_hit"]
+
+
+def test_stats_report_stage_percentiles_over_requests():
+    stats = PipelineStats(window=100)
+    for ms in range(1, 101):
+        trace = PipelineTrace()
+        trace.stages["generate"] = ms / 1000
+        if ms % 10 == 0:
+            trace.timed_out("re_retrieve")
+        stats.record(trace)
+
+    result = stats.stats()
+    assert result["requests"] == 100
+    generate = result["stages"]["generate"]
+    assert generate["count"] == 100
+    assert generate["p50_ms"] == pytest.approx(50.5)
+    assert generate["p95_ms"] == pytest.approx(95.05)
+    assert generate["max_ms"] == pytest.approx(100)
+    assert result["timeouts"] == {"re_retrieve": 10}
+
+
+def test_word_overlap_ignores_stopwords_and_case():
+    assert word_overlap("Who scored the most goals?", "who scored most goals") == 1.0
+    assert word_overlap("goals of messi", "goals of ronaldo") == pytest.approx(1 / 3)
@@ -0,0 +1,95 @@
+import pytest
+import torch
+from tokenizers import Tokenizer, models, pre_tokenizers
+from transformers import LlamaConfig, LlamaForCausalLM, PreTrainedTokenizerFast
+
+from app.services.prefix_cache import PromptPrefixCache
+
+STATIC_PREFIX = "You are a SQL expert .\nUse the table below .\n"
+SCHEMAS = ["Table : id name age\n", "Table : city country population\n"]
+QUESTIONS = [
+    "Question : how many users are older than 30 ?",
+    "Question : which city has the largest population ?",
+    "Question : list every name",
+]
+
+
+@pytest.fixture(scope="module")
+def tiny_model():
+    # Word-level tokenizer, so a prefix ending on a newline tokenizes the same alone
+    words = " ".join([STATIC_PREFIX, *SCHEMAS, *QUESTIONS]).split()
+    vocab = {"<pad>": 0, "<s>": 1, "<unk>": 2}
+    for word in words:
+        vocab.setdefault(word, len(vocab))
+    backend = Tokenizer(models.WordLevel(vocab, unk_token="<unk>"))
+    backend.pre_tokenizer = pre_tokenizers.WhitespaceSplit()
+    tokenizer = PreTrainedTokenizerFast(
+        tokenizer_object=backend,
+        pad_token="<pad>",
+        bos_token="<s>",
+        unk_token="<unk>",
+        padding_side="left",
+    )
+    torch.manual_seed(0)
+    model = LlamaForCausalLM(
+        LlamaConfig(
+            vocab_size=len(vocab),
+            hidden_size=32,
+            intermediate_size=64,
+            num_hidden_layers=2,
+            num_attention_heads=4,
+            num_key_value_heads=2,
+            max_position_embeddings=128,
+            pad_token_id=0,
+            bos_token_id=1,
+            eos_token_id=2,
+        )
+    ).eval()
+    return model, tokenizer
+
+
+def generate_uncached(model, tokenizer, prompts):
+    inputs = tokenizer(prompts, return_tensors="pt", padding=True)
+    with torch.no_grad():
+        outputs = model.generate(
+            **inputs, max_new_tokens=8, do_sample=False, pad_token_id=0
+        )
+    return outputs[:, inputs["input_ids"].shape[-1] :].tolist()
+
+
+def generate_cached(cache, prompts):
+    inputs = cache.prepare(prompts)
+    with torch.no_grad():
+        outputs = cache.model.generate(
+            **inputs, max_new_tokens=8, do_sample=False, pad_token_id=0
+        )
+    return outputs[:, inputs["input_ids"].shape[-1] :].tolist()
+
+
+@pytest.mark.parametrize(
+    "prompts",
+    [
+        # One prompt, a batch sharing its schema, and a batch with different schemas
+        [(STATIC_PREFIX + SCHEMAS[0], QUESTIONS[0])],
+        [
+            (STATIC_PREFIX + SCHEMAS[0], QUESTIONS[0]),
+            (STATIC_PREFIX + SCHEMAS[0], QUESTIONS[2]),
+        ],
+        [
+            (STATIC_PREFIX + SCHEMAS[0], QUESTIONS[0]),
+            (STATIC_PREFIX + SCHEMAS[1], QUESTIONS[1]),
+        ],
+    ],
+)
+def test_cached_prefix_generation_matches_uncached_generation(tiny_model, prompts):
+    model, tokenizer = tiny_model
+    cache = PromptPrefixCache(model, tokenizer, STATIC_PREFIX)
+
+    expected = generate_uncached(
+        model, tokenizer, [prefix + suffix for prefix, suffix in prompts]
+    )
+    assert generate_cached(cache, prompts) == expected
+    # Served from the cached prefix the second time
+    assert generate_cached(cache, prompts) == expected
+    if len({prefix for prefix, _ in prompts}) == 1:
+        assert cache.stats()["hits"] == 1
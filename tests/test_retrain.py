@@ -0,0 +1,130 @@
+import asyncio
+import json
+from contextlib import asynccontextmanager
+from unittest.mock import patch
+
+import pytest
+
+# The retraining job's dependencies are not part of the API's requirements
+pa = pytest.importorskip("pyarrow")
+pytest.importorskip("asyncpg")
+
+from improve_lm_performance.retrain import (
+    export_new_feedback,
+    feedback_to_example,
+    improve_lm_performance,
+)
+
+
+def feedback_row(id_, question="How many users?", is_correct=True, task="text2sql"):
+    return {
+        "id": id_,
+        "task": task,
+        "input": json.dumps({"question": question, "table_str": "Users(id, name)"}),
+        "prediction": "SELECT COUNT(*) FROM Users",
+        "correct_output": None if is_correct else "SELECT COUNT(id) FROM Users",
+        "is_correct": is_correct,
+    }
+
+
+class FakeCursor:
+    def __init__(self, conn, rows):
+        self.conn = conn
+        self.rows = rows
+
+    async def fetch(self, n):
+        self.conn.fetches += 1
+        batch, self.rows = self.rows[:n], self.rows[n:]
+        return batch
+
+
+class FakeConnection:
+    """Stand-in for the asyncpg connection, applying the bounds of the cursor query."""
+
+    def __init__(self, rows, watermark=None, added_during_export=()):
+        self.rows = list(rows)
+        self.watermark = watermark
+        self.added_during_export = list(added_during_export)
+        self.cursor_args = None
+        self.fetches = 0
+        self.executed = []
+
+    async def execute(self, query, *args):
+        self.executed.append((query, args))
+
+    async def fetchval(self, query, *args):
+        if "retrain_watermark" in query:
+            return self.watermark
+        return max((r["id"] for r in self.rows if r["task"] == args[0]), default=0)
+
+    @asynccontextmanager
+    async def transaction(self, readonly=False):
+        yield
+
+    async def cursor(self, query, task, low, high):
+        self.cursor_args = (task, low, high)
+        self.rows += self.added_during_export
+        rows = [r for r in self.rows if r["task"] == task and low < r["id"] <= high]
+        return FakeCursor(self, sorted(rows, key=lambda r: r["id"]))
+
+    async def close(self):
+        pass
+
+
+def test_feedback_to_example_uses_the_correct_sql():
+    assert feedback_to_example(feedback_row(1)) == {
+        "question": "How many users?",
+        "sql": "SELECT COUNT(*) FROM Users",
+        "table_str": "Users(id, name)",
+    }
+    corrected = feedback_to_example(feedback_row(2, is_correct=False))
+    assert corrected["sql"] == "SELECT COUNT(id) FROM Users"
+
+    missing_correction = dict(feedback_row(3, is_correct=False), correct_output=None)
+    assert feedback_to_example(missing_correction) is None
+    assert feedback_to_example(dict(feedback_row(4), input="not json")) is None
+    assert feedback_to_example(dict(feedback_row(5), input='{"question": "Q"}')) is None
+
+
+def test_export_streams_rows_between_watermark_and_newest_row(tmp_path):
+    rows = [feedback_row(i, f"Question {i}?") for i in range(1, 11)]
+    rows.append(feedback_row(11, task="ai-detector"))
+    conn = FakeConnection(
+        rows,
+        watermark=4,
+        # Feedback arriving during the export is left for the next run
+        added_during_export=[feedback_row(12, "Late question?")],
+    )
+    path = str(tmp_path / "feedback.arrow")
+
+    examples, upper = asyncio.run(export_new_feedback(conn, path, batch_size=4))
+
+    assert conn.cursor_args == ("text2sql", 4, 10)
+    assert (examples, upper) == (6, 10)
+    # Fetches of 4 and 2 rows, and the empty one that ends the export
+    assert conn.fetches == 3
+    with pa.OSFile(path, "rb") as source:
+        table = pa.ipc.open_stream(source).read_all()
+    assert table.column_names == ["question", "sql", "table_str"]
+    assert table.column("question").to_pylist() == [
+        f"Question {i}?" for i in range(5, 11)
+    ]
+
+
+def test_unusable_new_rows_still_advance_the_watermark(tmp_path):
+    rows = [
+        dict(feedback_row(i, is_correct=False), correct_output=None) for i in (1, 2)
+    ]
+    conn = FakeConnection(rows, watermark=0)
+
+    async def connect(dsn):
+        return conn
+
+    with patch("asyncpg.connect", connect):
+        improve_lm_performance("model", "postgresql://db", str(tmp_path))
+
+    assert conn.cursor_args == ("text2sql", 0, 2)
+    query, args = conn.executed[-1]
+    assert "INSERT INTO retrain_watermark" in query
+    # No model was trained on them, so no model version is recorded
+    assert args == ("text2sql", 2, None)
@@ -0,0 +1,52 @@
+import torch
+
+from app.services.stopping import (
+    SQLStatementStoppingCriteria,
+    is_sql_complete,
+    stream_sql,
+    truncate_sql,
+)
+
+
+def test_is_sql_complete():
+    assert not is_sql_complete("")
+    assert not is_sql_complete("\nquery=SELECT name FROM users")
+    assert is_sql_complete("query=SELECT name FROM users;")
+    assert is_sql_complete("query=SELECT name FROM users,\nquery=SELECT")
+    assert is_sql_complete("query=SELECT name FROM users <rule>")
+    # Newlines before the statement do not end it
+    assert not is_sql_complete("\n\nquery=")
+
+
+def test_truncate_sql():
+    assert truncate_sql("\nquery=SELECT a FROM t; SELECT b") == "query=SELECT a FROM t;"
+    assert truncate_sql("query=SELECT a FROM t,\n\n<rule>") == "query=SELECT a FROM t,"
+    assert truncate_sql("query=SELECT a FROM t <rule> Stop") == "query=SELECT a FROM t"
+    assert truncate_sql(" query=SELECT a FROM t ") == "query=SELECT a FROM t"
+
+
+def test_stream_sql_stops_at_statement_end_and_hides_marker():
+    chunks = ["query=", "SELECT a ", "FROM t <", "rule>", " more text"]
+    assert "".join(stream_sql(chunks)) == "query=SELECT a FROM t "
+
+    chunks = ["query=SELECT a", " FROM t;", " SELECT b"]
+    assert list(stream_sql(chunks)) == ["query=SELECT a", " FROM t;"]
+
+
+class FakeTokenizer:
+    def batch_decode(self, ids, skip_special_tokens=True):
+        vocab = {0: "query=SELECT a", 1: " FROM t", 2: ";"}
+        return ["".join(vocab[i] for i in row.tolist()) for row in ids]
+
+
+def test_stopping_criteria_is_evaluated_per_sequence():
+    criteria = SQLStatementStoppingCriteria(FakeTokenizer(), prompt_length=2)
+    input_ids = torch.tensor([[9, 9, 0, 1, 2], [9, 9, 0, 1, 1]])
+    assert criteria(input_ids, None).tolist() == [True, False]
+
+
+def test_stopping_criteria_infers_prompt_length():
+    criteria = SQLStatementStoppingCriteria(FakeTokenizer())
+    assert criteria(torch.tensor([[2, 2, 0]]), None).tolist() == [False]
+    assert criteria.prompt_length == 2
+    assert criteria(torch.tensor([[2, 2, 0, 2]]), None).tolist() == [True]
@@ -0,0 +1,66 @@
+import zlib
+
+import numpy as np
+
+from app.retrieval.table_index import TableSchemaIndex, build_table_index
+
+TABLES = [
+    {
+        "header": ["Player", "Position", "School"],
+        "types": ["text", "text", "text"],
+        "caption": "Draft picks",
+    },
+    {
+        "header": ["Player", "Goals", "Assists"],
+        "types": ["text", "real", "real"],
+        "caption": "Scorers",
+    },
+    {
+        "header": ["Country", "Capital", "Population"],
+        "types": ["text", "text", "real"],
+        "caption": "",
+    },
+    # Duplicate schemas are stored once
+    {
+        "header": ["Player", "Position", "School"],
+        "types": ["text", "text", "text"],
+        "caption": "Draft picks",
+    },
+]
+
+
+def embed(texts):
+    # Bag of words with one deterministic random vector per lowercased word
+    vectors = []
+    for text in texts:
+        vector = np.zeros(64, dtype=np.float32)
+        for word in text.lower().replace("|", " ").replace(":", " ").split():
+            rng = np.random.default_rng(zlib.crc32(word.encode()))
+            vector += rng.normal(size=64)
+        vectors.append(vector)
+    return np.stack(vectors)
+
+
+def test_retrieves_whole_tables_with_types(tmp_path):
+    counts = build_table_index(str(tmp_path), TABLES, embed)
+    assert counts == {"tables": 3, "columns": 8}
+    index = TableSchemaIndex.load(str(tmp_path))
+
+    schema = index.search(embed(["goals scored by player"]), top_k=20)[0]
+    assert schema[:3] == [("Player", "text"), ("Goals", "real"), ("Assists", "real")]
+    # Columns shared with other tables are not repeated
+    assert len(schema) == len({header for header, _ in schema})
+
+
+def test_best_table_is_trimmed_to_its_most_relevant_columns(tmp_path):
+    build_table_index(str(tmp_path), TABLES, embed)
+    index = TableSchemaIndex.load(str(tmp_path))
+
+    schema = index.search(
+        embed(["capital of the country"]),
+        top_k=20,
+        token_budget=6,
+        count_tokens=lambda column: 2,
+    )[0]
+    assert schema == [("Country", "text"), ("Capital", "text")]
+    assert len(index.search(embed(["capital"]), top_k=1)[0]) == 1
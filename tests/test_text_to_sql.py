@@ -1,15 +1,36 @@
+import asyncio
+import time
+from types import SimpleNamespace
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
 import pytest
-from unittest.mock import patch
+import torch
+from unittest.mock import MagicMock, patch
 from app.core.constants import TEXT_TO_SQL_PROMPT_TEMPLATE, IS_TOO_VAGUE_MESSAGE
+from app.core.model_registry import ModelRegistry
+from app.retrieval.lexical_index import LexicalHeaderIndex
+from app.services import text_to_sql
 from app.services.text_to_sql import (
+    _PROMPT_STATIC_PREFIX,
     _build_table_str,
+    _split_prompt,
+    generate_sql_batch,
     get_relevant_headers,
+    get_relevant_headers_batch,
+    get_relevant_schema,
     preprocess_text,
     text2sql,
+    text2sql_batch,
 )
 
 
 class TestTextToSQL:
+    @pytest.fixture(autouse=True)
+    def clear_result_cache(self):
+        if text_to_sql._result_cache is not None:
+            text_to_sql._result_cache.clear()
+        yield
+
     @pytest.fixture
     def mock_collection(self):
         with patch("app.services.text_to_sql.collection") as mock_coll:
@@ -32,13 +53,34 @@ class TestTextToSQL:
                 "disambiguated_text": "Show me all users",
                 "is_too_vague": False,
             }
-            yield mock_disamb
+
+            async def pipeline_disambiguator(**kwargs):
+                # The pipeline calls the LLM from its own event loop
+                return await asyncio.to_thread(mock_disamb, **kwargs)
+
+            with patch(
+                "app.services.text_to_sql.pipeline_get_disambiguated_text",
+                pipeline_disambiguator,
+            ):
+                yield mock_disamb
 
     def test_build_table_str(self):
         headers = ["id", "name", "email"]
         expected = "id (text) | name (text) | email (text)"
         assert _build_table_str(headers) == expected
 
+    def test_build_table_str_with_types(self):
+        assert (
+            _build_table_str(["Player", "Goals"], ["text", "real"])
+            == "Player (text) | Goals (real)"
+        )
+
+    def test_get_relevant_schema_uses_schema_index(self):
+        with patch("app.services.text_to_sql._schema_index") as mock_index:
+            mock_index.search.return_value = [[("Player", "text"), ("Goals", "real")]]
+            result = get_relevant_schema("Goals by player", embedding=np.ones(4))
+        assert result == (["Player", "Goals"], ["text", "real"])
+
     def test_get_relevant_headers_success(self, mock_collection):
         mock_collection.query.return_value = {"documents": [["id", "name", "email"]]}
         result = get_relevant_headers("Show me all users")
@@ -55,6 +97,44 @@ class TestTextToSQL:
         result = get_relevant_headers("Show me all users")
         assert result == []
 
+    def test_get_relevant_headers_batch_embeds_and_queries_once(self, mock_collection):
+        mock_collection.query.return_value = {"documents": [["id"], ["name", "age"]]}
+        with patch("app.services.text_to_sql.get_embedding_function") as mock_embed:
+            mock_embed.return_value.return_value = [[0.1, 0.2], [0.3, 0.4]]
+            result = get_relevant_headers_batch(["Show ids", "Show names"], top_k=2)
+        assert result == [["id"], ["name", "age"]]
+        mock_embed.return_value.assert_called_once_with(["Show ids", "Show names"])
+        mock_collection.query.assert_called_once()
+        assert len(mock_collection.query.call_args.kwargs["query_embeddings"]) == 2
+
+    def test_get_relevant_headers_batch_exception(self, mock_collection):
+        mock_collection.query.side_effect = Exception("DB error")
+        assert get_relevant_headers_batch(["a", "b"]) == [[], []]
+
+    def test_hybrid_retrieval_skips_embedding_for_confident_lexical_matches(
+        self, mock_collection
+    ):
+        index = LexicalHeaderIndex(["Notes", "State", "Goals", "Player"])
+        with patch("app.services.text_to_sql._lexical_index", index), patch(
+            "app.services.text_to_sql.settings.HEADER_RETRIEVAL_MODE", "hybrid"
+        ), patch("app.services.text_to_sql.embed_questions") as mock_embed:
+            result = get_relevant_headers_batch(["Notes for the state Tasmania"])
+        assert result[0][:2] == ["Notes", "State"]
+        mock_embed.assert_not_called()
+        mock_collection.query.assert_not_called()
+
+    def test_hybrid_retrieval_fuses_lexical_and_vector_rankings(self, mock_collection):
+        index = LexicalHeaderIndex(["Notes", "State", "Goals", "Player"])
+        mock_collection.query.return_value = {"documents": [["Player", "Goals"]]}
+        with patch("app.services.text_to_sql._lexical_index", index), patch(
+            "app.services.text_to_sql.settings.HEADER_RETRIEVAL_MODE", "hybrid"
+        ):
+            result = get_relevant_headers_batch(
+                ["who scored the most goal"], embeddings=np.ones((1, 4))
+            )
+        assert result == [["Goals", "Player"]]
+        mock_collection.query.assert_called_once()
+
     def test_preprocess_text_success(self, mock_disambiguator, mock_collection):
         mock_collection.query.return_value = {"documents": [["id", "name", "email"]]}
         result = preprocess_text("Show me all users")
@@ -97,3 +177,343 @@ class TestTextToSQL:
             ]
             result = text2sql("Show me all user names")
             assert result == "query=SELECT name FROM users"
+
+    def test_generate_sql_batch_pads_prompts_into_one_call(self, mock_pipe):
+        with patch("app.services.text_to_sql.load_model"):
+            prompts = ["prompt one", "prompt two"]
+            mock_pipe.return_value = [
+                [{"generated_text": "prompt one query=SELECT a FROM t"}],
+                [{"generated_text": "prompt two query=SELECT b FROM t"}],
+            ]
+            result = generate_sql_batch(prompts)
+            assert result == ["query=SELECT a FROM t", "query=SELECT b FROM t"]
+            mock_pipe.assert_called_once()
+            assert mock_pipe.call_args.kwargs["batch_size"] == 2
+
+    def test_split_prompt_separates_cacheable_prefix_from_question(self):
+        prompt = TEXT_TO_SQL_PROMPT_TEMPLATE.format(
+            table_str="id (text)", question="Show me all users"
+        )
+        prefix, suffix = _split_prompt(prompt)
+        assert prefix + suffix == prompt
+        assert prefix.startswith(_PROMPT_STATIC_PREFIX)
+        assert "id (text)" in prefix
+        assert "Show me all users" in suffix
+        assert prefix.endswith("\n")
+
+    def test_generate_sql_batch_reuses_prefix_cache(self, mock_pipe):
+        prompt = TEXT_TO_SQL_PROMPT_TEMPLATE.format(
+            table_str="id (text)", question="Show me all users"
+        )
+        with patch("app.services.text_to_sql.load_model"), patch(
+            "app.services.text_to_sql._prefix_cache"
+        ) as mock_cache, patch("app.services.text_to_sql._model") as mock_model, patch(
+            "app.services.text_to_sql._tokenizer"
+        ) as mock_tokenizer:
+            mock_cache.prepare.return_value = {
+                "input_ids": torch.ones((1, 5), dtype=torch.long)
+            }
+            mock_model.generate.return_value = torch.ones((1, 8), dtype=torch.long)
+            mock_tokenizer.batch_decode.return_value = [" query=SELECT * FROM users\n"]
+            result = generate_sql_batch([prompt])
+            assert result == ["query=SELECT * FROM users"]
+            mock_cache.prepare.assert_called_once_with([_split_prompt(prompt)])
+            # Only the generated tokens are decoded
+            assert mock_tokenizer.batch_decode.call_args.args[0].shape == (1, 3)
+            mock_pipe.assert_not_called()
+
+    def test_generate_sql_batch_passes_assisted_decoding_arguments(self, mock_pipe):
+        prompts = ["prompt one", "prompt two"]
+        with patch("app.services.text_to_sql.load_model"), patch(
+            "app.services.text_to_sql._prefix_cache", None
+        ), patch("app.services.text_to_sql._model") as mock_model, patch(
+            "app.services.text_to_sql._tokenizer"
+        ) as mock_tokenizer, patch(
+            "app.services.text_to_sql.settings.TEXT2SQL_ASSISTED_DECODING",
+            "prompt_lookup",
+        ):
+            mock_tokenizer.return_value.to.return_value = {
+                "input_ids": torch.ones((1, 5), dtype=torch.long)
+            }
+            mock_model.generate.return_value = torch.ones((1, 7), dtype=torch.long)
+            mock_tokenizer.batch_decode.return_value = ["query=SELECT 1;"]
+            assert generate_sql_batch(prompts[:1]) == ["query=SELECT 1;"]
+            kwargs = mock_model.generate.call_args.kwargs
+            assert kwargs["prompt_lookup_num_tokens"] == 10
+            mock_pipe.assert_not_called()
+
+            # Assisted generation only supports a batch size of 1, so a batch is
+            # decoded together without it
+            mock_pipe.return_value = [
+                [{"generated_text": f"{prompt}query=SELECT 1;"}] for prompt in prompts
+            ]
+            assert generate_sql_batch(prompts) == ["query=SELECT 1;"] * 2
+            assert mock_model.generate.call_count == 1
+            mock_pipe.assert_called_once()
+            assert mock_pipe.call_args.kwargs["batch_size"] == 2
+
+    def test_onnx_backend_generates_without_the_transformers_pipeline(self):
+        ort_model = MagicMock()
+        ort_model.generate.return_value = torch.ones((2, 7), dtype=torch.long)
+        tokenizer = MagicMock(pad_token="<pad>")
+        tokenizer.return_value.to.return_value = {
+            "input_ids": torch.ones((2, 5), dtype=torch.long)
+        }
+        tokenizer.batch_decode.return_value = ["query=SELECT 1;", "query=SELECT 2;"]
+        with patch(
+            "app.services.text_to_sql.AutoTokenizer.from_pretrained",
+            return_value=tokenizer,
+        ), patch(
+            "app.services.text_to_sql.load_causal_lm", return_value=ort_model
+        ), patch(
+            "app.services.text_to_sql.pipeline"
+        ) as mock_pipeline, patch(
+            "app.services.text_to_sql.settings.TEXT2SQL_BACKEND", "onnx"
+        ):
+            loaded = text_to_sql._load_text2sql()
+        mock_pipeline.assert_not_called()
+        assert loaded["pipe"] is None and loaded["prefix_cache"] is None
+
+        with patch("app.services.text_to_sql.load_model"), patch.object(
+            text_to_sql, "_pipe", None
+        ), patch.object(text_to_sql, "_prefix_cache", None), patch.object(
+            text_to_sql, "_model", ort_model
+        ), patch.object(
+            text_to_sql, "_tokenizer", tokenizer
+        ):
+            results = generate_sql_batch(["prompt one", "prompt two"])
+        assert results == ["query=SELECT 1;", "query=SELECT 2;"]
+        ort_model.generate.assert_called_once()
+
+    def test_text2sql_serves_repeated_questions_from_cache(
+        self, mock_pipe, mock_collection
+    ):
+        with patch("app.services.text_to_sql.load_model"):
+            mock_collection.query.return_value = {"documents": [["id", "name"]]}
+            prompt = TEXT_TO_SQL_PROMPT_TEMPLATE.format(
+                table_str="id (text) | name (text)", question="Show me all user names"
+            )
+            mock_pipe.return_value = [
+                {"generated_text": f"{prompt}query=SELECT name FROM users"}
+            ]
+            assert text2sql("Show me all user names") == "query=SELECT name FROM users"
+            assert (
+                text2sql("Show me  all user names?") == "query=SELECT name FROM users"
+            )
+            mock_pipe.assert_called_once()
+            assert text_to_sql.get_cache_stats()["exact"]["memory"]["hits"] == 1
+
+    def test_text2sql_batch_retrieves_once_and_generates_together(
+        self, mock_pipe, mock_collection
+    ):
+        questions = ["Show me all user ids", "Show me all user names"]
+        mock_collection.query.return_value = {"documents": [["id"], ["name"]]}
+        prompts = [
+            TEXT_TO_SQL_PROMPT_TEMPLATE.format(table_str=table_str, question=question)
+            for table_str, question in zip(["id (text)", "name (text)"], questions)
+        ]
+        mock_pipe.return_value = [
+            [{"generated_text": f"{prompts[0]}query=SELECT id FROM users"}],
+            [{"generated_text": f"{prompts[1]}query=SELECT name FROM users"}],
+        ]
+        with patch("app.services.text_to_sql.load_model"), patch(
+            "app.services.text_to_sql._prefix_cache", None
+        ):
+            result = text2sql_batch(questions)
+        assert result == ["query=SELECT id FROM users", "query=SELECT name FROM users"]
+        mock_collection.query.assert_called_once()
+        mock_pipe.assert_called_once()
+        assert mock_pipe.call_args.args[0] == prompts
+
+    def test_gated_preprocessing_skips_llm_for_clear_questions(
+        self, mock_pipe, mock_collection, mock_disambiguator
+    ):
+        mock_collection.query.return_value = {"documents": [["id", "name"]]}
+        with patch("app.services.text_to_sql.load_model"), patch(
+            "app.services.text_to_sql.settings.TEXT2SQL_PREPROCESS", "gated"
+        ):
+            text2sql("Show me all user names")
+        mock_disambiguator.assert_not_called()
+        mock_collection.query.assert_called_once()
+
+    def test_gated_preprocessing_disambiguates_ambiguous_questions(
+        self, mock_pipe, mock_collection, mock_disambiguator
+    ):
+        mock_collection.query.return_value = {"documents": [["id", "name"]]}
+        prompt = TEXT_TO_SQL_PROMPT_TEMPLATE.format(
+            table_str="id (text) | name (text)", question="Show me all users"
+        )
+        mock_pipe.return_value = [
+            {"generated_text": f"{prompt}query=SELECT * FROM users"}
+        ]
+        with patch("app.services.text_to_sql.load_model"), patch(
+            "app.services.text_to_sql.settings.TEXT2SQL_PREPROCESS", "gated"
+        ):
+            assert text2sql("everyone in there") == "query=SELECT * FROM users"
+            mock_disambiguator.return_value = {
+                "disambiguated_text": "",
+                "is_too_vague": True,
+            }
+            assert text2sql("stuff") == IS_TOO_VAGUE_MESSAGE
+        assert mock_disambiguator.call_count == 2
+        # The rewritten question is retrieved again
+        assert mock_collection.query.call_count == 3
+        stats = text_to_sql.get_preprocess_stats()
+        assert stats["outcomes"]["rewritten"] >= 1
+        assert stats["outcomes"]["too_vague"] >= 1
+
+    def test_pipeline_reuses_retrieval_for_slightly_rewritten_questions(
+        self, mock_pipe, mock_collection, mock_disambiguator
+    ):
+        mock_collection.query.return_value = {"documents": [["id", "name"]]}
+        mock_disambiguator.return_value = {
+            "disambiguated_text": "Show the names of the users",
+            "is_too_vague": False,
+        }
+        trace = text_to_sql.PipelineTrace()
+        with patch("app.services.text_to_sql.load_model"), patch(
+            "app.services.text_to_sql.settings.TEXT2SQL_PREPROCESS", "always"
+        ):
+            text2sql("Show names of the users", trace=trace)
+        mock_collection.query.assert_called_once()
+        assert "retrieval_reused" in trace.events
+        assert "Show the names of the users" in mock_pipe.call_args.args[0]
+        assert set(trace.stages) == {"retrieve", "disambiguate", "load", "generate"}
+
+    def test_pipeline_uses_question_as_is_when_disambiguation_misses_deadline(
+        self, mock_pipe, mock_collection, mock_disambiguator
+    ):
+        mock_collection.query.return_value = {"documents": [["id", "name"]]}
+        mock_disambiguator.side_effect = lambda **kwargs: time.sleep(0.5)
+        trace = text_to_sql.PipelineTrace()
+        with patch("app.services.text_to_sql.load_model"), patch(
+            "app.services.text_to_sql.settings.TEXT2SQL_PREPROCESS", "always"
+        ), patch(
+            "app.services.text_to_sql.settings.TEXT2SQL_DISAMBIGUATE_DEADLINE_SECONDS",
+            0.05,
+        ):
+            text2sql("everyone in there", trace=trace)
+        assert trace.timeouts == ["disambiguate"]
+        assert trace.stages["disambiguate"] < 0.4
+        assert "everyone in there" in mock_pipe.call_args.args[0]
+
+    def test_slow_llm_calls_do_not_hold_up_loaded_models(
+        self, mock_pipe, mock_collection, mock_disambiguator
+    ):
+        mock_collection.query.return_value = {"documents": [["id", "name"]]}
+        mock_disambiguator.side_effect = lambda **kwargs: time.sleep(0.5)
+        traces = [text_to_sql.PipelineTrace() for _ in range(2)]
+        with patch("app.services.text_to_sql.load_model"), patch(
+            "app.services.text_to_sql._stage_executor", ThreadPoolExecutor(1)
+        ), patch.object(text_to_sql, "_tokenizer", object()), patch.object(
+            text_to_sql, "_model", object()
+        ), patch(
+            "app.services.text_to_sql.settings.TEXT2SQL_PREPROCESS", "always"
+        ), patch(
+            "app.services.text_to_sql.settings.TEXT2SQL_DISAMBIGUATE_DEADLINE_SECONDS",
+            0.05,
+        ):
+            for i, trace in enumerate(traces):
+                text2sql(f"everyone in there {i}", trace=trace)
+        # The models were loaded, so loading did not wait for a worker of the pool, and
+        # the timed out LLM call of the first request left no worker busy either
+        assert traces[1].timeouts == ["disambiguate"]
+        assert traces[1].stages["load"] < 0.1
+
+    def test_text2sql_fails_when_the_model_misses_the_load_deadline(
+        self, mock_collection
+    ):
+        mock_collection.query.return_value = {"documents": [["id", "name"]]}
+        trace = text_to_sql.PipelineTrace()
+        with patch(
+            "app.services.text_to_sql.load_model",
+            side_effect=lambda: time.sleep(0.5),
+        ), patch.object(text_to_sql, "_pipe", None), patch(
+            "app.services.text_to_sql.settings.TEXT2SQL_LOAD_DEADLINE_SECONDS", 0.05
+        ):
+            with pytest.raises(TimeoutError):
+                text2sql("Show me all user names", trace=trace)
+        assert trace.timeouts == ["load"]
+        assert trace.stages["load"] < 0.4
+
+    def test_local_model_version_follows_the_weights_on_disk(self, tmp_path):
+        (tmp_path / "model.safetensors").write_bytes(b"weights")
+        model = SimpleNamespace(config=SimpleNamespace(_commit_hash=None))
+        with patch.object(text_to_sql, "MODEL_PATH", str(tmp_path)):
+            version = text_to_sql._model_version(model)
+            (tmp_path / "model.safetensors").write_bytes(b"new weights")
+            assert text_to_sql._model_version(model) != version
+        assert version.startswith(f"{tmp_path}@local-")
+
+        model.config._commit_hash = "abc123"
+        with patch.object(text_to_sql, "MODEL_PATH", "org/model"):
+            assert text_to_sql._model_version(model) == "org/model@abc123"
+
+    def test_load_model_is_not_unloaded_before_the_globals_are_set(self):
+        registry = ModelRegistry()
+        components = {
+            "tokenizer": object(),
+            "model": SimpleNamespace(config=SimpleNamespace(_commit_hash="abc")),
+            "pipe": object(),
+            "draft_model": None,
+            "prefix_cache": None,
+        }
+        registry.register(
+            "text2sql", lambda: components, on_unload=text_to_sql._unload_text2sql
+        )
+        get = registry.get
+
+        def get_then_evict(name):
+            value = get(name)
+            # The idle sweeper or the memory budget unloading the model right away
+            registry.unload(name)
+            return value
+
+        with patch.object(text_to_sql, "model_registry", registry), patch.object(
+            registry, "get", get_then_evict
+        ), patch.multiple(
+            text_to_sql,
+            _tokenizer=None,
+            _model=None,
+            _pipe=None,
+            _prefix_cache=None,
+            _draft_model=None,
+            _result_cache=None,
+        ):
+            text_to_sql.load_model()
+            # Either both hold the model, or neither does
+            assert text_to_sql._model is components["model"]
+            assert registry.stats()["models"]["text2sql"]["loaded"]
+
+    def test_disambiguation_starts_next_to_retrieval_with_a_lexical_index(
+        self, mock_pipe, mock_collection, mock_disambiguator
+    ):
+        def slow_query(**kwargs):
+            time.sleep(0.3)
+            return {"documents": [["Player", "Goals"]]}
+
+        def slow_disambiguation(**kwargs):
+            time.sleep(0.3)
+            return {
+                "disambiguated_text": "Which player scored goals",
+                "is_too_vague": False,
+            }
+
+        mock_collection.query.side_effect = slow_query
+        mock_disambiguator.side_effect = slow_disambiguation
+        index = LexicalHeaderIndex(["Notes", "State", "Goals", "Player"])
+        trace = text_to_sql.PipelineTrace()
+        start = time.perf_counter()
+        with patch("app.services.text_to_sql.load_model"), patch(
+            "app.services.text_to_sql._lexical_index", index
+        ), patch("app.services.text_to_sql.settings.TEXT2SQL_PREPROCESS", "always"):
+            text2sql("Which player scored the goals", trace=trace)
+        elapsed = time.perf_counter() - start
+
+        # The LLM ran on the lexical headers while the vector retrieval ran
+        assert "Goals" in mock_disambiguator.call_args.kwargs["relevant_headers"]
+        assert elapsed < 0.5
+        assert "disambiguate_early" in trace.events
+        # The rewrite barely differs, so the vector retrieval is kept
+        assert "retrieval_reused" in trace.events
+        mock_collection.query.assert_called_once()